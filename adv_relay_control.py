@@ -1,7 +1,8 @@
 import pigpio
 import time
 import threading
-from shared_memory_util import create_shared_memory, read_data_from_shared_memory, write_data_to_shared_memory
+from shared_memory_schema import DURABLE_NAMES, FIELD_NAMES
+from shared_memory_util import REGISTER_FILE_NAME, ack_relay_command, checkpoint_durable_state, clear_relay_queue, initialize_registers, open_register_file, pop_relay_command, read_change_counts, restore_durable_state, wait_for_any_change, write_data_to_shared_memory
 
 class RelayController(threading.Thread):
     def __init__(self):
@@ -97,7 +98,6 @@ class RelayController(threading.Thread):
         self.pi.write(self.pins['door'], pigpio.HIGH)
         time.sleep(0.12)
         self.pi.write(self.pins['door'], pigpio.LOW)
-        write_data_to_shared_memory("relay_command", 13.0)
 
     def doorLCommand(self):
         self.pi.write(self.pins['door'], pigpio.LOW)
@@ -115,16 +115,22 @@ class RelayController(threading.Thread):
     def run(self):
         """Main thread loop."""
         while not self._stop_event.is_set():
-            command_value = read_data_from_shared_memory("relay_command")
+            # Drain queued commands in order; the timeout keeps stop() responsive
+            entry = pop_relay_command(timeout=1.0)
+            if entry is None:
+                continue
+            sequence, command_value = entry
             command = self.command_map.get(command_value)
-            
+
+            # relay_command shows the last executed command
+            write_data_to_shared_memory("relay_command", command_value)
             if command:
                 print(f"Executing command: {command.__name__}")
                 command()
             else:
                 print(f"Unknown command value received: {command_value}")
-            
-            time.sleep(1)
+
+            ack_relay_command(sequence)
 
 class SharedMemoryManager(threading.Thread):
     def __init__(self):
@@ -132,35 +138,29 @@ class SharedMemoryManager(threading.Thread):
         self.daemon = True
         self._stop_event = threading.Event()
         
-        self.shared_memory_names = [
-            "relay_command",
-            "taccosensor",
-            "doorssensor",
-            "Pressure",
-            "Water_Level",
-            "Door_Status",
-            "triac_delay",
-            "command_from_server",
-            "command_mode_from_server",
-        ]
+        # The register file layout and defaults come from shared_memory_schema
+        self.shared_memory_names = FIELD_NAMES
 
     def initialize_shared_memory(self):
         """Initialize all shared memory segments."""
-        for name in self.shared_memory_names:
-            try:
-                create_shared_memory(name, 4)
-                print(f"Shared memory '{name}' initialized.")
-            except Exception as e:
-                print(f"Failed to initialize shared memory '{name}': {e}")
-        write_data_to_shared_memory("relay_command", 14.0)
-        write_data_to_shared_memory("taccosensor", 0.0)
-        write_data_to_shared_memory("doorssensor", 0.0)
-        write_data_to_shared_memory("Pressure", 0.0)
-        write_data_to_shared_memory("Water_Level", 0.0)
-        write_data_to_shared_memory("Door_Status", 0.0)
-        write_data_to_shared_memory("triac_delay", 8000.0)
-        write_data_to_shared_memory("command_from_server", 1000.0)
-        write_data_to_shared_memory("command_mode_from_server", 1000.0)
+        try:
+            # All names live in the register file, so one mapping covers them.
+            # A file left by another schema version is replaced.
+            open_register_file(replace_incompatible=True)
+            initialize_registers()
+            # Commands queued before the restart belong to a cycle that is gone
+            clear_relay_queue()
+            print(f"Shared memory '{REGISTER_FILE_NAME}' initialized for {len(self.shared_memory_names)} values.")
+        except Exception as e:
+            print(f"Failed to initialize shared memory '{REGISTER_FILE_NAME}': {e}")
+            return
+        try:
+            # Resume the cycle that was running before a restart or power loss
+            restored = restore_durable_state()
+            if restored is not None:
+                print(f"Restored durable state: {restored}")
+        except Exception as e:
+            print(f"Failed to restore durable state: {e}")
 
 
     def stop(self):
@@ -170,9 +170,19 @@ class SharedMemoryManager(threading.Thread):
     def run(self):
         """Main thread loop."""
         self.initialize_shared_memory()
+        counts = read_change_counts(DURABLE_NAMES)
         while not self._stop_event.is_set():
-            # Add any periodic shared memory operations here
-            time.sleep(1)
+            # Checkpoint the durable fields soon after they change;
+            # checkpoint_durable_state() limits how often it msyncs
+            _, counts = wait_for_any_change(DURABLE_NAMES, timeout=1.0, since=counts)
+            try:
+                checkpoint_durable_state()
+            except Exception as e:
+                print(f"Failed to checkpoint durable state: {e}")
+        try:
+            checkpoint_durable_state(force=True)
+        except Exception as e:
+            print(f"Failed to checkpoint durable state: {e}")
 
 def main():
     try:
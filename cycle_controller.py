@@ -1,10 +1,18 @@
 import pigpio
 import time
 import threading
-from shared_memory_util import create_shared_memory, read_data_from_shared_memory, write_data_to_shared_memory
+from shared_memory_util import ack_relay_command, pop_relay_command, push_relay_command, read_change_count, read_change_counts, read_data_from_shared_memory, read_snapshot, request_soft_reset, wait_for_any_change, wait_for_change, wait_for_door, wait_for_relay_ack, write_data_to_shared_memory, write_many
+from adv_relay_control import SharedMemoryManager
+from http_client import CONNECT_TIMEOUT, get_client
+from level_calibration import load_level_table
+from poll_scheduler import PollScheduler
+from progress_reporter import ProgressReporter
+from sensor_reader import SensorReader
+from speed_control import SpeedController
+from tacho_reader import TachoSensorThread
+from triac_control import TriacController
 import requests
 import json
-import RPi.GPIO as GPIO
 from datetime import datetime
 import threading
 
@@ -105,7 +113,6 @@ class RelayController(threading.Thread):
         self.pi.write(self.pins['door'], pigpio.HIGH)
         time.sleep(0.2)
         self.pi.write(self.pins['door'], pigpio.LOW)
-        write_data_to_shared_memory("relay_command", 13.0)
 
     def doorLCommand(self):
         self.pi.write(self.pins['door'], pigpio.LOW)
@@ -123,68 +130,25 @@ class RelayController(threading.Thread):
     def run(self):
         """Main thread loop."""
         while not self._stop_event.is_set():
-            command_value = read_data_from_shared_memory("relay_command")
+            # Drain queued commands in order; the timeout keeps stop() responsive
+            entry = pop_relay_command(timeout=1.0)
+            if entry is None:
+                continue
+            sequence, command_value = entry
             command = self.command_map.get(command_value)
-            
+
+            # relay_command shows the last executed command
+            write_data_to_shared_memory("relay_command", command_value)
             if command:
                 print(f"Executing command: {command.__name__}")
                 command()
             else:
                 print(f"Unknown command value received: {command_value}")
-            
-            time.sleep(1)
-
-class SharedMemoryManager(threading.Thread):
-    def __init__(self):
-        super().__init__()
-        self.daemon = True
-        self._stop_event = threading.Event()
-        
-        self.shared_memory_names = [
-            "relay_command",
-            "taccosensor",
-            "doorssensor",
-            "Pressure",
-            "Water_Level",
-            "Door_Status",
-            "triac_delay",
-            "command_from_server",
-            "command_mode_from_server",
-        ]
-
-    def initialize_shared_memory(self):
-        """Initialize all shared memory segments."""
-        for name in self.shared_memory_names:
-            try:
-                create_shared_memory(name, 4)
-                print(f"Shared memory '{name}' initialized.")
-            except Exception as e:
-                print(f"Failed to initialize shared memory '{name}': {e}")
-        write_data_to_shared_memory("relay_command", 14.0)
-        write_data_to_shared_memory("taccosensor", 0.0)
-        write_data_to_shared_memory("doorssensor", 0.0)
-        write_data_to_shared_memory("Pressure", 0.0)
-        write_data_to_shared_memory("Water_Level", 0.0)
-        write_data_to_shared_memory("Door_Status", 0.0)
-        write_data_to_shared_memory("triac_delay", 8000.0)
-        write_data_to_shared_memory("command_from_server", 1000.0)
-        write_data_to_shared_memory("command_mode_from_server", 0.0)
-
-
-    def stop(self):
-        """Stop the thread."""
-        self._stop_event.set()
-
-    def run(self):
-        """Main thread loop."""
-        self.initialize_shared_memory()
-        while not self._stop_event.is_set():
-            # Add any periodic shared memory operations here
-            time.sleep(1)
-
-
 
+            ack_relay_command(sequence)
 
+class CycleAborted(Exception):
+    """Raised inside a cycle step when a soft reset is requested"""
 
 class WashingMachineController(threading.Thread):
     def __init__(self):
@@ -199,190 +163,266 @@ class WashingMachineController(threading.Thread):
         self.water_level = None
         self.command = 1000.0
         self.command_mode = 0.0
+        self.snapshot_names = (
+            "Door_Status",
+            "triac_delay",
+            "taccosensor_filtered",  # Filtered so noise does not cause extra control steps
+            "Pressure_filtered",
+            "Water_Litres",
+            "command_from_server",
+            "command_mode_from_server",
+        )
+        # soft_reset wakes the idle cycle too
+        self.command_names = ("command_from_server", "command_mode_from_server", "soft_reset")
+        self.soft_reset_seen = 0
+        self.door_latched = False  # Set once this process has latched the door for a cycle
+        self.relay_ack_timeout = 2.0  # seconds to wait for RelayController to execute a command
+
+        # Litres to fill to once the level sensor is calibrated; without them
+        # fills stop at the pressure threshold
+        level_table = load_level_table()
+        self.fill_litres = level_table.fills.get("normal") if level_table else None
+        self.water_litres = -1.0
+        self.max_fill_time = 300.0  # seconds before the inlets close short of the fill level
         
         # API configuration
         self.hub_id = "17348502838715973"
         self.device_id = 1000
         self.api_base_url = "http://srv630050.hstgr.cloud:3000/api/users"
+        self.reporter = ProgressReporter(self.api_base_url)  # Delivers update_ready and update_progress
 
     def update_ready(self):
-        url = f"{self.api_base_url}/updateReady"
+        """Queue the ready report; ProgressReporter delivers it in the background"""
+        path = "/updateReady"
         data = {
             "hubid": self.hub_id,
             "deviceid": self.device_id
         }
-        try:
-            requests.post(url, json=data)
-        except Exception:
-            pass
+        self.reporter.send("ready", path, data)
 
     def update_progress(self, progress):
-        url = f"{self.api_base_url}/updateProgress"
+        """Queue a progress report; ProgressReporter delivers it in the background"""
+        path = "/updateProgress"
         data = {
             "hubid": self.hub_id,
             "deviceid": self.device_id,
             "progress": progress
         }
+        self.reporter.send("progress", path, data)
+
+    def send_relay_command(self, command):
+        """Queue a relay command and wait until RelayController has executed it."""
         try:
-            requests.post(url, json=data)
-        except Exception:
-            pass
+            sequence = push_relay_command(command, timeout=self.relay_ack_timeout)
+        except RuntimeError as e:
+            # The queue stays full while RelayController is down
+            print(f"Relay command {command} not queued: {e}")
+            return
+        if not wait_for_relay_ack(sequence, self.relay_ack_timeout):
+            print(f"Relay command {command} not acknowledged within {self.relay_ack_timeout}s")
 
     def close_door(self):
-        write_data_to_shared_memory("relay_command", 12.0)
-        time.sleep(10)
-        write_data_to_shared_memory("relay_command", 12.0)
-        time.sleep(4)
+        """Pulse the door lock and move on once the latch is confirmed, retrying once"""
+        pulsed = time.monotonic()
+        self.send_relay_command(12.0)
+        self.door_latched = True
+        if wait_for_door(True, 10, since=pulsed):
+            return
+        pulsed = time.monotonic()
+        self.send_relay_command(12.0)
+        if not wait_for_door(True, 4, since=pulsed):
+            print("Door latch not confirmed")
+
+    def latch_door_for_resume(self):
+        """
+        Latch the door before resuming a cycle restored from the state file;
+        the lock was released with the relays when the machine went down.
+        """
+        self.door_latched = True
+        if wait_for_door(True, 1):
+            return  # Still latched; another pulse would release it
+        print(f"Resuming cycle at step {self.command}, closing the door")
+        self.close_door()
 
     def open_door(self):
-        write_data_to_shared_memory("relay_command", 12.0)
-        time.sleep(4)
+        """Pulse the door lock and wait for the latch to release"""
+        pulsed = time.monotonic()
+        self.send_relay_command(12.0)
+        self.door_latched = False
+        if not wait_for_door(False, 4, since=pulsed):
+            print("Door release not confirmed")
 
     def drain_water(self, time_of_job):
-        write_data_to_shared_memory("relay_command", 10.0)
-        time.sleep(time_of_job)
-        write_data_to_shared_memory("relay_command", 11.0)
-        time.sleep(1)
+        self.send_relay_command(10.0)
+        self.pause(time_of_job)
+        self.send_relay_command(11.0)
 
     def load_water(self, time_of_job):
-        write_data_to_shared_memory("relay_command", 6.0)
-        time.sleep(1)
-        write_data_to_shared_memory("relay_command", 8.0)
-        time.sleep(time_of_job)
-        write_data_to_shared_memory("relay_command", 7.0)
-        time.sleep(1)
-        write_data_to_shared_memory("relay_command", 9.0)
-        time.sleep(1)
+        self.send_relay_command(6.0)
+        self.send_relay_command(8.0)
+        self.pause(time_of_job)
+        self.send_relay_command(7.0)
+        self.send_relay_command(9.0)
 
     def check_and_load_water(self, target_level):
-        write_data_to_shared_memory("relay_command", 6.0)
-        time.sleep(1)
-        write_data_to_shared_memory("relay_command", 8.0)
-        while self.water_level > target_level:
-            time.sleep(0.2)
-        write_data_to_shared_memory("relay_command", 7.0)
-        time.sleep(1)
-        write_data_to_shared_memory("relay_command", 9.0)
-        time.sleep(1)
+        """
+        Fill to fill_litres if set and SensorReader publishes litres, otherwise
+        until the pressure frequency drops to target_level. The inlets close
+        after max_fill_time either way, so a stuck sensor cannot flood the drum.
+        """
+        self.send_relay_command(6.0)
+        self.send_relay_command(8.0)
+        deadline = time.monotonic() + self.max_fill_time
+        # Water_Litres stays negative unless SensorReader has a level table
+        use_litres = self.fill_litres and self.water_litres >= 0
+        while not self.water_filled(target_level, use_litres):
+            if time.monotonic() >= deadline:
+                print(f"Fill stopped after {self.max_fill_time}s short of its level")
+                break
+            self.pause(0.2)
+        self.send_relay_command(7.0)
+        self.send_relay_command(9.0)
+
+    def water_filled(self, target_level, use_litres):
+        """Return True once the drum holds fill_litres, or the pressure frequency reached target_level"""
+        if use_litres:
+            return self.water_litres >= self.fill_litres
+        return self.water_level <= target_level
+
+    def pause(self, seconds):
+        """Sleep during a cycle step; raises CycleAborted as soon as a soft reset is requested"""
+        deadline = time.monotonic() + seconds
+        count = read_change_count("soft_reset")
+        while read_data_from_shared_memory("soft_reset") == self.soft_reset_seen:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            count = wait_for_change("soft_reset", remaining, count)
+        raise CycleAborted()
+
+    def complete_step(self, progress, command):
+        """Report a finished step and move on to the next, unless a soft reset is pending"""
+        self.pause(0)  # Raises CycleAborted, so the step cannot overwrite the reset's idle command
+        self.update_progress(progress)
+        write_data_to_shared_memory("command_from_server", command)
+
+    def return_to_idle(self):
+        """Soft reset: stop the drum and switch every relay off, then report back"""
+        request = read_data_from_shared_memory("soft_reset")
+        self.set_target_rpm(0)
+        self.send_relay_command(14.0)  # All relays off
+        self.send_rpm(7000)
+        # Idle before acknowledging, so the cycle does not resume the aborted step
+        write_many({"command_from_server": 1000.0, "command_mode_from_server": 1000})
+        self.soft_reset_seen = request
+        write_data_to_shared_memory("soft_reset_done", request)
+        print("Cycle reset to idle")
 
     def send_rpm(self, rpm_input):
         write_data_to_shared_memory("triac_delay", float(rpm_input))
 
-    def rpm_leveler(self, required_rpm):
-        req_rpm_input = self.triac_delay
-        while True:
-            if (required_rpm - self.taccosensor) >= 10:
-                req_rpm_input -= 30
-            elif (required_rpm - self.taccosensor) <= -10:
-                req_rpm_input += 30
-            else:
-                break
-            self.send_rpm(req_rpm_input)
-            time.sleep(1)
+    def set_target_rpm(self, rpm):
+        """Hand the drum speed to SpeedController; 0 returns triac_delay to the cycle"""
+        write_data_to_shared_memory("target_rpm", float(rpm))
 
     def stop_spin(self):
-        write_data_to_shared_memory("relay_command", 5.0)
-        time.sleep(5)
+        self.set_target_rpm(0)
+        self.send_relay_command(5.0)
+        self.pause(5)
         self.send_rpm(8000)
 
     def set_cl_direction(self):
-        write_data_to_shared_memory("relay_command", 1.0)
-        time.sleep(1)
+        self.send_relay_command(1.0)
 
     def set_al_direction(self):
-        write_data_to_shared_memory("relay_command", 3.0)
-        time.sleep(1)
+        self.send_relay_command(3.0)
 
     def drum_rotation_pattern_one(self):
         start_time = time.time()
         while (time.time() - start_time < 300):
             self.set_cl_direction()
-            self.rpm_leveler(30)
-            time.sleep(15)
+            self.set_target_rpm(30)
+            self.pause(15)
             self.stop_spin()
 
             self.set_al_direction()
-            self.rpm_leveler(30)
-            time.sleep(15)
+            self.set_target_rpm(30)
+            self.pause(15)
             self.stop_spin()
 
     def drum_rotation_pattern_two(self):
         start_time = time.time()
         while (time.time() - start_time < 300):
             self.set_cl_direction()
-            self.rpm_leveler(40)
-            time.sleep(15)
+            self.set_target_rpm(40)
+            self.pause(15)
             self.stop_spin()
 
             self.set_al_direction()
-            self.rpm_leveler(40)
-            time.sleep(15)
+            self.set_target_rpm(40)
+            self.pause(15)
             self.stop_spin()
 
     def cycle_end(self):
-        write_data_to_shared_memory("relay_command", 14.0)
+        self.send_relay_command(14.0)
 
     def run_washing_cycle(self):
+        command_counts = read_change_counts(self.command_names)
+        # Only soft resets requested from now on concern this cycle
+        self.soft_reset_seen = read_data_from_shared_memory("soft_reset")
         while not self._stop_event.is_set():
             try:
+                self.pause(0)  # A soft reset requested while idle
+                if 0.0 < self.command < 1000.0 and not self.door_latched:
+                    self.latch_door_for_resume()
                 # quick wash
                 if self.command_mode ==0.0:
                     print("quick wash\n")
                     if self.command <= 0.0:
-                        time.sleep(10)
+                        self.pause(10)
                         self.close_door()
-                        self.update_progress("05")
-                        write_data_to_shared_memory("command_from_server", 5.0)
+                        self.complete_step("05", 5.0)
 
                     elif self.command <= 5.0:
                         self.drain_water(10)
-                        self.update_progress("10")
-                        write_data_to_shared_memory("command_from_server", 10.0)
+                        self.complete_step("10", 10.0)
 
                     elif self.command <= 10.0:
                         self.check_and_load_water(13)
-                        self.update_progress("15")
-                        write_data_to_shared_memory("command_from_server", 15.0)
+                        self.complete_step("15", 15.0)
 
                     elif self.command <= 15.0:
                         self.send_rpm(8000)
                         self.drum_rotation_pattern_one()
-                        self.update_progress("20")
-                        write_data_to_shared_memory("command_from_server", 20.0)
+                        self.complete_step("20", 20.0)
 
                     elif self.command <= 20.0:
                         self.check_and_load_water(13)
                         self.drain_water(45)
-                        self.update_progress("39")
-                        write_data_to_shared_memory("command_from_server", 39.0)
+                        self.complete_step("39", 39.0)
 
                     elif self.command <= 39.0:
                         self.check_and_load_water(13)
-                        self.update_progress("68")
-                        write_data_to_shared_memory("command_from_server", 68.0)
+                        self.complete_step("68", 68.0)
 
                     elif self.command <= 68.0:
                         self.send_rpm(8000)
                         self.drum_rotation_pattern_two()
-                        self.update_progress("80")
-                        write_data_to_shared_memory("command_from_server", 80.0)
+                        self.complete_step("80", 80.0)
 
                     elif self.command <= 80.0:
                         self.check_and_load_water(13)
-                        self.update_progress("90")
-                        write_data_to_shared_memory("command_from_server", 90.0)
+                        self.complete_step("90", 90.0)
 
                     elif self.command <= 90.0:
                         self.drain_water(45)
-                        self.update_progress("99")
-                        write_data_to_shared_memory("command_from_server", 99.0)
+                        self.complete_step("99", 99.0)
 
                     elif self.command <= 99.0:
                         self.open_door()
                         self.update_ready()
                         write_data_to_shared_memory("command_from_server", 1000.0)
                         self.cycle_end()
-                    time.sleep(1)
 
 
 
@@ -390,88 +430,110 @@ class WashingMachineController(threading.Thread):
                 elif self.command_mode ==1.0:
                     print("heavy wash\n")
                     if self.command <= 0.0:
-                        time.sleep(10)
+                        self.pause(10)
                         self.close_door()
-                        self.update_progress("05")
-                        write_data_to_shared_memory("command_from_server", 5.0)
+                        self.complete_step("05", 5.0)
 
                     elif self.command <= 5.0:
                         self.drain_water(10)
-                        self.update_progress("10")
-                        write_data_to_shared_memory("command_from_server", 10.0)
+                        self.complete_step("10", 10.0)
 
                     elif self.command <= 10.0:
                         self.check_and_load_water(13)
-                        self.update_progress("15")
-                        write_data_to_shared_memory("command_from_server", 15.0)
+                        self.complete_step("15", 15.0)
 
                     elif self.command <= 15.0:
                         self.send_rpm(8000)
                         self.drum_rotation_pattern_one()
-                        self.update_progress("20")
-                        write_data_to_shared_memory("command_from_server", 20.0)
+                        self.complete_step("20", 20.0)
 
                     elif self.command <= 20.0:
                         self.check_and_load_water(13)
                         self.drain_water(45)
-                        self.update_progress("39")
-                        write_data_to_shared_memory("command_from_server", 39.0)
+                        self.complete_step("39", 39.0)
 
                     elif self.command <= 39.0:
                         self.check_and_load_water(13)
-                        self.update_progress("68")
-                        write_data_to_shared_memory("command_from_server", 68.0)
+                        self.complete_step("68", 68.0)
 
                     elif self.command <= 68.0:
                         self.send_rpm(8000)
                         self.drum_rotation_pattern_two()
-                        self.update_progress("80")
-                        write_data_to_shared_memory("command_from_server", 80.0)
+                        self.complete_step("80", 80.0)
 
                     elif self.command <= 80.0:
                         self.check_and_load_water(13)
-                        self.update_progress("90")
-                        write_data_to_shared_memory("command_from_server", 90.0)
+                        self.complete_step("90", 90.0)
 
                     elif self.command <= 90.0:
                         self.drain_water(45)
-                        self.update_progress("99")
-                        write_data_to_shared_memory("command_from_server", 99.0)
+                        self.complete_step("99", 99.0)
 
                     elif self.command <= 99.0:
                         self.open_door()
                         self.update_ready()
                         write_data_to_shared_memory("command_from_server", 1000.0)
                         self.cycle_end()
-                    time.sleep(1)
 
+                # Sleep until the server command or mode is written (a finished
+                # step writes the next one itself), then act on the new values
+                command_counts = self.wait_for_command(command_counts)
+
+            except CycleAborted:
+                self.return_to_idle()
+                command_counts = read_change_counts(self.command_names)
             except Exception as e:
                 print(f"Error in washing cycle: {e}")
                 time.sleep(1)
 
 
 
+    def refresh_shared_memory_values(self):
+        """Read all shared memory values as one consistent snapshot."""
+        # One snapshot so a new command is never paired with a stale mode
+        (
+            self.door_status,
+            self.triac_delay,
+            self.taccosensor,
+            self.water_level,
+            self.water_litres,
+            self.command,
+            self.command_mode,
+        ) = read_snapshot(self.snapshot_names)
+
+    def wait_for_command(self, since, timeout=1.0):
+        """
+        Wait until the server command or mode is written, then refresh the values.
+
+        Returns:
+            Change counts to pass as since to the next call
+        """
+        _, counts = wait_for_any_change(self.command_names, timeout, since)
+        self.refresh_shared_memory_values()
+        return counts
+
     def update_shared_memory_values(self):
         """Update all shared memory values."""
+        counts = read_change_counts(self.snapshot_names)
         while not self._stop_event.is_set():
             try:
-                self.door_status = read_data_from_shared_memory("Door_Status")
-                self.triac_delay = read_data_from_shared_memory("triac_delay")
-                self.taccosensor = read_data_from_shared_memory("taccosensor")
-                self.water_level = read_data_from_shared_memory("Pressure")
-                self.command = read_data_from_shared_memory("command_from_server")
-                self.command_mode = read_data_from_shared_memory("command_mode_from_server")
+                self.refresh_shared_memory_values()
+                # Wake as soon as any value changes instead of once per second
+                _, counts = wait_for_any_change(self.snapshot_names, 1.0, counts)
 
             except Exception as e:
                 print(f"Error reading shared memory: {e}")
-            time.sleep(1)
+                time.sleep(1)
 
     def stop(self):
         """Stop the thread."""
         self._stop_event.set()
+        self.reporter.stop()
 
     def run(self):
         """Main thread execution."""
+        self.reporter.start()
+
         # Start shared memory update thread
         shared_memory_thread = threading.Thread(
             target=self.update_shared_memory_values,
@@ -493,131 +555,9 @@ class WashingMachineController(threading.Thread):
             time.sleep(1)
 
 
-
-
-
-
-
-
-class SensorReader(threading.Thread):
-    def __init__(self):
-        super().__init__()
-        self.daemon = True
-        self._stop_event = threading.Event()
-        
-        # GPIO pin definitions
-        self.pins = {
-            'water_level': 18,  # GPIO 18 for water level sensor
-            'door_status': 12   # GPIO 12 for door status
-        }
-        
-        # Initialize GPIO
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.pins['water_level'], GPIO.IN)
-        GPIO.setup(self.pins['door_status'], GPIO.IN)
-        
-        # Sensor reading configuration
-        self.read_interval = 0.5  # seconds between readings
-        self.pulse_timeout = 1.0  # timeout for pulse readings
-        self.water_level_conversion_factor = 0.1  # adjust based on calibration
-
-    def pulse_in(self, pin, level):
-        """
-        Measure the duration of a pulse on the specified pin.
-        
-        Args:
-            pin: GPIO pin number
-            level: Expected signal level (GPIO.HIGH or GPIO.LOW)
-            
-        Returns:
-            Duration of the pulse in microseconds
-        """
-        start_time = time.time()
-        
-        # Wait for the signal to reach the expected level
-        while GPIO.input(pin) != level:
-            if time.time() - start_time > self.pulse_timeout:
-                return 0
-                
-        # Measure the duration of the pulse
-        start_time = time.time()
-        while GPIO.input(pin) == level:
-            if time.time() - start_time > self.pulse_timeout:
-                return 0
-                
-        return (time.time() - start_time) * 1_000_000  # Convert to microseconds
-
-    def read_pwm_frequency(self):
-        """
-        Read the PWM frequency from the water level sensor.
-        
-        Returns:
-            Frequency in Hz, or 0 if measurement fails
-        """
-        high_duration = self.pulse_in(self.pins['water_level'], GPIO.HIGH)
-        low_duration = self.pulse_in(self.pins['water_level'], GPIO.LOW)
-        
-        if high_duration == 0 or low_duration == 0:
-            return 0
-            
-        period = high_duration + low_duration
-        frequency = 1_000_000.0 / period  # Convert to Hz
-        return frequency
-
-    def read_water_level(self):
-        """Read and process water level sensor data."""
-        try:
-            frequency = self.read_pwm_frequency()
-            write_data_to_shared_memory("Pressure", frequency)
-            
-            # Convert frequency to water level
-            water_level = frequency * self.water_level_conversion_factor
-            write_data_to_shared_memory("Water_Level", water_level)
-            
-        except Exception as e:
-            print(f"Error reading water level: {e}")
-
-    def read_door_status(self):
-        """Read and process door status sensor data."""
-        try:
-            status = GPIO.input(self.pins['door_status'])
-            write_data_to_shared_memory("Door_Status", float(status))
-            
-        except Exception as e:
-            print(f"Error reading door status: {e}")
-
-    def stop(self):
-        """Stop the sensor reading thread."""
-        self._stop_event.set()
-
-    def cleanup(self):
-        """Clean up GPIO resources."""
-        try:
-            GPIO.cleanup()
-        except Exception as e:
-            print(f"Error during GPIO cleanup: {e}")
-
-    def run(self):
-        """Main thread execution loop."""
-        try:
-            while not self._stop_event.is_set():
-                # Read all sensors
-                self.read_water_level()
-                self.read_door_status()
-                
-                # Wait before next reading
-                time.sleep(self.read_interval)
-                
-        except Exception as e:
-            print(f"Error in sensor reading thread: {e}")
-            self.stop()
-        finally:
-            self.cleanup()
-
-
-
-
-
+# Seconds the cycle gets to return to idle; longer than its slowest step
+# that cannot be interrupted, closing the door
+SOFT_RESET_TIMEOUT = 20.0
 
 class JobChecker(threading.Thread):
     def __init__(self):
@@ -626,17 +566,28 @@ class JobChecker(threading.Thread):
         self._stop_event = threading.Event()
         
         # API configuration
-        self.api_url = "https://api.qkwash.com/api/device/checkjobs"
+        self.http = get_client("https://api.qkwash.com/api")
+        self.api_path = "/device/checkjobs"
         self.hub_id = "17348502838715973"
         self.device_id = 1000
         
         # Request configuration
         self.request_timeout = 10  # seconds
         self.check_interval = 5    # seconds between API checks
+
+        # Polls every check_interval while idle, less often during a cycle
+        # and after errors, with jitter
+        self.scheduler = PollScheduler(idle_interval=self.check_interval)
+
+        # Publish the hub this device reports as, for monitor.py
+        write_data_to_shared_memory("hub_id", self.hub_id or "")
         
     def check_jobs(self):
         """
         Make API request to check for new jobs and update shared memory.
+
+        Returns:
+            True if the server answered
         """
         data = {
             "hubid": self.hub_id,
@@ -644,31 +595,61 @@ class JobChecker(threading.Thread):
         }
         
         try:
-            # Make API request with timeout
-            response = requests.post(
-                self.api_url,
+            # Make API request over the pooled connection; one quick retry,
+            # the next check is only check_interval away
+            response = self.http.post(
+                self.api_path,
                 json=data,
-                timeout=self.request_timeout
+                timeout=(CONNECT_TIMEOUT, self.request_timeout),
+                retries=1,
             )
             
             if response.status_code == 200:
                 # Process successful response
                 response_data = response.json()
                 device_status = float(response_data.get('devicestatus', 0))
+                running = self.cycle_running()
                 write_data_to_shared_memory("command_from_server", device_status)
+                if device_status == 1000.0 and running:
+                    self.reset_machine()
                 
             elif response.status_code == 204:
                 # No job available
+                running = self.cycle_running()
                 write_data_to_shared_memory("command_from_server", 1000.0)
-                
+                if running:
+                    self.reset_machine()
+
+            return response.status_code < 500
+
         except requests.exceptions.RequestException:
             # Handle request errors silently
-            pass
+            return False
         except ValueError:
             # Handle JSON parsing errors silently
-            pass
+            return False
         except Exception as e:
             print(f"Unexpected error in job checker: {e}")
+            return False
+
+    def reset_machine(self):
+        """Stop a cycle the server no longer runs, returning the machine to idle in place"""
+        if not request_soft_reset(SOFT_RESET_TIMEOUT):
+            print("Soft reset not acknowledged")
+
+    def cycle_running(self):
+        """Return True while a wash cycle is in progress (1000 means no job)"""
+        return read_data_from_shared_memory("command_from_server") < 1000.0
+
+    def schedule_next_poll(self, ok):
+        """Return the seconds until the next poll and publish the schedule to shared memory"""
+        interval = self.scheduler.next_interval(ok, busy=self.cycle_running())
+        write_many({
+            "poll_interval": interval,
+            "poll_errors": self.scheduler.errors,
+            "poll_errors_total": self.scheduler.total_errors,
+        })
+        return interval
 
     def stop(self):
         """Stop the job checker thread."""
@@ -677,188 +658,17 @@ class JobChecker(threading.Thread):
     def run(self):
         """Main thread execution loop."""
         try:
+            # Devices powered up together start at different moments
+            self._stop_event.wait(self.scheduler.first_delay())
             while not self._stop_event.is_set():
-                self.check_jobs()
-                time.sleep(self.check_interval)
+                ok = self.check_jobs()
+                self._stop_event.wait(self.schedule_next_poll(ok))
                 
         except Exception as e:
             print(f"Error in job checker thread: {e}")
             self.stop()
 
 
-
-
-
-class TachoSensorThread(threading.Thread):
-    def __init__(self, gpio_pin=16):
-        super().__init__()
-        self.gpio_pin = gpio_pin
-        self.running = False
-        self.pulse_count = 0
-        self.pi = None
-        self.last_time = time.time()
-        
-    def count_pulse(self, gpio, level, tick):
-        """Callback function to count pulses"""
-        self.pulse_count += 1
-        
-    def setup_gpio(self):
-        """Initialize GPIO and set up callback"""
-        self.pi = pigpio.pi()
-        if not self.pi.connected:
-            raise RuntimeError("Failed to connect to pigpio daemon")
-            
-        self.pi.set_mode(self.gpio_pin, pigpio.INPUT)
-        self.callback = self.pi.callback(
-            self.gpio_pin, 
-            pigpio.RISING_EDGE, 
-            self.count_pulse
-        )
-        
-    def cleanup(self):
-        """Clean up GPIO resources"""
-        if self.pi:
-            self.callback.cancel()
-            self.pi.stop()
-            
-    def stop(self):
-        """Stop the sensor thread"""
-        self.running = False
-        
-    def run(self):
-        """Main thread loop"""
-        try:
-            self.setup_gpio()
-            self.running = True
-            
-            while self.running:
-                time.sleep(1)  # Measurement interval
-                
-                current_time = time.time()
-                elapsed_time = current_time - self.last_time
-                self.last_time = current_time
-                
-                # Calculate frequency and RPM
-                frequency = self.pulse_count / elapsed_time
-                rpm = frequency * 60.0
-                
-                # Write to shared memory
-                write_data_to_shared_memory("taccosensor", frequency)
-                
-                # Reset pulse count for next interval
-                self.pulse_count = 0
-                
-        except Exception as e:
-            print(f"Error in TachoSensor thread: {e}")
-            
-        finally:
-            self.cleanup()
-
-
-
-
-
-
-class TriacController(threading.Thread):
-    def __init__(self, triac_pin=24, input_pin=25):
-        super().__init__()
-        self.triac_pin = triac_pin
-        self.input_pin = input_pin
-        self.running = False
-        
-        # Thread synchronization
-        self.triac_delay = 8000  # Default delay in microseconds
-        self.delay_lock = threading.Lock()
-        self.delay_updated = threading.Event()
-        
-        # Monitor thread
-        self.monitor_thread = None
-        
-    def setup_gpio(self):
-        """Initialize GPIO pins"""
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(self.triac_pin, GPIO.OUT)
-        GPIO.setup(self.input_pin, GPIO.IN)
-        
-    def cleanup(self):
-        """Clean up GPIO resources"""
-        GPIO.cleanup()
-        
-    def get_delay(self):
-        """Get current TRIAC delay with thread safety"""
-        with self.delay_lock:
-            return self.triac_delay
-            
-    def set_delay(self, new_delay):
-        """Set TRIAC delay with thread safety"""
-        with self.delay_lock:
-            self.triac_delay = new_delay
-            self.delay_updated.set()
-            
-    def monitor_delay(self):
-        """Monitor thread to watch for delay changes in shared memory"""
-        while self.running:
-            new_delay = read_data_from_shared_memory("triac_delay")
-            current_delay = self.get_delay()
-            
-            if current_delay != new_delay:
-                self.set_delay(new_delay)
-                
-            time.sleep(0.1)
-            
-    def stop(self):
-        """Stop all threads"""
-        self.running = False
-        
-    def run(self):
-        """Main thread loop for TRIAC control"""
-        try:
-            self.setup_gpio()
-            self.running = True
-            
-            # Start the monitor thread
-            self.monitor_thread = threading.Thread(target=self.monitor_delay)
-            self.monitor_thread.start()
-            
-            # Main TRIAC control loop
-            while self.running:
-                sensor_value = GPIO.input(self.input_pin)
-                if sensor_value == GPIO.HIGH:
-                    GPIO.output(self.triac_pin, GPIO.LOW)
-                    
-                    # Get current delay value
-                    delay = self.get_delay()
-                    time.sleep(delay / 1_000_000)  # Convert microseconds to seconds
-                    
-                    GPIO.output(self.triac_pin, GPIO.HIGH)
-                    
-        except Exception as e:
-            print(f"Error in TRIAC controller: {e}")
-            
-        finally:
-            if self.monitor_thread:
-                self.monitor_thread.join()
-            self.cleanup()
-            
-    def __enter__(self):
-        """Context manager entry"""
-        self.start()
-        return self
-        
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        """Context manager exit"""
-        self.stop()
-        self.join()
-
-
-
-
-
-
-
-
-
-
 class WashingMachineSystem:
     def __init__(self):
         # Initialize all components
@@ -870,6 +680,7 @@ class WashingMachineSystem:
         self.job_checker = JobChecker()
         self.tacho_sensor = TachoSensorThread()
         self.triac_controller = TriacController()
+        self.speed_controller = SpeedController()
         
         # Store components for easier management
         self.components = [
@@ -879,7 +690,8 @@ class WashingMachineSystem:
             self.sensor_reader,
             self.job_checker,
             self.tacho_sensor,
-            self.triac_controller
+            self.triac_controller,
+            self.speed_controller
         ]
         
     def start_all(self):
@@ -921,7 +733,7 @@ class WashingMachineSystem:
             print(f"Error in relay controller cleanup: {e}")
             
         try:
-            write_data_to_shared_memory("relay_command", 14.0)
+            push_relay_command(14.0, timeout=1.0)
         except Exception as e:
             print(f"Error writing final relay command: {e}")
             
@@ -1,12 +1,16 @@
 import time
 import threading
-import requests
 import json
 from dotenv import load_dotenv
 import os
-from shared_memory_util import read_data_from_shared_memory, write_data_to_shared_memory
+from level_calibration import load_level_table
+from progress_reporter import ProgressReporter
+from shared_memory_util import push_relay_command, read_change_count, read_change_counts, read_data_from_shared_memory, read_snapshot, wait_for_any_change, wait_for_change, wait_for_door, wait_for_relay_ack, write_data_to_shared_memory, write_many
 
 
+class CycleAborted(Exception):
+    """Raised inside a cycle step when a soft reset is requested"""
+
 class WashingMachineControllerHeavy(threading.Thread):
     def __init__(self):
         super().__init__()
@@ -24,6 +28,27 @@ class WashingMachineControllerHeavy(threading.Thread):
         self.water_level = None
         self.command = 1000.0
         self.command_mode = 1000.0
+        self.snapshot_names = (
+            "Door_Status",
+            "triac_delay",
+            "taccosensor_filtered",  # Filtered so noise does not cause extra control steps
+            "Pressure_filtered",
+            "Water_Litres",
+            "command_from_server",
+            "command_mode_from_server",
+        )
+        # soft_reset wakes the idle cycle too
+        self.command_names = ("command_from_server", "command_mode_from_server", "soft_reset")
+        self.soft_reset_seen = 0
+        self.door_latched = False  # Set once this process has latched the door for a cycle
+        self.relay_ack_timeout = 2.0  # seconds to wait for RelayController to execute a command
+
+        # Litres to fill to once the level sensor is calibrated; without them
+        # fills stop at the pressure threshold
+        level_table = load_level_table()
+        self.fill_litres = level_table.fills.get("heavy") if level_table else None
+        self.water_litres = -1.0
+        self.max_fill_time = 300.0  # seconds before the inlets close short of the fill level
         
 
 
@@ -35,105 +60,161 @@ class WashingMachineControllerHeavy(threading.Thread):
         # Raise error if any environment variable is missing
         if not self.hub_id or not self.device_id or not self.api_base_url:
             raise ValueError("Missing one or more required environment variables: HUB_ID, DEVICE_ID, API_BASE_URL")
+        self.reporter = ProgressReporter(self.api_base_url)  # Delivers update_ready and update_progress
         
 
         
     def update_ready(self):
-        url = f"{self.api_base_url}/users/updateReady"
+        """Queue the ready report; ProgressReporter delivers it in the background"""
+        path = "/users/updateReady"
         data = {
             "hubid": self.hub_id,
             "deviceid": self.device_id
         }
-        try:
-            requests.post(url, json=data)
-        except Exception:
-            pass
+        self.reporter.send("ready", path, data)
 
     def update_progress(self, progress):
-        url = f"{self.api_base_url}/users/updateProgress"
+        """Queue a progress report; ProgressReporter delivers it in the background"""
+        path = "/users/updateProgress"
         data = {
             "hubid": self.hub_id,
             "deviceid": self.device_id,
             "progress": progress
         }
+        self.reporter.send("progress", path, data)
+
+    def send_relay_command(self, command):
+        """Queue a relay command and wait until RelayController has executed it."""
         try:
-            requests.post(url, json=data)
-        except Exception:
-            pass
+            sequence = push_relay_command(command, timeout=self.relay_ack_timeout)
+        except RuntimeError as e:
+            # The queue stays full while RelayController is down
+            print(f"Relay command {command} not queued: {e}")
+            return
+        if not wait_for_relay_ack(sequence, self.relay_ack_timeout):
+            print(f"Relay command {command} not acknowledged within {self.relay_ack_timeout}s")
 
     def close_door(self):
-        write_data_to_shared_memory("relay_command", 12.0)
-        time.sleep(10)
-        write_data_to_shared_memory("relay_command", 12.0)
-        time.sleep(4)
+        """Pulse the door lock and move on once the latch is confirmed, retrying once"""
+        pulsed = time.monotonic()
+        self.send_relay_command(12.0)
+        self.door_latched = True
+        if wait_for_door(True, 10, since=pulsed):
+            return
+        pulsed = time.monotonic()
+        self.send_relay_command(12.0)
+        if not wait_for_door(True, 4, since=pulsed):
+            print("Door latch not confirmed")
+
+    def latch_door_for_resume(self):
+        """
+        Latch the door before resuming a cycle restored from the state file;
+        the lock was released with the relays when the machine went down.
+        """
+        self.door_latched = True
+        if wait_for_door(True, 1):
+            return  # Still latched; another pulse would release it
+        print(f"Resuming cycle at step {self.command}, closing the door")
+        self.close_door()
 
     def open_door(self):
-        write_data_to_shared_memory("relay_command", 12.0)
-        time.sleep(4)
+        """Pulse the door lock and wait for the latch to release"""
+        pulsed = time.monotonic()
+        self.send_relay_command(12.0)
+        self.door_latched = False
+        if not wait_for_door(False, 4, since=pulsed):
+            print("Door release not confirmed")
 
     def drain_water(self, time_of_job):
-        write_data_to_shared_memory("relay_command", 10.0)
-        time.sleep(time_of_job)
-        write_data_to_shared_memory("relay_command", 11.0)
-        time.sleep(1)
+        self.send_relay_command(10.0)
+        self.pause(time_of_job)
+        self.send_relay_command(11.0)
 
     def load_water(self, time_of_job):
-        write_data_to_shared_memory("relay_command", 6.0)
-        time.sleep(1)
-        write_data_to_shared_memory("relay_command", 8.0)
-        time.sleep(time_of_job)
-        write_data_to_shared_memory("relay_command", 7.0)
-        time.sleep(1)
-        write_data_to_shared_memory("relay_command", 9.0)
-        time.sleep(1)
+        self.send_relay_command(6.0)
+        self.send_relay_command(8.0)
+        self.pause(time_of_job)
+        self.send_relay_command(7.0)
+        self.send_relay_command(9.0)
 
     def check_and_load_water(self, target_level):
-        write_data_to_shared_memory("relay_command", 6.0)
-        time.sleep(1)
-        write_data_to_shared_memory("relay_command", 8.0)
-        while self.water_level > target_level:
-            time.sleep(0.2)
-        write_data_to_shared_memory("relay_command", 7.0)
-        time.sleep(1)
-        write_data_to_shared_memory("relay_command", 9.0)
-        time.sleep(1)
+        """
+        Fill to fill_litres if set and SensorReader publishes litres, otherwise
+        until the pressure frequency drops to target_level. The inlets close
+        after max_fill_time either way, so a stuck sensor cannot flood the drum.
+        """
+        self.send_relay_command(6.0)
+        self.send_relay_command(8.0)
+        deadline = time.monotonic() + self.max_fill_time
+        # Water_Litres stays negative unless SensorReader has a level table
+        use_litres = self.fill_litres and self.water_litres >= 0
+        while not self.water_filled(target_level, use_litres):
+            if time.monotonic() >= deadline:
+                print(f"Fill stopped after {self.max_fill_time}s short of its level")
+                break
+            self.pause(0.2)
+        self.send_relay_command(7.0)
+        self.send_relay_command(9.0)
+
+    def water_filled(self, target_level, use_litres):
+        """Return True once the drum holds fill_litres, or the pressure frequency reached target_level"""
+        if use_litres:
+            return self.water_litres >= self.fill_litres
+        return self.water_level <= target_level
+
+    def pause(self, seconds):
+        """Sleep during a cycle step; raises CycleAborted as soon as a soft reset is requested"""
+        deadline = time.monotonic() + seconds
+        count = read_change_count("soft_reset")
+        while read_data_from_shared_memory("soft_reset") == self.soft_reset_seen:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            count = wait_for_change("soft_reset", remaining, count)
+        raise CycleAborted()
+
+    def complete_step(self, progress, command):
+        """Report a finished step and move on to the next, unless a soft reset is pending"""
+        self.pause(0)  # Raises CycleAborted, so the step cannot overwrite the reset's idle command
+        self.update_progress(progress)
+        write_data_to_shared_memory("command_from_server", command)
+
+    def return_to_idle(self):
+        """Soft reset: stop the drum and switch every relay off, then report back"""
+        request = read_data_from_shared_memory("soft_reset")
+        self.set_target_rpm(0)
+        self.send_relay_command(14.0)  # All relays off
+        self.send_rpm(7000)
+        # Idle before acknowledging, so the cycle does not resume the aborted step
+        write_many({"command_from_server": 1000.0, "command_mode_from_server": 1000})
+        self.soft_reset_seen = request
+        write_data_to_shared_memory("soft_reset_done", request)
+        print("Cycle reset to idle")
 
     def send_rpm(self, rpm_input):
         write_data_to_shared_memory("triac_delay", float(rpm_input))
 
-    def rpm_leveler(self, required_rpm):
-        req_rpm_input = self.triac_delay
-        while True:
-            if (required_rpm - self.taccosensor) >= 10:
-                req_rpm_input -= 1.5
-            elif (required_rpm - self.taccosensor) <= -10:
-                req_rpm_input += 1.5
-            else:
-                break
-            if(req_rpm_input>8000):
-                req_rpm_input=6500
-            if (req_rpm_input<4000):
-                req_rpm_input=6500
-            self.send_rpm(req_rpm_input)
-            time.sleep(0.1)
+    def set_target_rpm(self, rpm):
+        """Hand the drum speed to SpeedController; 0 returns triac_delay to the cycle"""
+        write_data_to_shared_memory("target_rpm", float(rpm))
 
     def stop_spin(self):
-        write_data_to_shared_memory("relay_command", 5.0)
-        time.sleep(5)
+        self.set_target_rpm(0)
+        self.send_relay_command(5.0)
+        self.pause(5)
         self.send_rpm(7000)
 
     def stop_drain_spin(self):
-        write_data_to_shared_memory("relay_command", 5.0)
-        time.sleep(14)
+        self.set_target_rpm(0)
+        self.send_relay_command(5.0)
+        self.pause(14)
         self.send_rpm(7000)
 
     def set_cl_direction(self):
-        write_data_to_shared_memory("relay_command", 1.0)
-        time.sleep(1)
+        self.send_relay_command(1.0)
 
     def set_al_direction(self):
-        write_data_to_shared_memory("relay_command", 3.0)
-        time.sleep(1)
+        self.send_relay_command(3.0)
 
 
 
@@ -141,27 +222,27 @@ class WashingMachineControllerHeavy(threading.Thread):
         start_time = time.time()
         while (time.time() - start_time < 300):
             self.set_cl_direction()
-            self.rpm_leveler(30)
-            time.sleep(15)
+            self.set_target_rpm(30)
+            self.pause(15)
             self.stop_spin()
 
             self.set_al_direction()
-            self.rpm_leveler(30)
-            time.sleep(15)
+            self.set_target_rpm(30)
+            self.pause(15)
             self.stop_spin()
 
     def drum_rotation_pattern_two(self):
         start_time = time.time()
         while (time.time() - start_time < 300):
             self.set_cl_direction()
-            self.rpm_leveler(40)
-            time.sleep(15)
+            self.set_target_rpm(40)
+            self.pause(15)
             self.stop_spin()
             self.check_and_load_water(11)
 
             self.set_al_direction()
-            self.rpm_leveler(40)
-            time.sleep(15)
+            self.set_target_rpm(40)
+            self.pause(15)
             self.stop_spin()
 
 
@@ -169,75 +250,72 @@ class WashingMachineControllerHeavy(threading.Thread):
         start_time = time.time()
         while (time.time() - start_time < 300):
             self.set_cl_direction()
-            self.rpm_leveler(800)
-            time.sleep(30)
+            self.set_target_rpm(800)
+            self.pause(30)
             self.stop_drain_spin()
             self.drain_water(10)
 
             self.set_al_direction()
-            self.rpm_leveler(800)
-            time.sleep(30)
+            self.set_target_rpm(800)
+            self.pause(30)
             self.stop_drain_spin()
             self.drain_water(10)
 
     def cycle_end(self):
-        write_data_to_shared_memory("relay_command", 14.0)
+        self.send_relay_command(14.0)
 
     def run_washing_cycle(self):
+        command_counts = read_change_counts(self.command_names)
+        # Only soft resets requested from now on concern this cycle
+        self.soft_reset_seen = read_data_from_shared_memory("soft_reset")
         while not self._stop_event.is_set():
             try:
+                self.pause(0)  # A soft reset requested while idle
+                if 0.0 < self.command < 1000.0 and not self.door_latched:
+                    self.latch_door_for_resume()
                 #quick wash
                 if self.command_mode == 0.0:
                     if self.command <= 0.0:
-                        time.sleep(10)
+                        self.pause(10)
                         self.close_door()
-                        self.update_progress("05")
-                        write_data_to_shared_memory("command_from_server", 5.0)
+                        self.complete_step("05", 5.0)
                     # elif self.command <= 4.0:
                     #     print("waiting for door to close")
                     #     waiting =1
 
                     elif self.command <= 5.0:
                         self.drain_water(5)
-                        self.update_progress("10")
-                        write_data_to_shared_memory("command_from_server", 10.0)
+                        self.complete_step("10", 10.0)
 
                     elif self.command <= 10.0:
                         self.check_and_load_water(11)
-                        self.update_progress("15")
-                        write_data_to_shared_memory("command_from_server", 15.0)
+                        self.complete_step("15", 15.0)
 
                     elif self.command <= 15.0:
                         self.send_rpm(7000)
                         self.drum_rotation_pattern_one()
-                        self.update_progress("20")
-                        write_data_to_shared_memory("command_from_server", 20.0)
+                        self.complete_step("20", 20.0)
 
                     elif self.command <= 20.0:
                         self.drain_water(25)
-                        self.update_progress("39")
-                        write_data_to_shared_memory("command_from_server", 39.0)
+                        self.complete_step("39", 39.0)
 
                     elif self.command <= 39.0:
                         self.check_and_load_water(11)
-                        self.update_progress("48")
-                        write_data_to_shared_memory("command_from_server", 48.0)
+                        self.complete_step("48", 48.0)
 
                     elif self.command <= 48.0:
                         self.send_rpm(7000)
                         self.drum_rotation_pattern_two()
-                        self.update_progress("60")
-                        write_data_to_shared_memory("command_from_server", 60.0)
+                        self.complete_step("60", 60.0)
 
                     elif self.command <= 60.0:
                         self.check_and_load_water(11)
-                        self.update_progress("80")
-                        write_data_to_shared_memory("command_from_server", 80.0)
+                        self.complete_step("80", 80.0)
 
                     elif self.command <= 80.0:
                         self.drain_water(50)
-                        self.update_progress("85")
-                        write_data_to_shared_memory("command_from_server", 85.0)
+                        self.complete_step("85", 85.0)
 
                     elif self.command <= 85.0:
                         self.send_rpm(6500)
@@ -249,23 +327,20 @@ class WashingMachineControllerHeavy(threading.Thread):
                         self.send_rpm(6500)
                         self.drain_rotation_pattern_one()
                         self.drain_water(10)
-                        self.update_progress("97")
-                        write_data_to_shared_memory("command_from_server", 97.0)
+                        self.complete_step("97", 97.0)
 
                     elif self.command <= 97.0:
                         self.open_door()
                         self.update_ready()
                         write_data_to_shared_memory("command_from_server", 1000.0)
                         self.cycle_end()
-                    time.sleep(1)
 
                 #heavy wash
                 elif self.command_mode == 0.0:
                     if self.command <= 0.0:
-                        time.sleep(10)
+                        self.pause(10)
                         self.close_door()
-                        self.update_progress("05")
-                        write_data_to_shared_memory("command_from_server", 5.0)
+                        self.complete_step("05", 5.0)
 
                     # elif self.command <= 4.0:
                     #     print("waiting for door to close")
@@ -273,52 +348,44 @@ class WashingMachineControllerHeavy(threading.Thread):
 
                     elif self.command <= 5.0:
                         self.drain_water(5)
-                        self.update_progress("10")
-                        write_data_to_shared_memory("command_from_server", 10.0)
+                        self.complete_step("10", 10.0)
 
                     elif self.command <= 10.0:
                         self.check_and_load_water(11)
-                        self.update_progress("15")
-                        write_data_to_shared_memory("command_from_server", 15.0)
+                        self.complete_step("15", 15.0)
 
                     elif self.command <= 15.0:
                         self.send_rpm(7000)
                         self.drum_rotation_pattern_one()
                         self.send_rpm(7000)
                         self.drum_rotation_pattern_one()
-                        self.update_progress("20")
-                        write_data_to_shared_memory("command_from_server", 20.0)
+                        self.complete_step("20", 20.0)
 
                     elif self.command <= 20.0:
                         self.check_and_load_water(11)
                         self.drain_water(25)
-                        self.update_progress("39")
-                        write_data_to_shared_memory("command_from_server", 39.0)
+                        self.complete_step("39", 39.0)
 
                     elif self.command <= 39.0:
                         self.check_and_load_water(11)
-                        self.update_progress("48")
-                        write_data_to_shared_memory("command_from_server", 48.0)
+                        self.complete_step("48", 48.0)
 
                     elif self.command <= 48.0:
                         self.send_rpm(7000)
                         self.drum_rotation_pattern_two()
                         self.send_rpm(7000)
                         self.drum_rotation_pattern_two()
-                        self.update_progress("60")
-                        write_data_to_shared_memory("command_from_server", 60.0)
+                        self.complete_step("60", 60.0)
 
                     elif self.command <= 60.0:
                         self.check_and_load_water(11)
                         self.send_rpm(7000)
                         self.drum_rotation_pattern_two()
-                        self.update_progress("80")
-                        write_data_to_shared_memory("command_from_server", 80.0)
+                        self.complete_step("80", 80.0)
 
                     elif self.command <= 80.0:
                         self.drain_water(35)
-                        self.update_progress("90")
-                        write_data_to_shared_memory("command_from_server", 90.0)
+                        self.complete_step("90", 90.0)
 
                     elif self.command <= 90.0:
                         self.send_rpm(6500)
@@ -336,43 +403,73 @@ class WashingMachineControllerHeavy(threading.Thread):
                         self.send_rpm(6500)
                         self.drain_rotation_pattern_one()
                         self.drain_water(10)
-                        self.update_progress("97")
-                        write_data_to_shared_memory("command_from_server", 97.0)
+                        self.complete_step("97", 97.0)
 
                     elif self.command <= 97.0:
                         self.open_door()
                         self.update_ready()
                         write_data_to_shared_memory("command_from_server", 1000.0)
                         self.cycle_end()
-                    time.sleep(1)
 
+                # Sleep until the server command or mode is written (a finished
+                # step writes the next one itself), then act on the new values
+                command_counts = self.wait_for_command(command_counts)
+
+            except CycleAborted:
+                self.return_to_idle()
+                command_counts = read_change_counts(self.command_names)
             except Exception as e:
                 print(f"Error in washing cycle: {e}")
                 time.sleep(1)
 
 
 
+    def refresh_shared_memory_values(self):
+        """Read all shared memory values as one consistent snapshot."""
+        # One snapshot so a new command is never paired with a stale mode
+        (
+            self.door_status,
+            self.triac_delay,
+            self.taccosensor,
+            self.water_level,
+            self.water_litres,
+            self.command,
+            self.command_mode,
+        ) = read_snapshot(self.snapshot_names)
+
+    def wait_for_command(self, since, timeout=1.0):
+        """
+        Wait until the server command or mode is written, then refresh the values.
+
+        Returns:
+            Change counts to pass as since to the next call
+        """
+        _, counts = wait_for_any_change(self.command_names, timeout, since)
+        self.refresh_shared_memory_values()
+        return counts
+
     def update_shared_memory_values(self):
         """Update all shared memory values."""
+        counts = read_change_counts(self.snapshot_names)
         while not self._stop_event.is_set():
             try:
-                self.door_status = read_data_from_shared_memory("Door_Status")
-                self.triac_delay = read_data_from_shared_memory("triac_delay")
-                self.taccosensor = read_data_from_shared_memory("taccosensor")
-                self.water_level = read_data_from_shared_memory("Pressure")
-                self.command = read_data_from_shared_memory("command_from_server")
-                self.command_mode = read_data_from_shared_memory("command_mode_from_server")
+                self.refresh_shared_memory_values()
+                # Wake as soon as any value changes instead of once per second
+                _, counts = wait_for_any_change(self.snapshot_names, 1.0, counts)
 
             except Exception as e:
                 print(f"Error reading shared memory: {e}")
-            time.sleep(1)
+                time.sleep(1)
 
     def stop(self):
         """Stop the thread."""
         self._stop_event.set()
+        self.reporter.stop()
 
     def run(self):
         """Main thread execution."""
+        self.reporter.start()
+
         # Start shared memory update thread
         shared_memory_thread = threading.Thread(
             target=self.update_shared_memory_values,
@@ -410,7 +507,7 @@ def main():
         # Clean shutdown
         controller.stop()
         controller.join()
-        write_data_to_shared_memory("relay_command", 14.0)
+        push_relay_command(14.0, timeout=1.0)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,90 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from http_client import HttpClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers every POST like /device/checkjobs does when there is no job."""
+
+    protocol_version = "HTTP/1.1"  # Keep connections open between requests
+    disable_nagle_algorithm = True  # Headers and body go out as separate writes
+    connect_delay = 0.0  # seconds added to each new connection
+
+    def setup(self):
+        # Stands in for the DNS lookup and TCP handshake of a slow link,
+        # which only a new connection pays for
+        time.sleep(self.connect_delay)
+        super().setup()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"deviceStatus": "1000", "washModeValue": "0"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(connect_delay):
+    """Start the stub server on a free local port and return it."""
+    handler = type("Handler", (StubHandler,), {"connect_delay": connect_delay})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def percentile(sorted_values, fraction):
+    """Return the value at the given fraction (0.0 - 1.0) of a sorted list."""
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+def measure(post, requests_count):
+    """
+    Time requests_count calls of post().
+
+    Returns:
+        Dictionary with the latency percentiles in milliseconds
+    """
+    latencies = []
+    for _ in range(requests_count):
+        start = time.perf_counter()
+        response = post()
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"Stub server answered {response.status_code}")
+    latencies.sort()
+    return {
+        "requests": requests_count,
+        "mean_ms": sum(latencies) / len(latencies),
+        "p50_ms": percentile(latencies, 0.50),
+        "p99_ms": percentile(latencies, 0.99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-request latency of one-off requests.post and the pooled HttpClient against a local stub server, as JSON.")
+    parser.add_argument("--requests", type=int, default=200, help="requests per client")
+    parser.add_argument("--connect-delay", type=float, default=0.05, help="seconds the stub adds to each new connection")
+    args = parser.parse_args()
+
+    server = start_stub_server(args.connect_delay)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/api"
+    data = {"hubid": "benchmark", "deviceid": 1000}
+    client = HttpClient(base_url)
+    try:
+        results = {
+            "requests_post": measure(lambda: requests.post(base_url + "/device/checkjobs", json=data, timeout=10), args.requests),
+            "http_client": measure(lambda: client.post("/device/checkjobs", json=data), args.requests),
+        }
+    finally:
+        client.close()
+        server.shutdown()
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
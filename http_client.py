@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# Defaults for calls to the API server
+CONNECT_TIMEOUT = 3.05  # seconds; just over a multiple of the 3 s TCP retransmit
+READ_TIMEOUT = 10.0  # seconds
+RETRIES = 3  # attempts after the first
+BACKOFF = 0.5  # seconds before the first retry, doubling for each further one
+BACKOFF_MAX = 8.0  # seconds
+# Responses worth another try: rate limiting and an overloaded or restarting server
+RETRY_STATUSES = frozenset((429, 502, 503, 504))
+
+class HttpClient:
+    """
+    HTTP client for one API server. A persistent session keeps connections
+    alive between calls, so a request only pays for DNS and the TCP handshake
+    when the previous connection has dropped. Failed attempts are retried with
+    exponential backoff and full jitter, so devices that lost the link
+    together do not all retry at the same moment.
+    """
+
+    def __init__(self, base_url, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 retries=RETRIES, backoff=BACKOFF, pool_size=4):
+        """
+        Args:
+            base_url: URL the request paths are appended to
+            connect_timeout, read_timeout: Seconds to wait for the connection
+                                           and for each read of the response
+            retries: Attempts after the first one fails
+            backoff: Seconds before the first retry, doubled for each next one
+            pool_size: Connections kept open to the server
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        # Retries are done here, with jitter, instead of by urllib3
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def backoff_delay(self, attempt):
+        """Return a random delay of up to backoff * 2**attempt seconds, capped at BACKOFF_MAX"""
+        return random.uniform(0.0, min(BACKOFF_MAX, self.backoff * 2 ** attempt))
+
+    def request(self, method, path, json=None, params=None, timeout=None, retries=None, stream=False):
+        """
+        Send a request to base_url + path, retrying connection errors,
+        timeouts and RETRY_STATUSES.
+
+        Args:
+            method: HTTP method
+            path: Path below base_url, starting with /
+            json: Body to send as JSON
+            params: Query parameters
+            timeout: (connect, read) seconds, defaults to the client's
+            retries: Attempts after the first, defaults to the client's
+            stream: Return before the body is read, for event streams
+
+        Returns:
+            The last response, which may still have a RETRY_STATUSES code
+
+        Raises:
+            requests.exceptions.RequestException: If the last attempt failed
+        """
+        timeout = self.timeout if timeout is None else timeout
+        retries = self.retries if retries is None else retries
+        url = self.base_url + path
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, json=json, params=params, timeout=timeout, stream=stream)
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                response.close()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= retries:
+                    raise
+            time.sleep(self.backoff_delay(attempt))
+            attempt += 1
+
+    def post(self, path, json=None, timeout=None, retries=None):
+        """POST json to base_url + path; see request()"""
+        return self.request("POST", path, json=json, timeout=timeout, retries=retries)
+
+    def close(self):
+        """Close the pooled connections"""
+        self.session.close()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(base_url):
+    """
+    Return the process's HttpClient for base_url, creating it on first use,
+    so all components talking to one server share its connections.
+    """
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = _clients[base_url] = HttpClient(base_url)
+        return client
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import random
+import time
+import posix_ipc
+
+# Run on shared memory of our own instead of the live machine's registers
+os.environ.setdefault("SHM_PREFIX", "job_benchmark_")
+
+from job_stub_server import start_stub_server
+from server_interactor import JobChecker
+from shared_memory_util import (
+    REGISTER_WRITE_LOCK_NAME, SHM_PREFIX, cleanup_shared_memory, initialize_registers, read_data_from_shared_memory, wait_for_change,
+)
+
+
+def percentile(sorted_values, fraction):
+    """Return the value at the given fraction (0.0 - 1.0) of a sorted list."""
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+def benchmark_transport(transport, jobs=5, push=True):
+    """
+    Run a JobChecker against the local stub server and measure how long each
+    new job takes to reach command_from_server in shared memory.
+
+    Args:
+        transport: "poll", "longpoll" or "sse"
+        jobs: Jobs to set, at random moments
+        push: Whether the stub offers the push endpoints
+
+    Returns:
+        Dictionary with the delivery latency percentiles in milliseconds
+    """
+    server = start_stub_server(push)
+    # Statuses of 1000 and above keep JobChecker on its idle polling
+    # schedule; 1001 also stays clear of 1000, which soft-resets a cycle
+    # that is still running
+    server.set_job(1001, 0)
+    os.environ.update({
+        "API_BASE_URL": server.base_url,
+        "HUB_ID": "benchmark",
+        "DEVICE_ID": "1000",
+        "JOB_TRANSPORT": transport,
+    })
+    checker = JobChecker()
+    checker.start()
+    latencies = []
+    try:
+        # Let the first answer arrive; the first poll is jittered
+        count = wait_for_change("command_from_server", 0)
+        while read_data_from_shared_memory("command_from_server") != 1001:
+            count = wait_for_change("command_from_server", 30.0, count)
+        for status in range(1002, 1002 + jobs):
+            time.sleep(random.uniform(0.0, checker.check_interval))  # Land at any point of a polling interval
+            count = wait_for_change("command_from_server", 0)
+            start = time.perf_counter()
+            server.set_job(status, 0)
+            while read_data_from_shared_memory("command_from_server") != status:
+                count = wait_for_change("command_from_server", 30.0, count)
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        checker.stop()
+        server.shutdown()
+    latencies.sort()
+    return {
+        "transport": transport,
+        "jobs": len(latencies),
+        "p50_ms": percentile(latencies, 0.50),
+        "max_ms": latencies[-1],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how fast each job transport delivers jobs from a local stub server, as JSON.")
+    parser.add_argument("--jobs", type=int, default=5, help="jobs per transport")
+    args = parser.parse_args()
+    if not SHM_PREFIX:
+        parser.error("SHM_PREFIX is empty; the benchmark would overwrite the live job registers")
+
+    initialize_registers()
+    try:
+        results = {
+            transport: benchmark_transport(transport, args.jobs)
+            for transport in ("poll", "longpoll", "sse")
+        }
+        results["longpoll_without_push"] = benchmark_transport("longpoll", args.jobs, push=False)
+    finally:
+        cleanup_shared_memory()
+        posix_ipc.unlink_semaphore(REGISTER_WRITE_LOCK_NAME)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+SSE_KEEPALIVE = 15.0  # seconds between comments on an idle event stream
+
+
+class StubJobServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the job API, for testing JobChecker offline.
+
+    Endpoints, below /api:
+        POST /device/checkjobs: The current job, for polling
+        POST /device/waitjobs: The current job as soon as it differs from the
+            deviceStatus and washModeValue in the body, or 204 after "wait"
+            seconds (long-poll)
+        GET /device/jobevents: Server-sent events, one "job" event with the
+            current job on connect and on every change; hubid and deviceid
+            query parameters are accepted but not checked
+        POST /stub/job: Set the current job to the JSON body
+
+    With push=False the push endpoints answer 404, like a server without them.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), push=True):
+        super().__init__(address, StubJobHandler)
+        self.push = push
+        self.job = {"deviceStatus": "1000", "washModeValue": "0"}
+        self.changed = threading.Condition()
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/api"
+
+    def set_job(self, device_status, wash_mode):
+        """Make a new job current and wake the waiting clients."""
+        with self.changed:
+            self.job = {"deviceStatus": str(device_status), "washModeValue": str(wash_mode)}
+            self.changed.notify_all()
+
+    def wait_for_job(self, differs_from, timeout):
+        """
+        Return the current job once it differs from differs_from, or None after timeout.
+        """
+        with self.changed:
+            if self.changed.wait_for(lambda: self.job != differs_from, timeout):
+                return self.job
+        return None
+
+class StubJobHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def send_json(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self.read_json()
+        if path == "/api/device/checkjobs":
+            self.send_json(200, self.server.job)
+        elif path == "/api/device/waitjobs" and self.server.push:
+            last = {"deviceStatus": body.get("deviceStatus"), "washModeValue": body.get("washModeValue")}
+            job = self.server.wait_for_job(last, float(body.get("wait", 25)))
+            if job is None:
+                self.send_json(204)
+            else:
+                self.send_json(200, job)
+        elif path == "/api/stub/job":
+            self.server.set_job(body.get("deviceStatus", "1000"), body.get("washModeValue", "0"))
+            self.send_json(200, self.server.job)
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/api/device/jobevents" or not self.server.push:
+            self.send_json(404, {"error": "not found"})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        job = None
+        try:
+            while True:
+                latest = self.server.wait_for_job(job, SSE_KEEPALIVE)
+                if latest is None:
+                    self.write_chunk(": keepalive\n\n")
+                else:
+                    job = latest
+                    self.write_chunk(f"event: job\ndata: {json.dumps(job)}\n\n")
+        except OSError:
+            pass  # Client went away
+
+    def write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(push=True, port=0):
+    """Start a StubJobServer in a background thread and return it."""
+    server = StubJobServer(("127.0.0.1", port), push)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a stub job API locally; point API_BASE_URL at the printed URL.")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument("--no-push", action="store_true", help="answer 404 on the push endpoints, like the current server")
+    args = parser.parse_args()
+
+    server = start_stub_server(not args.no_push, args.port)
+    print(f"Stub job API at {server.base_url}; set a job with POST {server.base_url}/stub/job")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import bisect
+import json
+import os
+import time
+from array import array
+from shared_memory_util import push_relay_command, read_data_from_shared_memory
+
+# Calibrated pressure frequency to litres table of this machine
+LEVEL_TABLE_FILE = os.getenv("LEVEL_TABLE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "level_table.json"))
+
+class LevelTable:
+    """
+    Water volume measured at a series of pressure sensor frequencies,
+    interpolated to give the litres in the drum for a frequency.
+
+    The points are sorted and the segment slopes computed once, so a lookup
+    is a binary search and one multiply-add.
+    """
+
+    def __init__(self, points, fills=None):
+        """
+        Args:
+            points: (frequency, litres) pairs recorded by capture()
+            fills: Dictionary of cycle name to the litres to fill to
+        """
+        # Keep the points where the frequency keeps moving the same way as
+        # the volume grows, so the interpolation is monotone despite noisy
+        # samples. The sensor decides the direction from the end points.
+        by_volume = sorted((litres, frequency) for frequency, litres in points)
+        if len(by_volume) < 2:
+            raise ValueError("A level table needs at least two points")
+        falling = by_volume[-1][1] < by_volume[0][1]
+        kept = []
+        for litres, frequency in by_volume:
+            if not kept or (frequency < kept[-1][1] if falling else frequency > kept[-1][1]):
+                kept.append((litres, frequency))
+        if len(kept) < 2:
+            raise ValueError("The level table points do not change with the volume")
+        if falling:
+            kept.reverse()
+
+        # Ascending frequencies for bisect, with the litres and slope of each segment
+        self.frequencies = array('d', (frequency for _, frequency in kept))
+        self.litres = array('d', (litres for litres, _ in kept))
+        self.slopes = array('d', (
+            (self.litres[i + 1] - self.litres[i]) / (self.frequencies[i + 1] - self.frequencies[i])
+            for i in range(len(kept) - 1)
+        ))
+        self.fills = dict(fills or {})
+
+    def points(self):
+        """Return the (frequency, litres) pairs of the table"""
+        return list(zip(self.frequencies, self.litres))
+
+    def __call__(self, frequency):
+        """Return the litres at frequency, clamped to the measured range"""
+        index = bisect.bisect_right(self.frequencies, frequency) - 1
+        if index < 0:
+            return self.litres[0]
+        if index >= len(self.slopes):
+            return self.litres[-1]
+        return self.litres[index] + self.slopes[index] * (frequency - self.frequencies[index])
+
+def load_level_table(path=LEVEL_TABLE_FILE):
+    """
+    Read the machine's level table.
+
+    Returns:
+        LevelTable, or None if the level sensor has not been calibrated
+    """
+    try:
+        with open(path) as file:
+            data = json.load(file)
+        return LevelTable(data["points"], data.get("fills"))
+    except (OSError, KeyError, ValueError):
+        return None
+
+def save_level_table(table, path=LEVEL_TABLE_FILE):
+    """Store the level table"""
+    data = {"points": table.points(), "fills": table.fills}
+    # Write a new file and rename it so a power cut cannot leave half a table
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        json.dump(data, file, indent=2)
+    os.replace(temporary, path)
+
+def capture(flow_rate=None, max_litres=30.0, interval=2.0, path=LEVEL_TABLE_FILE):
+    """
+    Fill the empty drum and record the filtered pressure frequency against
+    the volume let in, then store the table. With flow_rate the volume is
+    timed from the inlet's flow; without it the operator types the litres
+    read from a meter at each point and an empty line ends the capture.
+    SensorReader must be running.
+
+    Args:
+        flow_rate: Inlet flow in litres per minute, or None to enter the litres
+        max_litres: Close the inlet once this volume is in the drum
+        interval: Seconds between points when timing the flow
+
+    Returns:
+        The new LevelTable
+    """
+    previous = load_level_table(path)
+    points = [(read_data_from_shared_memory("Pressure_filtered"), 0.0)]
+    print(f"Empty drum: {points[0][0]:.2f} Hz")
+    push_relay_command(6.0, timeout=1.0)  # Open the inlets
+    push_relay_command(8.0, timeout=1.0)
+    start = time.monotonic()
+    try:
+        while True:
+            if flow_rate:
+                time.sleep(interval)
+                litres = flow_rate * (time.monotonic() - start) / 60.0
+            else:
+                entry = input("Litres in the drum (empty line to finish): ").strip()
+                if not entry:
+                    break
+                litres = float(entry)
+            frequency = read_data_from_shared_memory("Pressure_filtered")
+            print(f"{litres:.1f} l: {frequency:.2f} Hz")
+            points.append((frequency, litres))
+            if litres >= max_litres:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        push_relay_command(7.0, timeout=1.0)  # Close the inlets
+        push_relay_command(9.0, timeout=1.0)
+
+    table = LevelTable(points, previous.fills if previous else None)
+    save_level_table(table, path)
+    return table
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the water level sensor, or set the fill volumes of the cycles.")
+    parser.add_argument("--capture", action="store_true", help="fill the empty drum and record the level table")
+    parser.add_argument("--flow-rate", type=float, help="inlet flow in litres per minute; without it, type the litres at each point")
+    parser.add_argument("--max-litres", type=float, default=30.0, help="volume at which the capture stops filling")
+    parser.add_argument("--fill", nargs=2, action="append", metavar=("CYCLE", "LITRES"), default=[],
+                        help="litres the cycle (normal or heavy) fills to; 0 goes back to its pressure threshold")
+    args = parser.parse_args()
+
+    if args.capture:
+        table = capture(args.flow_rate, args.max_litres)
+        print(f"Stored {len(table.points())} points in {LEVEL_TABLE_FILE}")
+    table = load_level_table()
+    if args.fill:
+        if table is None:
+            raise RuntimeError("Calibrate the level sensor with --capture before setting fill volumes")
+        for cycle, litres in args.fill:
+            if float(litres) > 0:
+                table.fills[cycle] = float(litres)
+            else:
+                table.fills.pop(cycle, None)
+        save_level_table(table)
+    if table is not None:
+        print(json.dumps({"points": table.points(), "fills": table.fills}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,37 @@
 import time
-from shared_memory_util import read_data_from_shared_memory
+from shared_memory_schema import FIELD_NAMES, FIELDS_BY_NAME
+from shared_memory_util import HISTORY_NAMES, open_sensor_history, read_generation, read_many
 
-# Shared memory names
-shared_memory_names = [
-    "relay_command",
-    "taccosensor",
-    "doorssensor",
-    "Pressure",
-    "Water_Level",
-    "Door_Status",
-    "triac_delay",
-    "command_from_server",
-    "command_mode_from_server",  # For TRIAC delay
-]
+# Shared memory names, generated from the register file schema
+shared_memory_names = FIELD_NAMES
 
+# Seconds of sensor history summarised on each refresh
+trend_window = 10.0
 
 
 
+
+def print_trends():
+    """Print min, max and change over the last trend_window seconds of each sensor history."""
+    since = time.monotonic() - trend_window
+    for name in HISTORY_NAMES:
+        samples = open_sensor_history(name).since(since)
+        if len(samples) == 0:
+            print(f"{name}: no samples in the last {trend_window:.0f}s")
+            continue
+        values = [samples[i, 1] for i in range(len(samples))]
+        change = values[-1] - values[0]
+        print(f"{name}: min {min(values):.2f}, max {max(values):.2f}, change {change:+.2f} over {len(values)} samples")
+
 def monitor_shared_memory():
     while True:
         try:
-            print("\nShared Memory Values:")
-            for name in shared_memory_names:
-                value = read_data_from_shared_memory(name)
-                print(f"{name}: {value}")
+            print(f"\nShared Memory Values (generation {read_generation()}):")
+            values = read_many(shared_memory_names)  # One consistent read for all values
+            for name, value in zip(shared_memory_names, values):
+                print(f"{name} ({FIELDS_BY_NAME[name].owner}): {value}")
+            print(f"\nTrends (last {trend_window:.0f}s):")
+            print_trends()
             time.sleep(1)  # Adjust the delay as needed
         except KeyboardInterrupt:
             print("Monitoring stopped.")
@@ -0,0 +1,56 @@
+import random
+
+# Defaults for JobChecker's polling
+IDLE_INTERVAL = 5.0  # seconds between polls while waiting for a customer
+BUSY_INTERVAL = 30.0  # seconds between polls while a cycle runs
+MAX_INTERVAL = 300.0  # seconds, longest wait after repeated errors
+JITTER = 0.2  # fraction of the interval added or taken off at random
+
+class PollScheduler:
+    """
+    Decides how long JobChecker waits before its next poll: short while the
+    machine is idle, longer while a cycle runs and doubling with each failed
+    poll in a row. Every wait is randomized, so devices that lost power
+    together drift apart instead of polling the server in lockstep.
+    """
+
+    def __init__(self, idle_interval=IDLE_INTERVAL, busy_interval=BUSY_INTERVAL,
+                 max_interval=MAX_INTERVAL, jitter=JITTER):
+        """
+        Args:
+            idle_interval: Seconds between polls while idle
+            busy_interval: Seconds between polls while a cycle runs
+            max_interval: Cap of the error backoff in seconds
+            jitter: Fraction of the interval to randomize by, 0.0 - 1.0
+        """
+        self.idle_interval = idle_interval
+        self.busy_interval = busy_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.errors = 0  # Failed polls in a row
+        self.total_errors = 0
+        self.interval = idle_interval
+
+    def first_delay(self):
+        """Return a random wait of up to idle_interval before the first poll after start."""
+        return random.uniform(0.0, self.idle_interval)
+
+    def next_interval(self, ok, busy=False):
+        """
+        Record the outcome of a poll and return the seconds to wait before the next.
+
+        Args:
+            ok: True if the poll reached the server and got an answer
+            busy: True while a cycle is running
+        """
+        base = self.busy_interval if busy else self.idle_interval
+        if ok:
+            self.errors = 0
+        else:
+            self.errors += 1
+            self.total_errors += 1
+            # Past 32 doublings any base is over the cap; a longer outage
+            # would overflow the float
+            base = min(self.max_interval, base * 2 ** min(self.errors, 32))
+        self.interval = base * random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+        return self.interval
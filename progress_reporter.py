@@ -0,0 +1,174 @@
+import collections
+import json
+import os
+import random
+import threading
+from http_client import get_client
+
+# Reports not yet delivered, kept across restarts
+PROGRESS_OUTBOX_FILE = os.getenv("PROGRESS_OUTBOX_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "progress_outbox.jsonl"))
+# Rewrite the outbox once it has this many lines, keeping only undelivered reports
+OUTBOX_COMPACT_LINES = 200
+RETRY_INTERVAL_MAX = 60.0  # seconds between delivery attempts while the server is unreachable
+
+class ProgressReporter(threading.Thread):
+    """
+    Delivers cycle reports (progress, ready) to the API server in the
+    background, so the cycle never waits on the network.
+
+    send() only appends to an in-memory queue. The reporter thread writes each
+    report to an append-only outbox file before posting it and appends an ack
+    line once the server took it, so reports that were not delivered are
+    replayed after a restart. Each kind of report only matters in its latest
+    version, so an undelivered report is replaced by a newer one of its kind.
+    """
+
+    def __init__(self, base_url, outbox_path=PROGRESS_OUTBOX_FILE):
+        """
+        Args:
+            base_url: API server URL the report paths are relative to
+            outbox_path: File for undelivered reports
+        """
+        super().__init__()
+        self.daemon = True
+        self._stop_event = threading.Event()
+        self.http = get_client(base_url)
+        self.outbox_path = outbox_path
+        self.queue = collections.deque()
+        self.wakeup = threading.Event()
+        self.pending = {}  # kind -> latest undelivered report
+        self.sequence = 0
+        self.outbox_lines = 0
+        self.outbox = None
+
+    def send(self, kind, path, data):
+        """
+        Queue a report without waiting.
+
+        Args:
+            kind: Report kind; a newer report replaces an undelivered one of the same kind
+            path: Path below the server URL to post to
+            data: JSON body
+        """
+        self.queue.append({"kind": kind, "path": path, "data": data})
+        self.wakeup.set()
+
+    def load_outbox(self):
+        """Read the undelivered reports of the previous run into pending."""
+        acked = set()
+        reports = []
+        try:
+            with open(self.outbox_path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by a power loss
+                    if "ack" in entry:
+                        acked.add(entry["ack"])
+                    else:
+                        reports.append(entry)
+        except OSError:
+            pass
+        for report in reports:
+            self.sequence = max(self.sequence, report["seq"])
+            if report["seq"] not in acked:
+                self.pending[report["kind"]] = report  # Later reports replace earlier ones
+        self.compact_outbox()
+
+    def append_to_outbox(self, entry):
+        """Append one line to the outbox and make it durable."""
+        self.outbox.write(json.dumps(entry) + "\n")
+        self.outbox.flush()
+        os.fsync(self.outbox.fileno())
+        self.outbox_lines += 1
+
+    def compact_outbox(self):
+        """Rewrite the outbox with only the pending reports."""
+        if self.outbox:
+            self.outbox.close()
+        temporary = self.outbox_path + ".tmp"
+        with open(temporary, "w") as file:
+            for report in sorted(self.pending.values(), key=lambda report: report["seq"]):
+                file.write(json.dumps(report) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.outbox_path)
+        self.outbox = open(self.outbox_path, "a")
+        self.outbox_lines = len(self.pending)
+
+    def take_queued(self):
+        """Move queued reports into the outbox and pending."""
+        while self.queue:
+            report = self.queue.popleft()
+            self.sequence += 1
+            report["seq"] = self.sequence
+            self.append_to_outbox(report)
+            self.pending[report["kind"]] = report
+
+    def deliver(self, report):
+        """
+        Post one report.
+
+        Returns:
+            True if the report is done with, False to try again later
+        """
+        try:
+            response = self.http.post(report["path"], json=report["data"])
+        except Exception as e:
+            print(f"Report '{report['kind']}' not delivered: {e}")
+            return False
+        if response.status_code >= 500 or response.status_code == 429:
+            return False
+        if response.status_code >= 400:
+            # The server will never take it; retrying would only block the rest
+            print(f"Report '{report['kind']}' rejected with status {response.status_code}")
+        return True
+
+    def deliver_pending(self):
+        """
+        Post the pending reports in the order they were made, including
+        those queued while an earlier one was being posted.
+
+        Returns:
+            True if all were delivered
+        """
+        while True:
+            self.take_queued()  # Newer reports replace pending ones before their turn
+            if not self.pending:
+                return True
+            report = min(self.pending.values(), key=lambda report: report["seq"])
+            if not self.deliver(report):
+                return False
+            self.append_to_outbox({"ack": report["seq"]})
+            del self.pending[report["kind"]]
+
+    def stop(self):
+        """Stop the reporter; undelivered reports stay in the outbox."""
+        self._stop_event.set()
+        self.wakeup.set()
+
+    def run(self):
+        """Main thread loop."""
+        self.load_outbox()
+        failures = 0
+        try:
+            while not self._stop_event.is_set():
+                # Cleared before the queue is taken, so a send() or stop()
+                # from here on makes the wait below return at once
+                self.wakeup.clear()
+                if self.deliver_pending():
+                    failures = 0
+                    if self.outbox_lines >= OUTBOX_COMPACT_LINES:
+                        self.compact_outbox()
+                    self.wakeup.wait()
+                else:
+                    # Back off while the server is unreachable; a new report
+                    # does not cut the wait short
+                    failures += 1
+                    self._stop_event.wait(random.uniform(1.0, min(RETRY_INTERVAL_MAX, 2.0 ** failures)))
+        except Exception as e:
+            print(f"Error in progress reporter: {e}")
+        finally:
+            if self.outbox:
+                self.outbox.close()
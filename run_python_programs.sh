@@ -11,6 +11,7 @@ SCRIPTS=(
     "sensor_reader.py"
     "tacho_reader.py"
     "triac_control.py"
+    "speed_control.py"
     "server_interactor.py"
     "first_cycle_qk.py"
 )
@@ -0,0 +1,89 @@
+import argparse
+import json
+import time
+import pigpio
+from sensor_reader import SensorReader
+
+# Unused GPIO driven with PWM as a stand-in for the water level sensor;
+# pigpio reports the level of output pins too, so no wiring is needed
+TEST_PIN = 26
+
+
+def benchmark_backend(backend, frequency, duty_cycle=0.5, duration=10.0, pin=TEST_PIN):
+    """
+    Read a known PWM signal with one SensorReader backend at the production
+    read interval and measure the error and the CPU this process spends.
+    Must run on the Pi, next to pigpiod.
+
+    Args:
+        backend: "pigpio" or "gpio"
+        frequency: PWM frequency in Hz; pigpio picks the nearest it supports
+        duty_cycle: PWM duty cycle, 0.0 - 1.0
+        duration: Seconds to measure
+        pin: GPIO to drive with PWM
+
+    Returns:
+        Dictionary with the actual frequency, the mean and worst frequency
+        error, the mean duty cycle error (pigpio only), the mean read time
+        and the CPU used
+    """
+    # The reader configures the pin as an input, so drive it only afterwards
+    reader = SensorReader(pwm_backend=backend, water_level_pin=pin)
+    pi = pigpio.pi()
+    if not pi.connected:
+        raise RuntimeError("Failed to connect to pigpio daemon")
+    pi.set_mode(pin, pigpio.OUTPUT)
+    actual_frequency = pi.set_PWM_frequency(pin, frequency)
+    pi.set_PWM_dutycycle(pin, round(duty_cycle * 255))
+    actual_duty_cycle = pi.get_PWM_dutycycle(pin) / 255
+    errors = []
+    duty_errors = []
+    read_times = []
+    try:
+        time.sleep(0.5)  # Collect the first edges
+        start_cpu = time.process_time()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            if backend == "pigpio":
+                measured, measured_duty_cycle = reader.read_pwm()
+                duty_errors.append(abs(measured_duty_cycle - actual_duty_cycle))
+            else:
+                measured = reader.read_pwm_frequency()
+            read_times.append(time.perf_counter() - start)
+            errors.append(abs(measured - actual_frequency) / actual_frequency * 100)
+            time.sleep(reader.read_interval)
+        cpu = time.process_time() - start_cpu
+    finally:
+        reader.cleanup()
+        pi.set_PWM_dutycycle(pin, 0)
+        pi.set_mode(pin, pigpio.INPUT)
+        pi.stop()
+
+    return {
+        "backend": reader.pwm_backend,
+        "actual_frequency_hz": actual_frequency,
+        "mean_error_percent": sum(errors) / len(errors),
+        "max_error_percent": max(errors),
+        "mean_duty_cycle_error": sum(duty_errors) / len(duty_errors) if duty_errors else None,
+        "mean_read_ms": sum(read_times) / len(read_times) * 1000,
+        "cpu_percent": cpu / duration * 100,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare water level PWM backends for accuracy and CPU and print JSON.")
+    parser.add_argument("--frequencies", type=int, nargs="+", default=[100, 500, 1000, 2000], help="PWM frequencies in Hz")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per backend and frequency")
+    args = parser.parse_args()
+
+    results = {
+        str(frequency): {
+            backend: benchmark_backend(backend, frequency, duration=args.duration)
+            for backend in ("gpio", "pigpio")
+        }
+        for frequency in args.frequencies
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,31 @@
 import RPi.GPIO as GPIO
+import collections
+import pigpio
 import time
 import threading
-from shared_memory_util import write_data_to_shared_memory
+from shared_memory_util import open_sensor_history, write_many
+from level_calibration import load_level_table
+from signal_filter import pressure_filter
 
 class SensorReader(threading.Thread):
-    def __init__(self):
+    # pigpio ticks are microseconds in an unsigned 32-bit counter that wraps
+    TICK_MASK = 0xFFFFFFFF
+
+    def __init__(self, pwm_backend="pigpio", water_level_pin=18):
+        """
+        Args:
+            pwm_backend: "pigpio" timestamps the water level sensor's edges in
+                         pigpiod and reads return at once; "gpio" busy-waits
+                         on two half periods per read
+            water_level_pin: GPIO of the water level sensor
+        """
         super().__init__()
         self.daemon = True
         self._stop_event = threading.Event()
         
         # GPIO pin definitions
         self.pins = {
-            'water_level': 18,  # GPIO 18 for water level sensor
+            'water_level': water_level_pin,  # GPIO 18 for water level sensor by default
             'door_status': 12   # GPIO 12 for door status
         }
         
@@ -24,6 +38,97 @@ class SensorReader(threading.Thread):
         self.read_interval = 0.5  # seconds between readings
         self.pulse_timeout = 1.0  # timeout for pulse readings
         self.water_level_conversion_factor = 0.1  # adjust based on calibration
+        self.level_table = load_level_table()
+
+        # Shared memory sample histories
+        self.pressure_history = open_sensor_history("Pressure")
+        self.water_level_history = open_sensor_history("Water_Level")
+
+        # Smooths Pressure before the cycle compares it to fill levels
+        self.pressure_filter = pressure_filter()
+
+        # Edge timing of the pigpio backend: the latest periods and high
+        # times in microseconds, averaged on each read
+        self.pwm_backend = pwm_backend
+        self.pwm_average = 16  # periods averaged per reading
+        self.periods = collections.deque(maxlen=self.pwm_average)
+        self.high_times = collections.deque(maxlen=self.pwm_average)
+        self.last_rise = None
+        self.last_edge = None
+        self.pi = None
+        self.pwm_callback = None
+        if self.pwm_backend == "pigpio":
+            self.setup_pwm_callback()
+
+        # Door input: edges from pigpio, debounced by its glitch filter, or
+        # polled each read_interval without pigpio
+        self.door_debounce = 0.05  # seconds the level must hold to count
+        self.door_status = None
+        self.last_door_sample = None
+        self.door_callback = None
+        if self.pi and self.pi.connected:
+            self.setup_door_callback()
+
+    def setup_pwm_callback(self):
+        """Timestamp the water level sensor's edges with a pigpio callback"""
+        self.pi = pigpio.pi()
+        if not self.pi.connected:
+            print("pigpio daemon unavailable, busy-waiting on the water level sensor")
+            self.pwm_backend = "gpio"
+            return
+        self.pi.set_mode(self.pins['water_level'], pigpio.INPUT)
+        self.pwm_callback = self.pi.callback(self.pins['water_level'], pigpio.EITHER_EDGE, self.on_pwm_edge)
+
+    def setup_door_callback(self):
+        """Report debounced door edges with a pigpio callback"""
+        pin = self.pins['door_status']
+        self.pi.set_mode(pin, pigpio.INPUT)
+        self.pi.set_glitch_filter(pin, int(self.door_debounce * 1_000_000))
+        self.door_callback = self.pi.callback(pin, pigpio.EITHER_EDGE, self.on_door_edge)
+        self.publish_door_status(bool(self.pi.read(pin)))
+
+    def on_door_edge(self, gpio, level, tick):
+        """pigpio callback: publish each level that held for door_debounce"""
+        if level != pigpio.TIMEOUT:
+            self.publish_door_status(bool(level))
+
+    def publish_door_status(self, status):
+        """Write Door_Status and the time it changed, if it changed"""
+        if status != self.door_status:
+            self.door_status = status
+            write_many({"Door_Status": status, "Door_Changed": time.monotonic()})
+
+    def on_pwm_edge(self, gpio, level, tick):
+        """pigpio callback: record the period on rising edges and the high time on falling ones"""
+        if level == 1:
+            if self.last_rise is not None:
+                period = (tick - self.last_rise) & self.TICK_MASK
+                if period <= self.pulse_timeout * 1_000_000:  # Not a gap in the signal
+                    self.periods.append(period)
+            self.last_rise = tick
+        elif level == 0 and self.last_rise is not None:
+            self.high_times.append((tick - self.last_rise) & self.TICK_MASK)
+        self.last_edge = tick
+
+    def read_pwm(self):
+        """
+        Read the water level sensor's PWM from the latest edges, without waiting.
+
+        Returns:
+            Tuple (frequency in Hz, duty cycle 0.0 - 1.0), or (0, 0) if no edge
+            arrived within pulse_timeout
+        """
+        last_edge = self.last_edge
+        if last_edge is None:
+            return 0, 0
+        age = (self.pi.get_current_tick() - last_edge) & self.TICK_MASK
+        periods = list(self.periods)
+        high_times = list(self.high_times)
+        if age > self.pulse_timeout * 1_000_000 or not periods:
+            return 0, 0
+        period = sum(periods) / len(periods)
+        duty_cycle = sum(high_times) / len(high_times) / period if high_times else 0
+        return 1_000_000.0 / period, duty_cycle
 
     def pulse_in(self, pin, level):
         """
@@ -58,6 +163,9 @@ class SensorReader(threading.Thread):
         Returns:
             Frequency in Hz, or 0 if measurement fails
         """
+        if self.pwm_backend == "pigpio":
+            return self.read_pwm()[0]
+
         high_duration = self.pulse_in(self.pins['water_level'], GPIO.HIGH)
         low_duration = self.pulse_in(self.pins['water_level'], GPIO.LOW)
         
@@ -72,21 +180,38 @@ class SensorReader(threading.Thread):
         """Read and process water level sensor data."""
         try:
             frequency = self.read_pwm_frequency()
-            write_data_to_shared_memory("Pressure", frequency)
+            timestamp = time.monotonic()
             
-            # Convert frequency to water level
+            filtered = self.pressure_filter.update(frequency, timestamp)
+
             water_level = frequency * self.water_level_conversion_factor
-            write_data_to_shared_memory("Water_Level", water_level)
+            values = {
+                "Pressure": frequency,
+                "Pressure_filtered": filtered,
+                "Water_Level": water_level,
+            }
+            # Convert frequency to litres; filtered, so a failed reading does
+            # not look like a full drum. Without a table Water_Litres keeps
+            # its negative default and the cycles use their pressure thresholds
+            if self.level_table:
+                values["Water_Litres"] = self.level_table(filtered)
+            write_many(values)
+
+            # Keep a history so fill and drain trends can be read later
+            self.pressure_history.append(frequency, timestamp)
+            self.water_level_history.append(water_level, timestamp)
             
         except Exception as e:
             print(f"Error reading water level: {e}")
 
     def read_door_status(self):
-        """Read and process door status sensor data."""
+        """Poll the door status sensor; a level counts once two readings in a row agree."""
         try:
-            status = GPIO.input(self.pins['door_status'])
-            write_data_to_shared_memory("Door_Status", float(status))
-            
+            status = bool(GPIO.input(self.pins['door_status']))
+            if status == self.last_door_sample:
+                self.publish_door_status(status)
+            self.last_door_sample = status
+
         except Exception as e:
             print(f"Error reading door status: {e}")
 
@@ -97,6 +222,13 @@ class SensorReader(threading.Thread):
     def cleanup(self):
         """Clean up GPIO resources."""
         try:
+            if self.pwm_callback:
+                self.pwm_callback.cancel()
+            if self.door_callback:
+                self.door_callback.cancel()
+                self.pi.set_glitch_filter(self.pins['door_status'], 0)
+            if self.pi:
+                self.pi.stop()
             GPIO.cleanup()
         except Exception as e:
             print(f"Error during GPIO cleanup: {e}")
@@ -107,7 +239,8 @@ class SensorReader(threading.Thread):
             while not self._stop_event.is_set():
                 # Read all sensors
                 self.read_water_level()
-                self.read_door_status()
+                if not self.door_callback:
+                    self.read_door_status()
                 
                 # Wait before next reading
                 time.sleep(self.read_interval)
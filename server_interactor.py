@@ -1,14 +1,24 @@
+import json
 import os
 import requests
 import time
 import threading
 import subprocess
-from shared_memory_util import write_data_to_shared_memory
+from http_client import CONNECT_TIMEOUT, get_client
+from poll_scheduler import PollScheduler
+from shared_memory_util import read_data_from_shared_memory, request_soft_reset, write_data_to_shared_memory, write_many
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Answers of a server without the push endpoints
+PUSH_UNSUPPORTED_STATUSES = (404, 405, 501)
+PUSH_RETRY_INTERVAL = 300.0  # seconds of polling before trying push again on such a server
+# Seconds the cycle gets to return to idle; longer than its slowest step
+# that cannot be interrupted, closing the door
+SOFT_RESET_TIMEOUT = 20.0
+
 class JobChecker(threading.Thread):
     def __init__(self):
         super().__init__()
@@ -17,17 +27,71 @@ class JobChecker(threading.Thread):
         
         # API configuration from environment variables
         self.api_base_url = os.getenv("API_BASE_URL")
-        self.api_url = f"{self.api_base_url}/device/checkjobs"
+        self.api_path = "/device/checkjobs"
         self.hub_id = os.getenv("HUB_ID")
         self.device_id = int(os.getenv("DEVICE_ID"))
         
         # Request configuration from environment variables
         self.request_timeout = int(os.getenv("REQUEST_TIMEOUT", 10))  # default to 10 if not set
         self.check_interval = int(os.getenv("CHECK_INTERVAL", 5))    # default to 5 if not set
+
+        # Polls every check_interval while idle, less often during a cycle
+        # and after errors, with jitter
+        self.scheduler = PollScheduler(idle_interval=self.check_interval)
+
+        # How jobs arrive: "longpoll" or "sse" push them within a request's
+        # latency and fall back to polling while the server lacks them;
+        # "poll" only polls
+        self.transport = os.getenv("JOB_TRANSPORT", "longpoll")
+        self.long_poll_wait = int(os.getenv("LONG_POLL_WAIT", 25))  # seconds the server may hold a request
+        self.push_retry_at = 0.0
+        self.last_job = {}  # deviceStatus and washModeValue as last received
+        self.http = get_client(self.api_base_url)
+
+        # Publish the hub this device reports as, for monitor.py
+        write_data_to_shared_memory("hub_id", self.hub_id or "")
         
+    def process_job(self, response_data):
+        """
+        Publish a job answer from any transport to shared memory.
+
+        Args:
+            response_data: Decoded JSON with deviceStatus and washModeValue
+        """
+        self.last_job = {
+            "deviceStatus": response_data.get('deviceStatus'),
+            "washModeValue": response_data.get('washModeValue'),
+        }
+        device_status_raw = response_data.get('deviceStatus', "0")
+        washModeValue = float(response_data.get('washModeValue', "0.0") or 0.0)
+
+        # Convert deviceStatus to float if numeric; else use 1000.0
+        try:
+            if device_status_raw.replace('.', '', 1).isdigit():
+                device_status = float(device_status_raw)
+            else:
+                device_status = 1000.0
+        except ValueError:
+            device_status = 1000.0
+
+        # Write to shared memory in one step so the cycle never sees a new
+        # command together with the previous mode
+        running = self.cycle_running()
+        write_many({
+            "command_from_server": device_status,
+            "command_mode_from_server": washModeValue,
+        })
+
+        # 1000 means no job; stop a cycle the server no longer runs
+        if device_status == 1000.0 and running:
+            self.reset_machine()
+
     def check_jobs(self):
         """
         Make API request to check for new jobs and update shared memory.
+
+        Returns:
+            True if the server answered
         """
         data = {
             "hubid": self.hub_id,
@@ -35,48 +99,137 @@ class JobChecker(threading.Thread):
         }
         
         try:
-            # Make API request with timeout
-            response = requests.post(
-                self.api_url,
+            # Make API request over the pooled connection; one quick retry,
+            # the next check is only check_interval away
+            response = self.http.post(
+                self.api_path,
                 json=data,
-                timeout=self.request_timeout
+                timeout=(CONNECT_TIMEOUT, self.request_timeout),
+                retries=1,
             )
             
             if response.status_code == 200:
-                # Process successful response
-                response_data = response.json()
-
-                device_status_raw = response_data.get('deviceStatus', "0")
-                washModeValue = float(response_data.get('washModeValue', "0.0") or 0.0)
-
-                # Convert deviceStatus to float if numeric; else use 1000.0
-                try:
-                    if device_status_raw.replace('.', '', 1).isdigit():
-                        device_status = float(device_status_raw)
-                    else:
-                        device_status = 1000.0
-                except ValueError:
-                    device_status = 1000.0
-
-                # Write to shared memory
-                write_data_to_shared_memory("command_from_server", device_status)
-                write_data_to_shared_memory("command_mode_from_server", washModeValue)
-
-                # Restart service if command is 1000
-                if device_status == 1000.0:
-                    subprocess.run(["sudo", "systemctl", "restart", "run_python_programs.service"])
+                self.process_job(response.json())
 
             elif response.status_code == 204:
                 # No job available
+                running = self.cycle_running()
                 write_data_to_shared_memory("command_from_server", 1000.0)
-                subprocess.run(["sudo", "systemctl", "restart", "run_python_programs.service"])
-                
+                if running:
+                    self.reset_machine()
+
+            return response.status_code < 500
+
         except requests.exceptions.RequestException:
-            pass
+            return False
         except ValueError:
-            pass
+            return False
         except Exception:
-            pass  # Fully silent for service mode
+            return False  # Fully silent for service mode
+
+    def push_unsupported(self, response):
+        """Fall back to polling for a while if the server lacks the push endpoint."""
+        if response.status_code in PUSH_UNSUPPORTED_STATUSES:
+            print(f"Server has no {self.transport} endpoint, polling for jobs")
+            self.push_retry_at = time.monotonic() + PUSH_RETRY_INTERVAL
+            return True
+        return False
+
+    def wait_for_jobs(self):
+        """
+        Long-poll: the server holds the request until the job differs from
+        last_job, or for long_poll_wait seconds.
+
+        Returns:
+            True if the server answered the long-poll, False to poll instead
+        """
+        previous = self.last_job
+        data = dict(previous, hubid=self.hub_id, deviceid=self.device_id, wait=self.long_poll_wait)
+        try:
+            response = self.http.post(
+                "/device/waitjobs",
+                json=data,
+                timeout=(CONNECT_TIMEOUT, self.long_poll_wait + self.request_timeout),
+                retries=0,
+            )
+            if self.push_unsupported(response):
+                return False
+            if response.status_code == 200:
+                self.process_job(response.json())
+                # A server that answers at once with the same job would make
+                # this spin; treat it like one without long-poll
+                return self.last_job != previous
+            return response.status_code == 204  # No change before the wait ran out
+        except Exception:
+            return False
+
+    def listen_for_jobs(self):
+        """
+        Server-sent events: read "job" events until the stream ends or stays
+        silent for long_poll_wait seconds; the server sends keepalive
+        comments more often than that.
+
+        Returns:
+            True if the stream was open, False to poll instead
+        """
+        params = {"hubid": self.hub_id, "deviceid": self.device_id}
+        try:
+            response = self.http.request(
+                "GET", "/device/jobevents",
+                params=params,
+                timeout=(CONNECT_TIMEOUT, self.long_poll_wait),
+                retries=0,
+                stream=True,
+            )
+        except Exception:
+            return False
+        with response:
+            if self.push_unsupported(response) or response.status_code != 200:
+                return False
+            event = None
+            data = []
+            try:
+                # chunk_size None hands over each chunk as it arrives
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    if self._stop_event.is_set():
+                        break
+                    if line.startswith("event:"):
+                        event = line[6:].strip()
+                    elif line.startswith("data:"):
+                        data.append(line[5:].strip())
+                    elif not line:
+                        # A blank line ends the event
+                        if event in (None, "job") and data:
+                            self.process_job(json.loads("\n".join(data)))
+                        event = None
+                        data = []
+            except Exception:
+                pass  # Dropped or silent stream; reconnect
+        return True
+
+    def reset_machine(self):
+        """
+        Return the machine to idle in place with a soft reset. Only if the
+        cycle does not report back is something stuck, and the services are
+        restarted.
+        """
+        if not request_soft_reset(SOFT_RESET_TIMEOUT):
+            print("Soft reset not acknowledged, restarting the services")
+            subprocess.run(["sudo", "systemctl", "restart", "run_python_programs.service"])
+
+    def cycle_running(self):
+        """Return True while a wash cycle is in progress (1000 means no job)"""
+        return read_data_from_shared_memory("command_from_server") < 1000.0
+
+    def schedule_next_poll(self, ok):
+        """Return the seconds until the next poll and publish the schedule to shared memory"""
+        interval = self.scheduler.next_interval(ok, busy=self.cycle_running())
+        write_many({
+            "poll_interval": interval,
+            "poll_errors": self.scheduler.errors,
+            "poll_errors_total": self.scheduler.total_errors,
+        })
+        return interval
 
     def stop(self):
         """Stop the job checker thread."""
@@ -84,10 +237,15 @@ class JobChecker(threading.Thread):
 
     def run(self):
         """Main thread execution loop."""
+        push = {"longpoll": self.wait_for_jobs, "sse": self.listen_for_jobs}.get(self.transport)
         try:
+            # Devices powered up together start at different moments
+            self._stop_event.wait(self.scheduler.first_delay())
             while not self._stop_event.is_set():
-                self.check_jobs()
-                time.sleep(self.check_interval)
+                if push and time.monotonic() >= self.push_retry_at and push():
+                    continue
+                ok = self.check_jobs()
+                self._stop_event.wait(self.schedule_next_poll(ok))
         except Exception:
             self.stop()
 
@@ -0,0 +1,119 @@
+import struct
+from collections import namedtuple
+
+# Bump SCHEMA_VERSION whenever a field is added, removed, reordered or retyped,
+# or the register file header changes, so processes built against the old
+# layout refuse to read the new one.
+# 1: typed fields; 2: generation and retired flag in the header;
+# 3: filtered tacho and pressure slots; 4: mains sync flag; 5: target RPM;
+# 6: door change time; 7: job polling schedule; 8: soft reset;
+# 9: calibrated litres in their own field
+SCHEMA_VERSION = 9
+SCHEMA_MAGIC = 0x514B5731  # "QKW1"
+
+# Struct codes and alignment of the supported field types; "bytes" fields
+# also need a length
+FIELD_TYPES = {
+    "int32": ('i', 4),
+    "int64": ('q', 8),
+    "float64": ('d', 8),
+    "bool": ('?', 1),
+    "bytes": ('s', 1),
+}
+
+Field = namedtuple("Field", ["name", "type", "default", "owner", "length", "durable"])
+
+def field(name, type, default, owner, length=0, durable=False):
+    """
+    Declare a register file field; length is only used by "bytes" fields.
+    Durable fields are also checkpointed to disk and restored after a restart.
+    """
+    if type not in FIELD_TYPES:
+        raise ValueError(f"Unknown type '{type}' for field '{name}'")
+    if type == "bytes" and length <= 0:
+        raise ValueError(f"Field '{name}' of type bytes needs a length")
+    return Field(name, type, default, owner, length, durable)
+
+# Every value in the register file. The owner is the component that writes it.
+FIELDS = [
+    field("relay_command", "int32", 14, "RelayController"),  # Last executed relay command
+    field("taccosensor", "float64", 0.0, "TachoSensorThread"),  # Raw
+    field("taccosensor_filtered", "float64", 0.0, "TachoSensorThread"),
+    field("doorssensor", "float64", 0.0, "SensorReader"),
+    field("Pressure", "float64", 0.0, "SensorReader"),  # Raw
+    field("Pressure_filtered", "float64", 0.0, "SensorReader"),
+    field("Water_Level", "float64", 0.0, "SensorReader"),  # Pressure frequency times 0.1
+    field("Water_Litres", "float64", -1.0, "SensorReader"),  # Only set once the level sensor is calibrated
+    field("Door_Status", "bool", False, "SensorReader"),  # Debounced
+    field("Door_Changed", "float64", 0.0, "SensorReader"),  # time.monotonic() of the last Door_Status change
+    # Written by SpeedController while target_rpm is above 0
+    field("triac_delay", "float64", 8000.0, "WashingMachineController"),
+    field("target_rpm", "float64", 0.0, "WashingMachineController"),  # 0 turns speed control off
+    field("mains_sync", "bool", False, "TriacController"),  # Zero-cross edges are arriving
+    # Cycle progress; 1000 means no job
+    field("command_from_server", "float64", 1000.0, "JobChecker", durable=True),
+    # 0 quick, 1 heavy, 1000 none
+    field("command_mode_from_server", "int32", 1000, "JobChecker", durable=True),
+    field("hub_id", "bytes", b"", "JobChecker", length=24),
+    field("poll_interval", "float64", 0.0, "JobChecker"),  # Seconds until the next poll for jobs
+    field("poll_errors", "int32", 0, "JobChecker"),  # Failed polls in a row
+    field("poll_errors_total", "int32", 0, "JobChecker"),
+    # Soft reset: JobChecker counts requests up, the cycle answers with the
+    # request it has returned to idle for
+    field("soft_reset", "int32", 0, "JobChecker"),
+    field("soft_reset_done", "int32", 0, "WashingMachineController"),
+]
+
+FIELD_NAMES = [f.name for f in FIELDS]
+FIELDS_BY_NAME = {f.name: f for f in FIELDS}
+DEFAULTS = {f.name: f.default for f in FIELDS}
+DURABLE_NAMES = [f.name for f in FIELDS if f.durable]
+
+def struct_code(f):
+    """Return the struct format code of a field."""
+    code = FIELD_TYPES[f.type][0]
+    return f"{f.length}{code}" if f.type == "bytes" else code
+
+def build_layout(start):
+    """
+    Lay the fields out after a header of start bytes, each naturally aligned.
+
+    Returns:
+        Tuple (offsets, values_struct, size): the offset of each field, a
+        struct.Struct that unpacks every field in FIELDS order when read at
+        the first field's offset, and the total size including the header
+    """
+    offsets = {}
+    layout_format = "<"
+    offset = start
+    first_offset = None
+    for f in FIELDS:
+        alignment = FIELD_TYPES[f.type][1]
+        padding = -offset % alignment
+        offset += padding
+        if first_offset is None:
+            first_offset = offset
+        elif padding:
+            layout_format += f"{padding}x"
+        offsets[f.name] = offset
+        layout_format += struct_code(f)
+        offset += struct.calcsize("<" + struct_code(f))
+    return offsets, struct.Struct(layout_format), offset
+
+def coerce(f, value):
+    """Convert value to the Python type stored for field f."""
+    if f.type in ("int32", "int64"):
+        return int(value)
+    if f.type == "float64":
+        return float(value)
+    if f.type == "bool":
+        return bool(value)
+    if isinstance(value, str):
+        value = value.encode()
+    return bytes(value)
+
+def decode(f, value):
+    """Convert a value unpacked from the register file for use by callers."""
+    if f.type == "bytes":
+        return value.rstrip(b"\0")
+    return value
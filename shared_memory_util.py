@@ -1,10 +1,181 @@
+import ctypes
+import ctypes.util
+import errno
 import mmap
+import os
+import platform
 import posix_ipc
 import struct
+import time
+import zlib
+from shared_memory_schema import (
+    DEFAULTS, DURABLE_NAMES, FIELD_NAMES, FIELDS, FIELDS_BY_NAME, SCHEMA_MAGIC, SCHEMA_VERSION,
+    build_layout, coerce, decode, struct_code,
+)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # A dictionary to store shared memory objects
 shared_memory_objects = {}
 
+# Prepended to the names of the segments and semaphores below, so test and
+# benchmark runs can use their own set without touching the live machine's
+SHM_PREFIX = os.getenv("SHM_PREFIX", "")
+
+# Register file: a single shared memory segment holding every machine value
+# in a fixed slot, mapped once per process. The fields and their types come
+# from shared_memory_schema.
+REGISTER_FILE_NAME = SHM_PREFIX + "machine_registers"
+REGISTER_NAMES = FIELD_NAMES
+
+# The header starts with the schema magic and version, so a process built
+# against another layout fails on open instead of decoding garbage.
+register_schema = struct.Struct('II')
+
+# Then a generation, seeded from the clock when the segment is created and
+# bumped whenever the owner reinitialises it, and a retired flag that is set
+# just before the segment is unlinked so that other processes reattach.
+register_counter = struct.Struct('I')
+REGISTER_GENERATION_OFFSET = register_schema.size
+REGISTER_RETIRED_OFFSET = REGISTER_GENERATION_OFFSET + register_counter.size
+
+# Next is a sequence counter (seqlock). Writers make it odd while they write
+# and even again when done, so readers can tell whether a read overlapped a
+# write and retry it.
+register_sequence = struct.Struct('I')
+REGISTER_SEQUENCE_OFFSET = REGISTER_RETIRED_OFFSET + register_counter.size
+
+# After the sequence counter come change counters: one bumped on every write,
+# then one per field. Waiters sleep on them with a futex until they move;
+# the any-change counter is only waited on where futex_waitv() is missing.
+REGISTER_ANY_CHANGE_OFFSET = REGISTER_SEQUENCE_OFFSET + register_sequence.size
+register_change_offsets = {
+    name: REGISTER_ANY_CHANGE_OFFSET + (index + 1) * register_counter.size
+    for index, name in enumerate(REGISTER_NAMES)
+}
+REGISTER_HEADER_SIZE = REGISTER_ANY_CHANGE_OFFSET + (len(REGISTER_NAMES) + 1) * register_counter.size
+
+# Field values follow the header, each naturally aligned
+register_offsets, register_values, REGISTER_FILE_SIZE = build_layout(REGISTER_HEADER_SIZE)
+REGISTER_VALUES_OFFSET = register_offsets[REGISTER_NAMES[0]]
+register_indexes = {name: index for index, name in enumerate(REGISTER_NAMES)}
+register_structs = {f.name: struct.Struct('<' + struct_code(f)) for f in FIELDS}
+
+# How long to wait for another process to finish creating the register file
+REGISTER_OPEN_TIMEOUT = 1.0  # seconds
+
+# How often to check whether a segment was replaced behind this process's
+# back. Every replacement made through this module marks the old segment
+# retired first, which is checked on each access; the check only catches
+# segments unlinked from outside, e.g. with rm.
+REATTACH_CHECK_INTERVAL = 1.0  # seconds
+SHM_DIRECTORY = "/dev/shm"
+
+# Legacy per-name segments outside the register file hold one 4-byte float
+register_slot = struct.Struct('f')
+
+# How often a reader retries a snapshot that overlapped a write, and how long
+# it sleeps between the later retries, before it locks writers out to read
+SNAPSHOT_RETRIES = 100
+SNAPSHOT_SPINS = 10  # retries without sleeping
+SNAPSHOT_BACKOFF = 0.0001  # seconds
+
+# Mapping of the register file, created on first access
+_register_file = None
+
+# ctypes view of the mapping, used to hand counter addresses to futex()
+_register_buffer = None
+
+# Inode of the mapped register file and when it was last compared to /dev/shm
+_register_inode = None
+_register_checked_at = 0.0
+
+# futex() syscall numbers; other platforms fall back to polling
+FUTEX_SYSCALLS = {
+    "x86_64": 202,
+    "aarch64": 98,
+    "armv6l": 240,
+    "armv7l": 240,
+}
+FUTEX_WAIT = 0
+FUTEX_WAKE = 1
+FUTEX_POLL_INTERVAL = 0.01  # seconds, only used without futex support
+
+# futex_waitv() sleeps on several counters at once (Linux 5.16+); its
+# syscall number is the same on every architecture
+FUTEX_WAITV_SYSCALL = 449
+FUTEX_WAITV_MAX = 128  # counters per call
+FUTEX2_SIZE_U32 = 0x02
+CLOCK_MONOTONIC = 1  # The clock of time.monotonic()
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+_futex_syscall = FUTEX_SYSCALLS.get(platform.machine())
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+class _FutexWaitv(ctypes.Structure):
+    _fields_ = [
+        ("val", ctypes.c_uint64),
+        ("uaddr", ctypes.c_uint64),
+        ("flags", ctypes.c_uint32),
+        ("reserved", ctypes.c_uint32),
+    ]
+
+# Cleared once the kernel refuses futex_waitv()
+_futex_waitv_supported = _futex_syscall is not None
+
+# Writers in every process are serialised by a named semaphore, held only
+# for the write itself. It is never unlinked, so processes that reattach to
+# a recreated register file keep sharing one lock.
+REGISTER_WRITE_LOCK_NAME = SHM_PREFIX + "machine_registers_write_lock"
+REGISTER_WRITE_LOCK_TIMEOUT = 1.0  # seconds
+
+# Writer lock of the register file, opened on first access
+_register_write_lock = None
+
+# Relay command queue: a bounded ring buffer in its own segment. The header
+# holds the head (commands pushed) and tail (commands acknowledged) counters;
+# a command's sequence number is the head value after it was pushed.
+RELAY_QUEUE_NAME = SHM_PREFIX + "relay_command_queue"
+RELAY_QUEUE_LOCK_NAME = SHM_PREFIX + "relay_command_queue_lock"
+RELAY_QUEUE_CAPACITY = 32
+RELAY_QUEUE_LOCK_TIMEOUT = 1.0  # seconds
+relay_queue_header = struct.Struct('II')
+relay_queue_counter = struct.Struct('I')
+relay_queue_entry = struct.Struct('If')
+RELAY_QUEUE_HEAD_OFFSET = 0
+RELAY_QUEUE_TAIL_OFFSET = relay_queue_counter.size
+RELAY_QUEUE_SIZE = relay_queue_header.size + RELAY_QUEUE_CAPACITY * relay_queue_entry.size
+
+# Mapping, ctypes view and producer lock of the relay queue, created on first access
+_relay_queue = None
+_relay_queue_buffer = None
+_relay_queue_lock = None
+
+# Inode of the mapped relay queue and when it was last compared to /dev/shm
+_relay_queue_inode = None
+_relay_queue_checked_at = 0.0
+
+# Sensor history: one ring buffer segment per sensor, named "<name>_history".
+# Each sample is stored twice, at i and i + capacity, so that any window of
+# samples is contiguous and can be handed out as a zero-copy memoryview.
+HISTORY_NAMES = ["taccosensor", "Pressure", "Water_Level"]
+HISTORY_CAPACITY = 1024  # samples, must be a power of two
+history_header = struct.Struct('II')  # samples written, capacity
+history_counter = struct.Struct('I')
+history_sample = struct.Struct('dd')  # time.monotonic() timestamp, value
+HISTORY_SAMPLE_DTYPE = [("time", "f8"), ("value", "f8")]
+
+# Sensor histories opened in this process
+_sensor_histories = {}
+
+# Mappings of the legacy per-name segments, kept open between accesses
+_legacy_mappings = {}
+
 def create_shared_memory(name, size):
     """
     Create shared memory object for the given name and size (in bytes).
@@ -17,42 +188,1027 @@ def create_shared_memory(name, size):
     except posix_ipc.ExistentialError:
         # If it exists, just open it
         shm = posix_ipc.SharedMemory(name)
+        if shm.size < size:
+            # Grow a segment left behind smaller than requested, never shrink one
+            shm.close_fd()
+            shm = posix_ipc.SharedMemory(name, flags=posix_ipc.O_CREAT, size=size)
         shared_memory_objects[name] = shm
 
     return shm
 
+def _segment_inode(name):
+    """Return the inode currently linked under name in /dev/shm, or None."""
+    try:
+        return os.stat(os.path.join(SHM_DIRECTORY, name.lstrip("/"))).st_ino
+    except FileNotFoundError:
+        return None
+
+def _wait_for_register_header(shm):
+    """Wait until the creator of the register file has sized and stamped it."""
+    deadline = time.monotonic() + REGISTER_OPEN_TIMEOUT
+    while True:
+        size = os.fstat(shm.fd).st_size
+        if size >= register_schema.size:
+            with mmap.mmap(shm.fd, register_schema.size, access=mmap.ACCESS_READ) as header:
+                magic, version = register_schema.unpack_from(header, 0)
+            if magic != 0 or time.monotonic() > deadline:
+                return size, magic, version
+        elif time.monotonic() > deadline:
+            return size, 0, 0
+        time.sleep(0.001)
+
+def _write_defaults(mem):
+    """Fill every field with its schema default."""
+    values = [coerce(f, f.default) for f in FIELDS]
+    register_values.pack_into(mem, REGISTER_VALUES_OFFSET, *values)
+
+def _register_file_replaced():
+    """Return True if the mapped register file was retired or unlinked."""
+    global _register_checked_at
+    if register_counter.unpack_from(_register_file, REGISTER_RETIRED_OFFSET)[0]:
+        return True
+    now = time.monotonic()
+    if now - _register_checked_at < REATTACH_CHECK_INTERVAL:
+        return False
+    _register_checked_at = now
+    return _segment_inode(REGISTER_FILE_NAME) != _register_inode
+
+def _detach_register_file():
+    """
+    Forget this process's mapping of the register file.
+
+    The mapping is not closed, because other threads may still be reading
+    or waiting on it; it is released once they drop their references.
+    """
+    global _register_file, _register_buffer
+    _register_file = None
+    _register_buffer = None
+    shared_memory_objects.pop(REGISTER_FILE_NAME, None)
+
+def _retire_register_file():
+    """Mark the mapped register file as retired and wake its waiters, before it is unlinked."""
+    register_counter.pack_into(_register_file, REGISTER_RETIRED_OFFSET, 1)
+    _futex_wake(_register_buffer, REGISTER_ANY_CHANGE_OFFSET)
+    for offset in register_change_offsets.values():
+        _futex_wake(_register_buffer, offset)
+
+def open_register_file(replace_incompatible=False):
+    """
+    Map the register file into this process and return the mapping.
+    The segment is created if needed and mapped only once per process.
+
+    If the segment has been retired or replaced since it was mapped, the new
+    one is mapped instead, so processes reattach on their next access.
+
+    Args:
+        replace_incompatible: Unlink and recreate a register file written
+            with another schema instead of raising (for the owning manager)
+
+    Raises:
+        RuntimeError: If the existing register file uses another schema
+    """
+    global _register_file, _register_buffer, _register_inode, _register_checked_at
+    global _register_write_lock
+    if _register_write_lock is None:
+        _register_write_lock = posix_ipc.Semaphore(
+            REGISTER_WRITE_LOCK_NAME, flags=posix_ipc.O_CREAT, initial_value=1
+        )
+    if _register_file is not None and _register_file_replaced():
+        print(f"Shared memory '{REGISTER_FILE_NAME}' was replaced, reattaching")
+        _detach_register_file()
+
+    if _register_file is None:
+        try:
+            shm = posix_ipc.SharedMemory(
+                REGISTER_FILE_NAME, flags=posix_ipc.O_CREX, size=REGISTER_FILE_SIZE
+            )
+            created = True
+        except posix_ipc.ExistentialError:
+            shm = posix_ipc.SharedMemory(REGISTER_FILE_NAME)
+            created = False
+
+        if not created:
+            size, magic, version = _wait_for_register_header(shm)
+            if (magic, version, size) != (SCHEMA_MAGIC, SCHEMA_VERSION, REGISTER_FILE_SIZE):
+                if not replace_incompatible:
+                    shm.close_fd()
+                    raise RuntimeError(
+                        f"Shared memory '{REGISTER_FILE_NAME}' has schema version {version} "
+                        f"(magic {magic:#x}, {size} bytes), expected version {SCHEMA_VERSION} "
+                        f"({REGISTER_FILE_SIZE} bytes)"
+                    )
+                print(f"Replacing shared memory '{REGISTER_FILE_NAME}' with schema version {SCHEMA_VERSION}")
+                if size >= REGISTER_RETIRED_OFFSET + register_counter.size:
+                    # The header layout is shared by all versions; retire the
+                    # old file so processes still mapping it reattach at once
+                    with mmap.mmap(shm.fd, size) as old_file:
+                        register_counter.pack_into(old_file, REGISTER_RETIRED_OFFSET, 1)
+                shm.close_fd()
+                shm.unlink()
+                return open_register_file()
+
+        shared_memory_objects[REGISTER_FILE_NAME] = shm
+        _register_file = mmap.mmap(shm.fd, REGISTER_FILE_SIZE)
+        _register_buffer = ctypes.c_char.from_buffer(_register_file)
+        _register_inode = os.fstat(shm.fd).st_ino
+        _register_checked_at = time.monotonic()
+        shm.close_fd()  # The mapping stays valid without the descriptor
+
+        if created:
+            # Stamp the schema last so openers only see a fully initialised file
+            _write_defaults(_register_file)
+            register_counter.pack_into(
+                _register_file, REGISTER_GENERATION_OFFSET, int(time.time()) & 0xFFFFFFFF
+            )
+            register_schema.pack_into(_register_file, 0, SCHEMA_MAGIC, SCHEMA_VERSION)
+    return _register_file
+
+def read_generation():
+    """
+    Return the register file generation.
+
+    It changes whenever the segment is recreated or its owner reinitialises
+    it, so a process can tell that the state it cached is from before a restart.
+    """
+    return register_counter.unpack_from(open_register_file(), REGISTER_GENERATION_OFFSET)[0]
+
+def recreate_register_file():
+    """
+    Replace the register file with a fresh one holding the schema defaults.
+
+    Other processes notice the retired flag and reattach on their next access.
+    """
+    open_register_file()
+    _retire_register_file()
+    try:
+        posix_ipc.unlink_shared_memory(REGISTER_FILE_NAME)
+    except posix_ipc.ExistentialError:
+        pass  # Already unlinked by another process
+    _detach_register_file()
+    return open_register_file()
+
+def _futex_wait(buffer, offset, expected, timeout):
+    """Sleep while the counter at offset in buffer still holds expected, for at most timeout seconds."""
+    if _futex_syscall is None:
+        time.sleep(min(timeout, FUTEX_POLL_INTERVAL))
+        return
+    seconds = int(timeout)
+    timespec = _Timespec(seconds, int((timeout - seconds) * 1_000_000_000))
+    # Returns early with EAGAIN if the counter already moved, or EINTR on signals;
+    # callers re-check the counter either way
+    _libc.syscall(
+        _futex_syscall,
+        ctypes.c_void_p(ctypes.addressof(buffer) + offset),
+        FUTEX_WAIT,
+        ctypes.c_uint32(expected),
+        ctypes.byref(timespec),
+        None,
+        0,
+    )
+
+def _futex_waitv(buffer, offsets, expected, timeout):
+    """
+    Sleep while every counter at offsets in buffer still holds its expected
+    value, for at most timeout seconds.
+
+    Returns:
+        False if futex_waitv() is not available and nothing was waited for
+    """
+    global _futex_waitv_supported
+    if not _futex_waitv_supported or len(offsets) > FUTEX_WAITV_MAX:
+        return False
+    address = ctypes.addressof(buffer)
+    waiters = (_FutexWaitv * len(offsets))(*[
+        _FutexWaitv(value, address + offset, FUTEX2_SIZE_U32, 0)
+        for offset, value in zip(offsets, expected)
+    ])
+    # The timeout is absolute
+    deadline = time.monotonic() + timeout
+    seconds = int(deadline)
+    timespec = _Timespec(seconds, int((deadline - seconds) * 1_000_000_000))
+    # Returns early with EAGAIN if a counter already moved, or EINTR on signals;
+    # callers re-check the counters either way
+    result = _libc.syscall(
+        FUTEX_WAITV_SYSCALL, waiters, len(offsets), 0, ctypes.byref(timespec), CLOCK_MONOTONIC
+    )
+    if result == -1 and ctypes.get_errno() in (errno.ENOSYS, errno.EPERM):
+        _futex_waitv_supported = False  # Older kernel, or blocked by seccomp
+        return False
+    return True
+
+def _futex_wake(buffer, offset):
+    """Wake every process waiting on the counter at offset in buffer."""
+    if _futex_syscall is not None:
+        _libc.syscall(
+            _futex_syscall,
+            ctypes.c_void_p(ctypes.addressof(buffer) + offset),
+            FUTEX_WAKE,
+            0x7FFFFFFF,
+            None,
+            None,
+            0,
+        )
+
+def _legacy_mapping(name):
+    """Return a cached mapping of a per-name segment outside the register file."""
+    mem = _legacy_mappings.get(name)
+    if mem is None:
+        # Get the shared memory object by name
+        shm = shared_memory_objects.get(name)
+        if not shm:
+            # If the shared memory object is not already created, create it
+            shm = create_shared_memory(name, 4)
+        mem = mmap.mmap(shm.fd, shm.size)
+        _legacy_mappings[name] = mem
+    return mem
+
+def _lock_register_writes():
+    """Take the writer lock of the register file; release with _unlock_register_writes()."""
+    try:
+        _register_write_lock.acquire(REGISTER_WRITE_LOCK_TIMEOUT)
+    except posix_ipc.BusyError:
+        # A write holds the lock for microseconds, so its holder died mid-write;
+        # take the lock over, the release makes it usable again
+        print(f"Recovering register file write lock '{REGISTER_WRITE_LOCK_NAME}'")
+
+def _unlock_register_writes():
+    """Release the writer lock taken by _lock_register_writes()."""
+    _register_write_lock.release()
+    # Undo an extra release if the holder was only slow, not dead
+    while _register_write_lock.value > 1:
+        _register_write_lock.acquire(0)
+
+def _begin_register_write(mem):
+    """
+    Make the sequence counter odd and return its even starting value.
+    The caller must hold the writer lock.
+    """
+    sequence = register_sequence.unpack_from(mem, REGISTER_SEQUENCE_OFFSET)[0]
+    # Under the writer lock an odd counter means a writer died mid-write;
+    # start from the next even value
+    sequence = (sequence + (sequence & 1)) & 0xFFFFFFFF
+    register_sequence.pack_into(mem, REGISTER_SEQUENCE_OFFSET, sequence + 1)
+    return sequence
+
+def _end_register_write(mem, sequence):
+    """Make the sequence counter even again after a write."""
+    register_sequence.pack_into(mem, REGISTER_SEQUENCE_OFFSET, (sequence + 2) & 0xFFFFFFFF)
+
+def _read_consistent(read, mem, argument):
+    """Run read(mem, argument) until no write overlapped it, and return its result."""
+    for attempt in range(SNAPSHOT_RETRIES):
+        sequence = register_sequence.unpack_from(mem, REGISTER_SEQUENCE_OFFSET)[0]
+        if not sequence & 1:  # Odd while a write is in progress
+            values = read(mem, argument)
+            if register_sequence.unpack_from(mem, REGISTER_SEQUENCE_OFFSET)[0] == sequence:
+                return values
+        # Give the writer time to finish
+        time.sleep(0 if attempt < SNAPSHOT_SPINS else SNAPSHOT_BACKOFF)
+    # Writers kept the register file busy, or one died mid-write and left the
+    # counter odd; read with the writers locked out instead
+    _lock_register_writes()
+    try:
+        return read(mem, argument)
+    finally:
+        _unlock_register_writes()
+
+def _bump_change_counter(mem, offset):
+    """Advance the change counter at offset."""
+    count = register_counter.unpack_from(mem, offset)[0]
+    register_counter.pack_into(mem, offset, (count + 1) & 0xFFFFFFFF)
+
 def write_data_to_shared_memory(name, data):
     """
     Write data to shared memory using the given name.
     Data will be packed into bytes before writing.
     """
-    # Get the shared memory object by name
-    shm = shared_memory_objects.get(name)
-    if not shm:
-        # If the shared memory object is not already created, create it
-        shm = create_shared_memory(name, 4)
-
-    byte_data = struct.pack('f', data)  # Pack data as a float
-    with mmap.mmap(shm.fd, shm.size) as mem:
-        mem.seek(0)  # Seek to the start of shared memory
-        mem.write(byte_data)
+    offset = register_offsets.get(name)
+    if offset is not None:
+        mem = open_register_file()
+        change_offset = register_change_offsets[name]
+        value = coerce(FIELDS_BY_NAME[name], data)
+        _lock_register_writes()
+        try:
+            sequence = _begin_register_write(mem)
+            register_structs[name].pack_into(mem, offset, value)
+            # The slot counter moves before the any-change counter so that
+            # select-style waiters never miss it
+            _bump_change_counter(mem, change_offset)
+            _bump_change_counter(mem, REGISTER_ANY_CHANGE_OFFSET)
+            _end_register_write(mem, sequence)
+        finally:
+            _unlock_register_writes()
+        _futex_wake(_register_buffer, change_offset)
+        _futex_wake(_register_buffer, REGISTER_ANY_CHANGE_OFFSET)
+    else:
+        register_slot.pack_into(_legacy_mapping(name), 0, data)
 
 def read_data_from_shared_memory(name):
     """
     Read data from shared memory using the given name.
-    It assumes the data is packed as a float.
+    Register file values have their schema type; other names are read as a float.
+    """
+    offset = register_offsets.get(name)
+    if offset is not None:
+        value = _read_consistent(register_structs[name].unpack_from, open_register_file(), offset)[0]
+        return decode(FIELDS_BY_NAME[name], value)
+    return register_slot.unpack_from(_legacy_mapping(name), 0)[0]
+
+class _BulkPlan:
+    """
+    Precompiled layout for moving a fixed set of fields in bulk.
+
+    Fields that sit next to each other in the register file are merged into
+    one range, so each range costs a single pack_into/unpack_from.
+    """
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.ranges = []  # (offset, struct.Struct, field names in the range)
+        indexes = sorted({register_indexes[name] for name in self.names})
+        group = []
+        for index in indexes:
+            if group and index != group[-1] + 1:
+                self.ranges.append(self._compile_range(group))
+                group = []
+            group.append(index)
+        if group:
+            self.ranges.append(self._compile_range(group))
+
+        # Position of each requested name in the flattened range values
+        flattened = [name for _, _, range_names in self.ranges for name in range_names]
+        self.order = [flattened.index(name) for name in self.names]
+        self.bytes_positions = {
+            position for position, name in enumerate(self.names)
+            if FIELDS_BY_NAME[name].type == "bytes"
+        }
+        self.change_offsets = [register_change_offsets[name] for name in flattened]
+
+    @staticmethod
+    def _compile_range(indexes):
+        """Return (offset, struct, names) for consecutive field indexes."""
+        fields = [FIELDS[index] for index in indexes]
+        start = register_offsets[fields[0].name]
+        range_format = "<"
+        end = start
+        for f in fields:
+            padding = register_offsets[f.name] - end
+            if padding:
+                range_format += f"{padding}x"
+            range_format += struct_code(f)
+            end = register_offsets[f.name] + register_structs[f.name].size
+        return start, struct.Struct(range_format), [f.name for f in fields]
+
+    def unpack(self, mem, _=None):
+        """Return the raw values of all ranges, flattened in register file order."""
+        if len(self.ranges) == 1:
+            offset, range_struct, _ = self.ranges[0]
+            return range_struct.unpack_from(mem, offset)
+        values = ()
+        for offset, range_struct, _ in self.ranges:
+            values += range_struct.unpack_from(mem, offset)
+        return values
+
+    def pack(self, mem, mapping):
+        """Write the values of mapping into every range."""
+        for offset, range_struct, range_names in self.ranges:
+            range_struct.pack_into(
+                mem, offset,
+                *[coerce(FIELDS_BY_NAME[name], mapping[name]) for name in range_names]
+            )
+
+# Bulk plans by the tuple of names they move
+_bulk_plans = {}
+
+def _bulk_plan(names):
+    """Return the cached _BulkPlan for names."""
+    key = tuple(names)
+    plan = _bulk_plans.get(key)
+    if plan is None:
+        plan = _BulkPlan(key)
+        _bulk_plans[key] = plan
+    return plan
+
+def read_many(names):
+    """
+    Read several register file values with one unpack per contiguous range.
+
+    The read is seqlock-consistent like read_snapshot().
+
+    Args:
+        names: Register names to read, in the order they are returned
+
+    Returns:
+        Tuple of values, typed as in the schema
+    """
+    plan = _bulk_plan(names)
+    flattened = _read_consistent(plan.unpack, open_register_file(), None)
+    values = [flattened[position] for position in plan.order]
+    for position in plan.bytes_positions:
+        values[position] = values[position].rstrip(b"\0")
+    return tuple(values)
+
+def write_many(mapping):
+    """
+    Write several register file values in one critical section.
+
+    Readers see either none or all of the new values, and every written
+    field counts as changed for wait_for_change().
+
+    Args:
+        mapping: Dictionary of register name to value
+    """
+    plan = _bulk_plan(mapping)
+    mem = open_register_file()
+    _lock_register_writes()
+    try:
+        sequence = _begin_register_write(mem)
+        plan.pack(mem, mapping)
+        for offset in plan.change_offsets:
+            _bump_change_counter(mem, offset)
+        _bump_change_counter(mem, REGISTER_ANY_CHANGE_OFFSET)
+        _end_register_write(mem, sequence)
+    finally:
+        _unlock_register_writes()
+    for offset in plan.change_offsets:
+        _futex_wake(_register_buffer, offset)
+    _futex_wake(_register_buffer, REGISTER_ANY_CHANGE_OFFSET)
+
+def read_snapshot(names=None):
+    """
+    Read several register file values as one consistent tuple.
+
+    The values are read without taking a lock; if a writer changed the
+    register file during the read, the read is retried. Only a reader that
+    kept overlapping writes takes the writer lock, so it never returns a
+    torn snapshot.
+
+    Args:
+        names: Register names to return, in order (default: all of REGISTER_NAMES)
+
+    Returns:
+        Tuple of values, typed as in the schema
+    """
+    return read_many(REGISTER_NAMES if names is None else names)
+
+def initialize_registers():
+    """
+    Reset every register file field to its schema default in one write,
+    and bump the generation so other processes can tell the owner restarted.
     """
-    # Get the shared memory object by name
-    shm = shared_memory_objects.get(name)
-    if not shm:
-        # If the shared memory object is not already created, create it
-        shm = create_shared_memory(name, 4)
+    mem = open_register_file()
+    generation = register_counter.unpack_from(mem, REGISTER_GENERATION_OFFSET)[0]
+    register_counter.pack_into(mem, REGISTER_GENERATION_OFFSET, (generation + 1) & 0xFFFFFFFF)
+    write_many(DEFAULTS)
 
-    with mmap.mmap(shm.fd, shm.size) as mem:
-        mem.seek(0)  # Seek to the start of shared memory
-        byte_data = mem.read(4)  # Read 4 bytes
-        data = struct.unpack('f', byte_data)[0]  # Unpack as a float
-        return data
+def read_change_count(name):
+    """Return how often the named register has been written, as a 32-bit counter."""
+    return register_counter.unpack_from(open_register_file(), register_change_offsets[name])[0]
+
+def read_change_counts(names):
+    """Return a dictionary with the change count of each named register."""
+    return {name: read_change_count(name) for name in names}
+
+def _remaining(deadline):
+    """Return the seconds left until deadline, or one poll period without a deadline."""
+    if deadline is None:
+        return 1.0
+    return deadline - time.monotonic()
+
+def wait_for_change(name, timeout=None, since=None):
+    """
+    Block until the named register is written.
+
+    Every write counts as a change, even one that stores the same value,
+    so repeated commands are not missed.
+
+    Args:
+        name: Register name
+        timeout: Maximum time to wait in seconds (None waits forever)
+        since: Change count to compare against, as returned by read_change_count()
+               or a previous wait; defaults to the count when the call starts
+
+    Returns:
+        The change count after the wait; equal to since if the wait timed out
+    """
+    mem = open_register_file()
+    buffer = _register_buffer
+    offset = register_change_offsets[name]
+    if since is None:
+        since = register_counter.unpack_from(mem, offset)[0]
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    while True:
+        if open_register_file() is not mem:
+            # Reattached to a new register file; its counters start afresh
+            return read_change_count(name)
+        count = register_counter.unpack_from(mem, offset)[0]
+        remaining = _remaining(deadline)
+        if count != since or remaining <= 0:
+            return count
+        _futex_wait(buffer, offset, since, remaining)
+
+def wait_for_any_change(names, timeout=None, since=None):
+    """
+    Block until at least one of the named registers is written, like select().
+
+    Only writes to the named registers wake the caller: it sleeps on their
+    change counters with futex_waitv(). Kernels without it fall back to the
+    counter every write bumps.
+
+    Args:
+        names: Register names to watch
+        timeout: Maximum time to wait in seconds (None waits forever)
+        since: Dictionary of change counts to compare against, as returned by
+               read_change_counts() or a previous wait; defaults to the counts
+               when the call starts
+
+    Returns:
+        Tuple (changed_names, counts): the names written since the given
+        counts (empty on timeout) and the current counts of all names
+    """
+    mem = open_register_file()
+    buffer = _register_buffer
+    if since is None:
+        since = read_change_counts(names)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    offsets = [register_change_offsets[name] for name in names]
+
+    while True:
+        # Read the any-change counter first so a write that lands after the
+        # checks below makes the futex wait return at once
+        any_count = register_counter.unpack_from(mem, REGISTER_ANY_CHANGE_OFFSET)[0]
+        counts = read_change_counts(names)
+        if open_register_file() is not mem:
+            # Reattached to a new register file; report every name as changed
+            return list(names), counts
+        changed = [name for name in names if counts[name] != since[name]]
+        remaining = _remaining(deadline)
+        if changed or remaining <= 0:
+            return changed, counts
+        if not _futex_waitv(buffer, offsets, [counts[name] for name in names], remaining):
+            _futex_wait(buffer, REGISTER_ANY_CHANGE_OFFSET, any_count, remaining)
+
+def open_relay_queue():
+    """
+    Map the relay command queue into this process and return the mapping.
+    The segment and its producer lock are created if needed.
+    """
+    global _relay_queue, _relay_queue_buffer, _relay_queue_lock
+    global _relay_queue_inode, _relay_queue_checked_at
+    if _relay_queue is not None and time.monotonic() - _relay_queue_checked_at >= REATTACH_CHECK_INTERVAL:
+        _relay_queue_checked_at = time.monotonic()
+        if _segment_inode(RELAY_QUEUE_NAME) != _relay_queue_inode:
+            # The queue was unlinked or recreated; reattach like open_register_file()
+            print(f"Shared memory '{RELAY_QUEUE_NAME}' was replaced, reattaching")
+            _relay_queue = None
+            _relay_queue_buffer = None
+
+    if _relay_queue is None:
+        shm = posix_ipc.SharedMemory(
+            RELAY_QUEUE_NAME, flags=posix_ipc.O_CREAT, size=RELAY_QUEUE_SIZE
+        )
+        shared_memory_objects[RELAY_QUEUE_NAME] = shm
+        _relay_queue = mmap.mmap(shm.fd, RELAY_QUEUE_SIZE)
+        _relay_queue_buffer = ctypes.c_char.from_buffer(_relay_queue)
+        _relay_queue_inode = os.fstat(shm.fd).st_ino
+        _relay_queue_checked_at = time.monotonic()
+        shm.close_fd()
+    if _relay_queue_lock is None:
+        _relay_queue_lock = posix_ipc.Semaphore(
+            RELAY_QUEUE_LOCK_NAME, flags=posix_ipc.O_CREAT, initial_value=1
+        )
+    return _relay_queue
+
+def _sequence_reached(counter, sequence):
+    """Return True if a wrapping 32-bit counter has reached sequence."""
+    return ((counter - sequence) & 0xFFFFFFFF) < 0x80000000
+
+def _lock_relay_queue():
+    """Take the producer lock of the relay queue; release with _unlock_relay_queue()."""
+    try:
+        _relay_queue_lock.acquire(RELAY_QUEUE_LOCK_TIMEOUT)
+    except posix_ipc.BusyError:
+        # A push holds the lock for microseconds, so its holder died mid-push;
+        # take the lock over, the release makes it usable again
+        print(f"Recovering relay command queue lock '{RELAY_QUEUE_LOCK_NAME}'")
+
+def _unlock_relay_queue():
+    """Release the producer lock taken by _lock_relay_queue()."""
+    _relay_queue_lock.release()
+    # Undo an extra release if the holder was only slow, not dead
+    while _relay_queue_lock.value > 1:
+        _relay_queue_lock.acquire(0)
+
+def push_relay_command(command, timeout=None):
+    """
+    Append a relay command to the queue without overwriting earlier ones.
+
+    Several producers may push at once; they are serialised by a named
+    semaphore held only for the push itself, never while waiting for room.
+
+    Args:
+        command: Relay command value (see RelayController.command_map)
+        timeout: Maximum time to wait for room if the queue is full (None waits forever)
+
+    Returns:
+        Sequence number of the command, for wait_for_relay_ack()
+
+    Raises:
+        RuntimeError: If the queue stayed full for timeout seconds
+    """
+    mem = open_relay_queue()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        _lock_relay_queue()
+        try:
+            head, tail = relay_queue_header.unpack_from(mem, 0)
+            if ((head - tail) & 0xFFFFFFFF) < RELAY_QUEUE_CAPACITY:
+                sequence = (head + 1) & 0xFFFFFFFF
+                entry_offset = relay_queue_header.size + (head % RELAY_QUEUE_CAPACITY) * relay_queue_entry.size
+                relay_queue_entry.pack_into(mem, entry_offset, sequence, command)
+                # Publishing the new head makes the entry visible to the consumer
+                relay_queue_counter.pack_into(mem, RELAY_QUEUE_HEAD_OFFSET, sequence)
+                break
+        finally:
+            _unlock_relay_queue()
+        # The queue is full: wait for the consumer with the lock released, so
+        # other producers do not take this one for dead, then check again
+        remaining = _remaining(deadline)
+        if remaining <= 0:
+            raise RuntimeError("Relay command queue is full")
+        _futex_wait(_relay_queue_buffer, RELAY_QUEUE_TAIL_OFFSET, tail, remaining)
+
+    _futex_wake(_relay_queue_buffer, RELAY_QUEUE_HEAD_OFFSET)
+    return sequence
+
+def clear_relay_queue():
+    """
+    Drop the relay commands nobody has executed yet, so a restarted
+    RelayController does not replay commands of a cycle that is gone.
+    """
+    mem = open_relay_queue()
+    _lock_relay_queue()
+    try:
+        tail = relay_queue_counter.unpack_from(mem, RELAY_QUEUE_TAIL_OFFSET)[0]
+        relay_queue_counter.pack_into(mem, RELAY_QUEUE_HEAD_OFFSET, tail)
+    finally:
+        _unlock_relay_queue()
+    _futex_wake(_relay_queue_buffer, RELAY_QUEUE_TAIL_OFFSET)
+
+def pop_relay_command(timeout=None):
+    """
+    Return the oldest unacknowledged relay command, waiting for one if needed.
+
+    Only one consumer (RelayController) may pop. The command stays queued
+    until it is passed to ack_relay_command().
+
+    Args:
+        timeout: Maximum time to wait in seconds (None waits forever)
+
+    Returns:
+        Tuple (sequence, command), or None if the wait timed out
+    """
+    mem = open_relay_queue()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        head, tail = relay_queue_header.unpack_from(mem, 0)
+        if head != tail:
+            entry_offset = relay_queue_header.size + (tail % RELAY_QUEUE_CAPACITY) * relay_queue_entry.size
+            return relay_queue_entry.unpack_from(mem, entry_offset)
+        remaining = _remaining(deadline)
+        if remaining <= 0:
+            return None
+        _futex_wait(_relay_queue_buffer, RELAY_QUEUE_HEAD_OFFSET, head, remaining)
+
+def ack_relay_command(sequence):
+    """Acknowledge the relay command with the given sequence number and free its slot."""
+    mem = open_relay_queue()
+    relay_queue_counter.pack_into(mem, RELAY_QUEUE_TAIL_OFFSET, sequence)
+    _futex_wake(_relay_queue_buffer, RELAY_QUEUE_TAIL_OFFSET)
+
+def wait_for_relay_ack(sequence, timeout=None):
+    """
+    Block until the relay command with the given sequence number is acknowledged.
+
+    Args:
+        sequence: Sequence number returned by push_relay_command()
+        timeout: Maximum time to wait in seconds (None waits forever)
+
+    Returns:
+        True if the command was acknowledged, False on timeout
+    """
+    mem = open_relay_queue()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        tail = relay_queue_counter.unpack_from(mem, RELAY_QUEUE_TAIL_OFFSET)[0]
+        if _sequence_reached(tail, sequence):
+            return True
+        remaining = _remaining(deadline)
+        if remaining <= 0:
+            return False
+        _futex_wait(_relay_queue_buffer, RELAY_QUEUE_TAIL_OFFSET, tail, remaining)
+
+def door_latched_status():
+    """
+    Return the Door_Status the door switch reports while the door is closed
+    and latched, from DOOR_LATCHED_LEVEL (GPIO level 1 or 0), or None if it
+    is not set. The polarity differs between machines, so without the
+    setting no Door_Status counts as a confirmed latch.
+
+    Raises:
+        ValueError: If DOOR_LATCHED_LEVEL is neither 1 nor 0
+    """
+    level = os.getenv("DOOR_LATCHED_LEVEL", "").strip()
+    if level not in ("", "0", "1"):
+        raise ValueError(f"DOOR_LATCHED_LEVEL must be 1 or 0, got '{level}'")
+    return level == "1" if level else None
+
+def wait_for_door(latched, timeout, since=None):
+    """
+    Block until the door reports latched or unlatched.
+
+    Only a change of Door_Status counts when since is given, so a switch
+    read with the wrong polarity cannot confirm a latch that was never made.
+    Without DOOR_LATCHED_LEVEL nothing can be confirmed and the call waits
+    out the whole timeout.
+
+    Args:
+        latched: True to wait for the latch, False for its release
+        timeout: Maximum time to wait in seconds
+        since: time.monotonic() of the lock pulse; the door must have changed
+               to the state at or after it
+
+    Returns:
+        True if the door reached the state, False on timeout
+    """
+    deadline = time.monotonic() + timeout
+    latched_status = door_latched_status()
+    if latched_status is None:
+        time.sleep(timeout)
+        return False
+    state = latched_status if latched else not latched_status
+    count = read_change_count("Door_Status")
+    while True:
+        status, changed = read_many(("Door_Status", "Door_Changed"))
+        if status == state and (since is None or changed >= since):
+            return True
+        remaining = _remaining(deadline)
+        if remaining <= 0:
+            return False
+        count = wait_for_change("Door_Status", remaining, count)
+
+def request_soft_reset(timeout=None):
+    """
+    Ask the wash cycle to drop what it is doing and return the machine to
+    idle, and wait until it has.
+
+    Args:
+        timeout: Maximum time to wait in seconds (None waits forever)
+
+    Returns:
+        True if the cycle reported back idle, False on timeout
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    count = read_change_count("soft_reset_done")
+    request = read_data_from_shared_memory("soft_reset") + 1
+    write_data_to_shared_memory("soft_reset", request)
+    while read_data_from_shared_memory("soft_reset_done") != request:
+        remaining = _remaining(deadline)
+        if remaining <= 0:
+            return False
+        count = wait_for_change("soft_reset_done", remaining, count)
+    return True
+
+class SensorHistory:
+    """
+    Fixed-capacity ring buffer of timestamped samples in shared memory.
+
+    One process appends, any number of processes read. Readers never lock:
+    the writer stores a sample before publishing the new sample count, and
+    windows stop one sample short of the slot being overwritten.
+    """
+
+    def __init__(self, name, capacity=HISTORY_CAPACITY):
+        if capacity & (capacity - 1):
+            raise ValueError(f"History capacity must be a power of two, got {capacity}")
+        self.name = name
+        self.segment_name = f"{SHM_PREFIX}{name}_history"
+        self.capacity = capacity
+        self.size = history_header.size + 2 * capacity * history_sample.size
+
+        shm = posix_ipc.SharedMemory(self.segment_name, flags=posix_ipc.O_CREAT, size=self.size)
+        shared_memory_objects[self.segment_name] = shm
+        self.mem = mmap.mmap(shm.fd, self.size)
+        shm.close_fd()
+
+        stored_capacity = history_header.unpack_from(self.mem, 0)[1]
+        if stored_capacity == 0:
+            history_header.pack_into(self.mem, 0, 0, capacity)
+        elif stored_capacity != capacity:
+            raise RuntimeError(
+                f"History '{name}' holds {stored_capacity} samples, expected {capacity}"
+            )
+
+    def append(self, value, timestamp=None):
+        """Store a sample; only one process may append to a history."""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        count = history_counter.unpack_from(self.mem, 0)[0]
+        index = count & (self.capacity - 1)
+        offset = history_header.size + index * history_sample.size
+        history_sample.pack_into(self.mem, offset, timestamp, value)
+        history_sample.pack_into(self.mem, offset + self.capacity * history_sample.size, timestamp, value)
+        history_counter.pack_into(self.mem, 0, (count + 1) & 0xFFFFFFFF)
+
+    def count(self):
+        """Return the number of samples available to read."""
+        written = history_counter.unpack_from(self.mem, 0)[0]
+        return min(written, self.capacity - 1)
+
+    def _window(self, written, count):
+        """Return a (count, 2) memoryview of the newest count samples."""
+        if count == 0:
+            return memoryview(b'').cast('d')  # memoryview cannot have a zero-length shape
+        start = (written - count) & (self.capacity - 1)
+        offset = history_header.size + start * history_sample.size
+        view = memoryview(self.mem)[offset:offset + count * history_sample.size]
+        return view.cast('d', (count, 2))
+
+    def last(self, count):
+        """
+        Return the newest samples, oldest first, without copying.
+
+        The view stays valid until the writer has appended about capacity
+        more samples; copy it if it has to be kept longer.
+
+        Args:
+            count: Maximum number of samples to return
+
+        Returns:
+            memoryview of shape (n, 2) with rows (timestamp, value)
+        """
+        written = history_counter.unpack_from(self.mem, 0)[0]
+        count = min(count, written, self.capacity - 1)
+        return self._window(written, count)
+
+    def since(self, timestamp):
+        """
+        Return all samples taken at or after timestamp (time.monotonic()), oldest first.
+
+        Returns:
+            memoryview of shape (n, 2) with rows (timestamp, value)
+        """
+        written = history_counter.unpack_from(self.mem, 0)[0]
+        available = min(written, self.capacity - 1)
+        window = self._window(written, available)
+
+        # Samples are in time order, so binary search for the first one to keep
+        low, high = 0, available
+        while low < high:
+            middle = (low + high) // 2
+            if window[middle, 0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return self._window(written, available - low)
+
+    def close(self):
+        """Unmap the history from this process."""
+        try:
+            self.mem.close()
+        except BufferError:
+            pass  # A returned view is still in use; the mapping goes with it
+
+def open_sensor_history(name):
+    """Return this process's SensorHistory for name, opening it on first use."""
+    history = _sensor_histories.get(name)
+    if history is None:
+        history = SensorHistory(name)
+        _sensor_histories[name] = history
+    return history
+
+def samples_as_array(view):
+    """
+    Return a window from SensorHistory as a NumPy structured array without copying.
+    The fields are "time" and "value". Requires NumPy.
+    """
+    if numpy is None:
+        raise RuntimeError("NumPy is not installed")
+    return numpy.frombuffer(view, dtype=HISTORY_SAMPLE_DTYPE)
+
+# Durable state: the schema's durable fields, checkpointed to a file-backed
+# mapping so a restart after a power loss can resume the wash cycle. The file
+# holds two slots, each in its own page, written alternately and flushed with
+# msync; a checkpoint torn by a power cut only damages the older slot, and the
+# newer valid slot (by sequence, checked with a CRC) wins on restore.
+STATE_FILE = os.getenv("STATE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "machine_state.bin"))
+STATE_CHECKPOINT_INTERVAL = 5.0  # seconds, at most one msync per interval
+state_slot_header = struct.Struct('<IIII')  # magic, schema version, sequence, CRC
+state_values = struct.Struct('<' + ''.join(struct_code(FIELDS_BY_NAME[name]) for name in DURABLE_NAMES))
+STATE_SLOT_SIZE = mmap.PAGESIZE
+STATE_FILE_SIZE = 2 * STATE_SLOT_SIZE
+
+# Mapping of the state file, the sequence of its newest slot, and the values
+# and time of the last checkpoint written by this process
+_state_file = None
+_state_sequence = 0
+_state_values = None
+_state_checkpointed_at = 0.0
+
+def _read_state_slot(mem, index):
+    """
+    Read one slot of the state file.
+
+    Returns:
+        Tuple (sequence, values) or None if the slot is empty, torn or from another schema
+    """
+    offset = index * STATE_SLOT_SIZE
+    magic, version, sequence, crc = state_slot_header.unpack_from(mem, offset)
+    if magic != SCHEMA_MAGIC or version != SCHEMA_VERSION:
+        return None
+    payload = mem[offset + 4:offset + 12]  # Schema version and sequence
+    values = mem[offset + state_slot_header.size:offset + state_slot_header.size + state_values.size]
+    if zlib.crc32(values, zlib.crc32(payload)) != crc:
+        return None
+    return sequence, state_values.unpack(values)
+
+def open_state_file():
+    """
+    Map the state file, creating it if needed. Only one process, the
+    SharedMemoryManager, should write checkpoints.
+
+    Returns:
+        The mmap object of the state file
+    """
+    global _state_file, _state_sequence
+    if _state_file is None:
+        fd = os.open(STATE_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < STATE_FILE_SIZE:
+                os.ftruncate(fd, STATE_FILE_SIZE)
+            _state_file = mmap.mmap(fd, STATE_FILE_SIZE)
+        finally:
+            os.close(fd)
+        slots = [_read_state_slot(_state_file, index) for index in range(2)]
+        _state_sequence = max((slot[0] for slot in slots if slot is not None), default=0)
+    return _state_file
+
+def restore_durable_state():
+    """
+    Copy the newest checkpoint from the state file back into the register file.
+
+    Returns:
+        Dictionary of the restored values, or None if there is no valid checkpoint
+    """
+    global _state_values
+    mem = open_state_file()
+    slots = [slot for slot in (_read_state_slot(mem, index) for index in range(2)) if slot is not None]
+    if not slots:
+        return None
+    sequence, values = max(slots)
+    restored = {
+        name: decode(FIELDS_BY_NAME[name], value)
+        for name, value in zip(DURABLE_NAMES, values)
+    }
+    write_many(restored)
+    _state_values = values
+    return restored
+
+def checkpoint_durable_state(force=False):
+    """
+    Write the durable fields to the state file and msync them. Nothing is
+    written if they did not change since the last checkpoint, and at most one
+    checkpoint is written every STATE_CHECKPOINT_INTERVAL seconds unless forced,
+    to spare the SD card.
+
+    Returns:
+        True if a checkpoint was written
+    """
+    global _state_sequence, _state_values, _state_checkpointed_at
+    now = time.monotonic()
+    if not force and now - _state_checkpointed_at < STATE_CHECKPOINT_INTERVAL:
+        return False
+    values = tuple(
+        coerce(FIELDS_BY_NAME[name], value)
+        for name, value in zip(DURABLE_NAMES, read_many(DURABLE_NAMES))
+    )
+    if values == _state_values:
+        return False
+
+    mem = open_state_file()
+    sequence = _state_sequence + 1
+    offset = (sequence % 2) * STATE_SLOT_SIZE
+    packed = state_values.pack(*values)
+    payload = struct.pack('<II', SCHEMA_VERSION, sequence)
+    crc = zlib.crc32(packed, zlib.crc32(payload))
+    state_slot_header.pack_into(mem, offset, SCHEMA_MAGIC, SCHEMA_VERSION, sequence, crc)
+    mem[offset + state_slot_header.size:offset + state_slot_header.size + state_values.size] = packed
+    mem.flush(offset, STATE_SLOT_SIZE)  # msync just this slot's page
+    _state_sequence = sequence
+    _state_values = values
+    _state_checkpointed_at = now
+    return True
 
 def modify_shared_memory(name, modify_func):
     """
@@ -68,6 +1224,33 @@ def cleanup_shared_memory():
     Cleanup all shared memory objects created in this program.
     This should be called before the program exits to release resources.
     """
+    global _register_file, _register_buffer, _relay_queue, _relay_queue_buffer, _relay_queue_lock, _state_file
+    for mem in _legacy_mappings.values():
+        mem.close()
+    _legacy_mappings.clear()
+    for history in _sensor_histories.values():
+        history.close()
+    _sensor_histories.clear()
+    if _state_file is not None:
+        # The state file outlives the program; only the mapping is released
+        _state_file.close()
+        _state_file = None
+    if _register_file is not None:
+        # Tell other processes to reattach once the segment is unlinked below
+        _retire_register_file()
+        _register_buffer = None  # Release the export so the mapping can close
+        _register_file.close()
+        _register_file = None
+    if _relay_queue is not None:
+        _relay_queue_buffer = None
+        _relay_queue.close()
+        _relay_queue = None
+        try:
+            _relay_queue_lock.unlink()
+        except Exception as e:
+            print(f"Error cleaning up semaphore '{RELAY_QUEUE_LOCK_NAME}': {e}")
+        _relay_queue_lock = None
+
     for name, shm in shared_memory_objects.items():
         try:
             shm.unlink()  # Unlink the shared memory object
@@ -0,0 +1,223 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+
+# Run on segments of our own; the benchmark overwrites commands and unlinks
+# its segments when done, which must never hit the live machine's
+os.environ.setdefault("SHM_PREFIX", "shm_benchmark_")
+
+import posix_ipc
+from shared_memory_util import (
+    REGISTER_WRITE_LOCK_NAME, SHM_PREFIX,
+    ack_relay_command, cleanup_shared_memory, initialize_registers, modify_shared_memory, open_register_file,
+    pop_relay_command, push_relay_command, read_data_from_shared_memory, read_many, read_snapshot,
+    write_data_to_shared_memory, write_many,
+)
+
+# Value the restarted writer publishes in benchmark_reattach
+REATTACH_MARKER = -1.0
+
+# Registers used by the bulk benchmarks
+BULK_NAMES = ["taccosensor", "Pressure", "Water_Level", "Door_Status", "triac_delay"]
+
+
+def percentile(sorted_values, fraction):
+    """Return the value at the given fraction (0.0 - 1.0) of a sorted list."""
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+def summarize(latencies, elapsed):
+    """
+    Summarise per-operation latencies.
+
+    Args:
+        latencies: Latency of each operation in nanoseconds
+        elapsed: Wall time of the whole run in seconds
+
+    Returns:
+        Dictionary with p50, p99 and max latency in microseconds and operations per second
+    """
+    latencies = sorted(latencies)
+    return {
+        "p50_us": percentile(latencies, 0.50) / 1000,
+        "p99_us": percentile(latencies, 0.99) / 1000,
+        "max_us": latencies[-1] / 1000,
+        "ops_per_s": len(latencies) / elapsed,
+    }
+
+def measure(operation, iterations):
+    """Time iterations calls of operation() and summarise them."""
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        operation()
+        latencies.append(time.perf_counter_ns() - start)
+    return summarize(latencies, time.perf_counter() - started)
+
+def benchmark_operations(iterations=100_000):
+    """
+    Measure each shared memory operation in a single process, without contention.
+
+    Returns:
+        Dictionary of operation name to its summary
+    """
+    open_register_file()
+    bulk_values = {name: 1.0 for name in BULK_NAMES}
+    results = {
+        "read": measure(lambda: read_data_from_shared_memory("taccosensor"), iterations),
+        "write": measure(lambda: write_data_to_shared_memory("taccosensor", 1.0), iterations),
+        "modify": measure(lambda: modify_shared_memory("taccosensor", lambda value: value + 1.0), iterations),
+        "read_many": measure(lambda: read_many(BULK_NAMES), iterations),
+        "write_many": measure(lambda: write_many(bulk_values), iterations),
+        "read_snapshot": measure(read_snapshot, iterations),
+    }
+
+    # Queue push and pop alternate so the queue never fills up; a slot is
+    # only freed by the ack, so it is timed with the pop. Both report the
+    # round-trip rate as their throughput.
+    push_latencies = []
+    pop_latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        push_relay_command(1.0, timeout=1.0)
+        middle = time.perf_counter_ns()
+        sequence, _ = pop_relay_command(timeout=1.0)
+        ack_relay_command(sequence)
+        push_latencies.append(middle - start)
+        pop_latencies.append(time.perf_counter_ns() - middle)
+    elapsed = time.perf_counter() - started
+    results["queue_push"] = summarize(push_latencies, elapsed)
+    results["queue_pop_ack"] = summarize(pop_latencies, elapsed)
+    return results
+
+def run_writer(stop_event):
+    """Write to the register file as fast as possible until stopped."""
+    value = 0.0
+    while not stop_event.is_set():
+        write_data_to_shared_memory("command_from_server", value)
+        write_data_to_shared_memory("command_mode_from_server", value)
+        value += 1.0
+
+def run_reader(start_event, iterations, results):
+    """Time read_snapshot calls once start_event is set and report the summary."""
+    open_register_file()
+    start_event.wait()
+    results.put(measure(read_snapshot, iterations))
+
+def benchmark_readers(readers, iterations=100_000):
+    """
+    Measure read_snapshot in several reader processes at once while another
+    process writes at full rate.
+
+    Returns:
+        Dictionary with the summary of each reader, the worst p99 and the total throughput
+    """
+    open_register_file()
+    stop_event = multiprocessing.Event()
+    writer = multiprocessing.Process(target=run_writer, args=(stop_event,))
+    writer.start()
+
+    start_event = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=run_reader, args=(start_event, iterations, results))
+        for _ in range(readers)
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(0.5)  # Let the writer reach full rate and the readers map the file
+    start_event.set()
+    try:
+        summaries = [results.get() for _ in processes]
+    finally:
+        for process in processes:
+            process.join()
+        stop_event.set()
+        writer.join()
+
+    return {
+        "readers": summaries,
+        "worst_p99_us": max(summary["p99_us"] for summary in summaries),
+        "total_ops_per_s": sum(summary["ops_per_s"] for summary in summaries),
+    }
+
+def run_restarted_writer(marker_written):
+    """Start like a restarted SharedMemoryManager, then publish the marker."""
+    open_register_file(replace_incompatible=True)
+    initialize_registers()
+    write_data_to_shared_memory("taccosensor", REATTACH_MARKER)
+    marker_written.set()
+
+def benchmark_reattach(max_accesses=1000):
+    """
+    Kill a writer under load, let a restarted owner initialise the register
+    file again, and count how many reads this process needs to see it.
+
+    Returns:
+        Dictionary with the number of accesses until reattached (1 is best)
+
+    Raises:
+        RuntimeError: If the restarted owner's value was not seen within max_accesses reads
+    """
+    open_register_file()
+    stop_event = multiprocessing.Event()
+    writer = multiprocessing.Process(target=run_writer, args=(stop_event,))
+    writer.start()
+    time.sleep(0.5)
+    for _ in range(10_000):
+        read_data_from_shared_memory("command_from_server")
+    writer.kill()
+    writer.join()
+
+    marker_written = multiprocessing.Event()
+    restarted = multiprocessing.Process(target=run_restarted_writer, args=(marker_written,))
+    restarted.start()
+    marker_written.wait()
+    restarted.join()
+
+    for accesses in range(1, max_accesses + 1):
+        if read_data_from_shared_memory("taccosensor") == REATTACH_MARKER:
+            return {"accesses_to_reattach": accesses}
+    raise RuntimeError(f"Restarted owner not seen after {max_accesses} reads")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shared memory layer and print the results as JSON.")
+    parser.add_argument("--iterations", type=int, default=100_000, help="operations timed per benchmark")
+    parser.add_argument("--readers", type=int, nargs="+", default=[1, 4], help="reader process counts to run")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    args = parser.parse_args()
+    if not SHM_PREFIX:
+        parser.error("SHM_PREFIX is empty; the benchmark would overwrite and unlink the live shared memory")
+
+    # Diagnostics printed by shared_memory_util go to stderr to keep stdout valid JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            results = {
+                "machine": platform.machine(),
+                "python": platform.python_version(),
+                "iterations": args.iterations,
+                "operations": benchmark_operations(args.iterations),
+                "readers_under_write": {
+                    str(readers): benchmark_readers(readers, args.iterations) for readers in args.readers
+                },
+                "reattach": benchmark_reattach(),
+            }
+        finally:
+            cleanup_shared_memory()
+            posix_ipc.unlink_semaphore(REGISTER_WRITE_LOCK_NAME)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
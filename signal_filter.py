@@ -0,0 +1,150 @@
+import bisect
+import json
+import random
+import time
+from array import array
+
+class EMAFilter:
+    """Exponential moving average: each sample moves the output alpha of the way towards it."""
+
+    def __init__(self, alpha=0.3):
+        if not 0.0 < alpha <= 1.0:
+            raise ValueError("alpha must be in (0, 1]")
+        self.alpha = alpha
+        self.value = None
+
+    def reset(self):
+        self.value = None
+
+    def update(self, value, timestamp):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+class MedianFilter:
+    """Median of the last size samples; removes single-sample spikes and dropouts."""
+
+    def __init__(self, size=5):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.size = size
+        self.samples = array('d', bytes(8 * size))  # Ring of the latest samples
+        self.ordered = []  # The same samples, sorted
+        self.index = 0
+
+    def reset(self):
+        self.ordered.clear()
+        self.index = 0
+
+    def update(self, value, timestamp):
+        if len(self.ordered) == self.size:
+            # Replace the oldest sample in the sorted window
+            del self.ordered[bisect.bisect_left(self.ordered, self.samples[self.index])]
+        self.samples[self.index] = value
+        bisect.insort(self.ordered, value)
+        self.index = (self.index + 1) % self.size
+
+        count = len(self.ordered)
+        middle = count // 2
+        if count % 2:
+            return self.ordered[middle]
+        return (self.ordered[middle - 1] + self.ordered[middle]) / 2
+
+class OutlierRejector:
+    """
+    Replace samples that change faster than max_rate units per second with the
+    last accepted one. After max_rejects rejections in a row the new value is
+    accepted, so a real step still gets through.
+    """
+
+    def __init__(self, max_rate, max_rejects=3):
+        self.max_rate = max_rate
+        self.max_rejects = max_rejects
+        self.value = None
+        self.timestamp = None
+        self.rejects = 0
+
+    def reset(self):
+        self.value = None
+        self.rejects = 0
+
+    def update(self, value, timestamp):
+        if self.value is not None:
+            limit = self.max_rate * (timestamp - self.timestamp)
+            if abs(value - self.value) > limit and self.rejects < self.max_rejects:
+                self.rejects += 1
+                return self.value
+        self.value = value
+        self.timestamp = timestamp
+        self.rejects = 0
+        return value
+
+class FilterPipeline:
+    """
+    Run samples through filter stages in order. Each stage keeps its state in
+    buffers allocated up front, so filtering a sample allocates nothing beyond
+    the resulting floats.
+    """
+
+    def __init__(self, *stages):
+        self.stages = stages
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+
+    def update(self, value, timestamp=None):
+        """
+        Filter one sample.
+
+        Args:
+            value: Raw sample
+            timestamp: time.monotonic() of the sample, defaults to now
+
+        Returns:
+            Filtered value
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        for stage in self.stages:
+            value = stage.update(value, timestamp)
+        return value
+
+def tacho_filter():
+    """Filter for the tacho frequency: drop glitches, then smooth."""
+    return FilterPipeline(OutlierRejector(max_rate=200.0), MedianFilter(5), EMAFilter(0.3))
+
+def pressure_filter():
+    """Filter for the pressure frequency: the median removes failed (0) readings."""
+    return FilterPipeline(MedianFilter(5), EMAFilter(0.5))
+
+def benchmark_filters(samples=100_000):
+    """
+    Measure the cost per sample of each filter on noisy input.
+
+    Returns:
+        Dictionary of filter name to microseconds per sample
+    """
+    values = [30.0 + random.gauss(0.0, 2.0) for _ in range(samples)]
+    filters = {
+        "ema": FilterPipeline(EMAFilter(0.3)),
+        "median5": FilterPipeline(MedianFilter(5)),
+        "outlier": FilterPipeline(OutlierRejector(max_rate=200.0)),
+        "tacho": tacho_filter(),
+        "pressure": pressure_filter(),
+    }
+    results = {}
+    for name, pipeline in filters.items():
+        timestamp = 0.0
+        start = time.perf_counter()
+        for value in values:
+            timestamp += 0.05
+            pipeline.update(value, timestamp)
+        results[name] = (time.perf_counter() - start) * 1_000_000 / samples
+    return results
+
+if __name__ == "__main__":
+    # Run on the Pi to see what filtering costs per sample
+    print(json.dumps({"us_per_sample": benchmark_filters()}, indent=2))
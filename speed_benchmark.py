@@ -0,0 +1,152 @@
+import argparse
+import json
+import random
+from signal_filter import tacho_filter
+from speed_control import ACCELERATION, FeedForwardTable, SpeedController, linear_feed_forward
+
+
+class SimulatedMotor:
+    """
+    First-order drum motor: after a dead time, the speed moves towards the
+    steady-state speed of the TRIAC delay with time constant tau. The default
+    gain deliberately differs from linear_feed_forward() so the feedback has
+    work to do.
+    """
+
+    def __init__(self, delay_at_zero=7400.0, rpm_per_us=0.42, tau=1.5, dead_time=0.1, noise=1.0, dt=0.01):
+        self.delay_at_zero = delay_at_zero
+        self.rpm_per_us = rpm_per_us
+        self.tau = tau
+        self.noise = noise
+        self.dt = dt
+        self.delays = [8000.0] * max(1, round(dead_time / dt))
+        self.speed = 0.0
+
+    def step(self, delay):
+        """Advance dt seconds with the given delay and return the measured speed"""
+        self.delays.append(delay)
+        applied = self.delays.pop(0)
+        steady = max(0.0, (self.delay_at_zero - applied) * self.rpm_per_us)
+        self.speed += (steady - self.speed) * self.dt / self.tau
+        return self.speed + random.gauss(0.0, self.noise)
+
+def step_metrics(times, speeds, start, target, delays=None):
+    """
+    Rise time (10% to 90% of the step), overshoot and settle time (last time
+    outside a band of 2% of the target, at least 5 RPM). With delays, also
+    the time after which the controller's delay stays within 20 us of its
+    final value, i.e. how long the controller searches.
+    """
+    step = target - start
+    rise_start = rise_end = None
+    for t, speed in zip(times, speeds):
+        if rise_start is None and speed - start >= 0.1 * step:
+            rise_start = t
+        if rise_end is None and speed - start >= 0.9 * step:
+            rise_end = t
+    band = max(0.02 * target, 5.0)
+    settle = 0.0
+    for t, speed in zip(times, speeds):
+        if abs(speed - target) > band:
+            settle = t
+    metrics = {
+        "rise_time_s": None if rise_end is None or rise_start is None else round(rise_end - rise_start, 2),
+        "overshoot_percent": round(max(0.0, (max(speeds) - target) / step * 100), 1),
+        "settle_time_s": round(settle, 2) if settle < times[-1] else None,
+        "final_rpm": round(speeds[-1], 1),
+    }
+    if delays is not None:
+        searching = 0.0
+        for t, delay in zip(times, delays):
+            if abs(delay - delays[-1]) > 20:
+                searching = t
+        metrics["delay_settle_time_s"] = round(searching, 2)
+    return metrics
+
+def simulate_calibration(start_delay=8000, end_delay=4000, step=100, seconds=10.0):
+    """Run the calibration sweep on the simulated motor and build its feed-forward table."""
+    points = []
+    for delay in range(start_delay, end_delay - 1, -step):
+        motor = SimulatedMotor()
+        samples = round(seconds / motor.dt)
+        speeds = [motor.step(delay) for _ in range(samples)]
+        window = speeds[-round(2.0 / motor.dt):]  # Last 2 s, like wait_for_steady_speed
+        points.append((delay, sum(window) / len(window)))
+    return FeedForwardTable(points)
+
+def simulate_pid(target, duration=30.0, rate=20.0, table=None):
+    """
+    Step the simulated motor from rest to target under a SpeedController with
+    the default gains, using the calibrated table if given and the linear
+    feed-forward otherwise.
+    """
+    if table is None:
+        controller = SpeedController(rate=rate, feed_forward=linear_feed_forward(), acceleration=ACCELERATION)
+    else:
+        controller = SpeedController(rate=rate, feed_forward=table)
+    motor = SimulatedMotor()
+    speed_filter = tacho_filter()
+    period = round(1.0 / rate / motor.dt)
+    delay = 8000.0
+    measured = 0.0
+    times, speeds, delays = [], [], []
+    for i in range(round(duration / motor.dt)):
+        t = i * motor.dt
+        speed = motor.step(delay)
+        if i % period == 0:
+            measured = speed_filter.update(speed, t)
+            delay = controller.compute(target, measured, 1.0 / rate)
+        times.append(t)
+        speeds.append(motor.speed)
+        delays.append(delay)
+    return step_metrics(times, speeds, 0.0, target, delays)
+
+def simulate_leveler(target, duration=30.0, increment=30.0, start_delay=8000.0):
+    """
+    Step the simulated motor under cycle_controller's old rpm_leveler: once a
+    second, move the delay by increment until the 1 s tacho reading is within
+    10 RPM, then stop adjusting.
+    """
+    motor = SimulatedMotor()
+    delay = start_delay
+    counted = 0.0
+    levelling = True
+    times, speeds, delays = [], [], []
+    samples_per_second = round(1.0 / motor.dt)
+    for i in range(round(duration / motor.dt)):
+        t = i * motor.dt
+        counted += motor.step(delay)
+        if levelling and i % samples_per_second == samples_per_second - 1:
+            reading = counted / samples_per_second  # The 1 s averaged tacho value
+            counted = 0.0
+            if target - reading >= 10:
+                delay -= increment
+            elif target - reading <= -10:
+                delay += increment
+            else:
+                levelling = False
+        times.append(t)
+        speeds.append(motor.speed)
+        delays.append(delay)
+    return step_metrics(times, speeds, 0.0, target, delays)
+
+def main():
+    parser = argparse.ArgumentParser(description="Step responses of the speed controller on a simulated motor, as JSON.")
+    parser.add_argument("--targets", type=float, nargs="+", default=[30.0, 40.0, 800.0], help="target RPMs to step to")
+    parser.add_argument("--duration", type=float, default=60.0, help="simulated seconds per step")
+    args = parser.parse_args()
+
+    random.seed(1)
+    table = simulate_calibration()
+    results = {
+        str(target): {
+            "pid_calibrated": simulate_pid(target, args.duration, table=table),
+            "pid": simulate_pid(target, args.duration),
+            "rpm_leveler": simulate_leveler(target, args.duration),
+        }
+        for target in args.targets
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+import argparse
+import bisect
+import json
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from shared_memory_util import (
+    open_sensor_history, push_relay_command, read_snapshot, wait_for_door, write_data_to_shared_memory,
+)
+
+# Calibrated feed-forward tables, one per load condition
+SPEED_TABLE_FILE = os.getenv("SPEED_TABLE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "speed_table.json"))
+
+class PIDController:
+    """
+    PID controller with feed-forward, output clamping and anti-windup.
+
+    The output is feed_forward(target) plus the PID correction. The derivative
+    acts on the measurement so a new target does not kick the output, and the
+    integral stops growing while the output is clamped in the direction it
+    would push, so it does not wind up during a long ramp.
+    """
+
+    def __init__(self, kp, ki, kd, output_min, output_max, feed_forward=None, direction=1.0):
+        """
+        Args:
+            kp, ki, kd: Proportional, integral (per second) and derivative (seconds) gains
+            output_min, output_max: Output clamp
+            feed_forward: Function of the target giving the expected output, or None
+            direction: 1.0 if a higher output raises the measurement, -1.0 if it lowers it
+        """
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.output_min = output_min
+        self.output_max = output_max
+        self.feed_forward = feed_forward
+        self.direction = direction
+        self.reset()
+
+    def reset(self):
+        """Forget the integral and the previous measurement"""
+        self.integral = 0.0
+        self.last_measurement = None
+
+    def update(self, target, measurement, dt, integral_band=None):
+        """
+        Compute the output for one control period.
+
+        Args:
+            target: Setpoint
+            measurement: Current process value
+            dt: Seconds since the previous update
+            integral_band: If given, the integral only changes while the error
+                           is within this band; with an accurate feed-forward
+                           it then only trims the final offset
+
+        Returns:
+            Clamped output
+        """
+        error = target - measurement
+        derivative = 0.0
+        if self.last_measurement is not None and dt > 0:
+            derivative = (measurement - self.last_measurement) / dt
+        self.last_measurement = measurement
+
+        base = self.feed_forward(target) if self.feed_forward else 0.0
+        integral = self.integral
+        if integral_band is None or abs(error) <= integral_band:
+            integral += error * dt
+        correction = self.kp * error + self.ki * integral - self.kd * derivative
+        output = base + self.direction * correction
+
+        # Anti-windup: keep the new integral only if the output is not
+        # clamped, or if the error is pulling it back out of the clamp
+        if output > self.output_max:
+            output = self.output_max
+            if self.direction * error < 0:
+                self.integral = integral
+        elif output < self.output_min:
+            output = self.output_min
+            if self.direction * error > 0:
+                self.integral = integral
+        else:
+            self.integral = integral
+        return output
+
+def linear_feed_forward(delay_at_zero=7500.0, rpm_per_us=0.45):
+    """
+    Feed-forward from target RPM to TRIAC delay for a drum whose speed grows
+    linearly as the delay shrinks below delay_at_zero. The default errs towards
+    longer delays, so a mismatch costs rise time instead of overshoot.
+    """
+    def feed_forward(target_rpm):
+        return delay_at_zero - target_rpm / rpm_per_us
+    return feed_forward
+
+# Speeds below this count as a stalled drum during calibration
+STALLED_RPM = 1.0
+
+class FeedForwardTable:
+    """
+    Steady-state drum speed measured at a sweep of TRIAC delays, interpolated
+    to give the delay for a target RPM. Used as the SpeedController's
+    feed-forward once calibrated.
+    """
+
+    def __init__(self, points):
+        """
+        Args:
+            points: (delay, rpm) pairs measured by calibrate()
+        """
+        # Keep the points where the speed strictly rises as the delay
+        # shrinks, so the interpolation is monotone despite noisy samples.
+        # Of the delays too long to turn the drum, only the one closest to
+        # where it starts turning matters.
+        self.rpms = []
+        self.delays = []
+        for delay, rpm in sorted(points, reverse=True):
+            if rpm < STALLED_RPM and (not self.rpms or self.rpms[-1] == 0.0):
+                self.rpms = [0.0]
+                self.delays = [delay]
+            elif not self.rpms or rpm > self.rpms[-1]:
+                self.rpms.append(rpm)
+                self.delays.append(delay)
+        if not self.rpms:
+            raise ValueError("A feed-forward table needs at least one point")
+
+    def points(self):
+        """Return the (delay, rpm) pairs of the table"""
+        return list(zip(self.delays, self.rpms))
+
+    def __call__(self, target_rpm):
+        """Return the delay predicted to hold target_rpm, clamped to the measured range"""
+        index = bisect.bisect_left(self.rpms, target_rpm)
+        if index == 0:
+            return self.delays[0]
+        if index == len(self.rpms):
+            return self.delays[-1]
+        low_rpm, high_rpm = self.rpms[index - 1], self.rpms[index]
+        fraction = (target_rpm - low_rpm) / (high_rpm - low_rpm)
+        return self.delays[index - 1] + fraction * (self.delays[index] - self.delays[index - 1])
+
+def load_feed_forward_table(load="default", path=SPEED_TABLE_FILE):
+    """
+    Read the calibrated table of a load condition.
+
+    Returns:
+        FeedForwardTable, or None if that load has not been calibrated
+    """
+    try:
+        with open(path) as file:
+            points = json.load(file)["loads"][load]
+    except (OSError, KeyError, ValueError):
+        return None
+    return FeedForwardTable(points)
+
+def save_feed_forward_table(table, load="default", path=SPEED_TABLE_FILE):
+    """Store the table of a load condition, keeping the other loads in the file"""
+    try:
+        with open(path) as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        data = {"loads": {}}
+    data["loads"][load] = table.points()
+    # Write a new file and rename it so a power cut cannot leave half a table
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        json.dump(data, file, indent=2)
+    os.replace(temporary, path)
+
+def wait_for_steady_speed(history, window=2.0, tolerance=0.02, timeout=20.0):
+    """
+    Wait until the mean speed of two consecutive windows differs by less than
+    tolerance (and 1 RPM), or until timeout.
+
+    Returns:
+        Mean speed of the last window
+    """
+    def window_mean(start, end):
+        samples = history.since(start)
+        values = [samples[i, 1] for i in range(len(samples)) if samples[i, 0] < end]
+        return sum(values) / len(values) if values else 0.0
+
+    deadline = time.monotonic() + timeout
+    time.sleep(2 * window)
+    while True:
+        now = time.monotonic()
+        previous = window_mean(now - 2 * window, now - window)
+        current = window_mean(now - window, now)
+        if abs(current - previous) <= max(1.0, tolerance * current) or now >= deadline:
+            return current
+        time.sleep(window / 2)
+
+def calibrate(load="default", start_delay=8000, end_delay=4000, step=100, path=SPEED_TABLE_FILE):
+    """
+    Sweep triac_delay from start_delay down to end_delay with the drum turning
+    clockwise, record the steady-state speed at each delay and store the
+    table. SpeedController must be idle (target_rpm 0) during the sweep.
+
+    Returns:
+        The new FeedForwardTable
+
+    Raises:
+        RuntimeError: If the door is not confirmed latched
+    """
+    if not wait_for_door(True, 10):
+        raise RuntimeError("Door latch not confirmed; close the door and set DOOR_LATCHED_LEVEL before calibrating")
+    write_data_to_shared_memory("target_rpm", 0.0)
+    history = open_sensor_history("taccosensor")  # Raw; the windows average it
+    points = []
+    push_relay_command(1.0, timeout=1.0)  # Clockwise
+    try:
+        for delay in range(start_delay, end_delay - 1, -step):
+            write_data_to_shared_memory("triac_delay", float(delay))
+            rpm = wait_for_steady_speed(history)
+            print(f"triac_delay {delay}: {rpm:.1f} RPM")
+            points.append((delay, rpm))
+    finally:
+        # Leave the machine as the cycle does when it resets to idle
+        write_data_to_shared_memory("triac_delay", 7000.0)
+        push_relay_command(14.0, timeout=1.0)  # All relays off
+
+    table = FeedForwardTable(points)
+    save_feed_forward_table(table, load, path)
+    return table
+
+# Default gains, tuned with speed_benchmark.py against its simulated motor
+KP = 4.0
+KI = 4.0
+KD = 0.0
+ACCELERATION = 100.0  # RPM per second
+# With a calibrated table, the integral only acts within this fraction of
+# the target (and at least INTEGRAL_BAND_MIN RPM)
+INTEGRAL_BAND = 0.1
+INTEGRAL_BAND_MIN = 5.0
+
+class SpeedController(threading.Thread):
+    """
+    Closed-loop drum speed control. While target_rpm in shared memory is above
+    zero, it drives triac_delay at a fixed rate so that taccosensor_filtered
+    follows the target. At zero it leaves triac_delay to the cycle.
+    """
+
+    def __init__(self, rate=20.0, kp=KP, ki=KI, kd=KD, acceleration=None,
+                 min_delay=4000.0, max_delay=8000.0, feed_forward=None, load="default"):
+        """
+        Args:
+            rate: Control loop frequency in Hz
+            kp, ki, kd: PID gains in microseconds of delay per RPM
+            acceleration: Fastest change of the setpoint in RPM per second;
+                          ramping the setpoint avoids the overshoot of a step.
+                          None ramps at ACCELERATION with the linear
+                          feed-forward and jumps straight to the target with
+                          a calibrated one.
+            min_delay, max_delay: TRIAC delay limits in microseconds
+            feed_forward: Function from target RPM to TRIAC delay; defaults to
+                          the calibrated table of load, or linear_feed_forward()
+                          if there is none
+            load: Load condition whose calibrated table to use
+        """
+        super().__init__()
+        self.daemon = True
+        self.running = False
+        self.rate = rate
+        if feed_forward is None:
+            feed_forward = load_feed_forward_table(load)
+            if feed_forward is None:
+                feed_forward = linear_feed_forward()
+                if acceleration is None:
+                    acceleration = ACCELERATION
+        self.pid = PIDController(
+            kp, ki, kd, min_delay, max_delay,
+            feed_forward=feed_forward,
+            direction=-1.0,  # A longer delay fires later and slows the drum
+        )
+        self.calibrated = isinstance(feed_forward, FeedForwardTable)
+        self.acceleration = acceleration
+        self.setpoint = None  # Ramped target, None while inactive
+        self.last_delay = None
+
+    def compute(self, target, speed, dt):
+        """
+        Compute the TRIAC delay for one control period.
+
+        Args:
+            target: Target RPM; 0 or less turns speed control off
+            speed: Measured RPM
+            dt: Seconds since the previous period
+
+        Returns:
+            Delay in whole microseconds, or None while speed control is off
+        """
+        if target <= 0:
+            self.setpoint = None
+            self.pid.reset()
+            return None
+        if self.acceleration is None:
+            self.setpoint = target
+        else:
+            if self.setpoint is None:
+                self.setpoint = speed  # Ramp up from the current speed
+            change = self.acceleration * dt
+            self.setpoint = min(self.setpoint + change, max(self.setpoint - change, target))
+        integral_band = None
+        if self.calibrated:
+            integral_band = max(INTEGRAL_BAND * self.setpoint, INTEGRAL_BAND_MIN)
+        return round(self.pid.update(self.setpoint, speed, dt, integral_band))
+
+    def step(self, dt):
+        """Run one control period"""
+        target, speed = read_snapshot(("target_rpm", "taccosensor_filtered"))
+        delay = self.compute(target, speed, dt)
+        if delay is not None and delay != self.last_delay:
+            # Only whole microseconds matter to the TRIAC; skip identical writes
+            write_data_to_shared_memory("triac_delay", float(delay))
+            self.last_delay = delay
+
+    def stop(self):
+        """Stop the controller"""
+        self.running = False
+
+    def run(self):
+        """Main thread loop, on a fixed schedule"""
+        self.running = True
+        interval = 1.0 / self.rate
+        next_time = time.monotonic()
+        while self.running:
+            next_time += interval
+            time.sleep(max(0.0, next_time - time.monotonic()))
+            try:
+                self.step(interval)
+            except Exception as e:
+                print(f"Error in speed controller: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the drum speed controller, or calibrate its feed-forward table.")
+    parser.add_argument("--calibrate", action="store_true", help="sweep triac_delay and store the measured speeds")
+    parser.add_argument("--load", default="default", help="load condition to calibrate or to control with")
+    args = parser.parse_args()
+
+    if args.calibrate:
+        load_dotenv()  # DOOR_LATCHED_LEVEL
+        table = calibrate(args.load)
+        print(f"Stored {len(table.points())} points for load '{args.load}' in {SPEED_TABLE_FILE}")
+        return
+
+    controller = SpeedController(load=args.load)
+    controller.start()
+    try:
+        while True:
+            time.sleep(1)
+    finally:
+        controller.stop()
+        controller.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import json
+import time
+import pigpio
+from tacho_reader import TachoSensorThread
+
+# Unused GPIO driven with PWM to generate test edges; pigpio reports the
+# level of output pins too, so no wiring is needed
+TEST_PIN = 26
+
+
+def benchmark_backend(backend, pin=TEST_PIN, frequency=800, duration=10.0):
+    """
+    Count PWM edges on a spare pin with one tacho backend and measure the CPU
+    this process spends on them. Must run on the Pi, next to pigpiod.
+
+    Args:
+        backend: "notify" or "callback"
+        pin: GPIO to drive with PWM
+        frequency: PWM frequency in Hz; pigpio picks the nearest it supports
+        duration: Seconds to measure
+
+    Returns:
+        Dictionary with the edges seen, the expected edges and the CPU time per 1000 edges
+    """
+    tacho = TachoSensorThread(gpio_pin=pin, mode="count", backend=backend)
+    tacho.running = True
+    tacho.setup_gpio()
+    pi = tacho.pi
+    try:
+        pi.set_mode(pin, pigpio.OUTPUT)
+        actual_frequency = pi.set_PWM_frequency(pin, frequency)
+        pi.set_PWM_dutycycle(pin, 128)
+        time.sleep(0.5)  # Let the first reports arrive
+
+        start_count = tacho.pulse_count
+        start_cpu = time.process_time()
+        start = time.monotonic()
+        time.sleep(duration)
+        cpu = time.process_time() - start_cpu
+        elapsed = time.monotonic() - start
+        edges = tacho.pulse_count - start_count
+    finally:
+        pi.set_PWM_dutycycle(pin, 0)
+        pi.set_mode(pin, pigpio.INPUT)
+        tacho.cleanup()
+
+    return {
+        "backend": tacho.backend,
+        "edges": edges,
+        "expected_edges": round(actual_frequency * elapsed),
+        "cpu_ms_per_1000_edges": cpu * 1000 / edges * 1000 if edges else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the CPU cost of the tacho backends and print JSON.")
+    parser.add_argument("--pin", type=int, default=TEST_PIN, help="spare GPIO to drive with PWM")
+    parser.add_argument("--frequency", type=int, default=800, help="PWM frequency in Hz")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per backend")
+    args = parser.parse_args()
+
+    results = {
+        backend: benchmark_backend(backend, args.pin, args.frequency, args.duration)
+        for backend in ("callback", "notify")
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
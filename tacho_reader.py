@@ -1,21 +1,94 @@
+import collections
+import os
+import select
+import struct
 import threading
 import time
 import pigpio
-from shared_memory_util import write_data_to_shared_memory
+from shared_memory_util import open_sensor_history, write_many
+from signal_filter import tacho_filter
 
 class TachoSensorThread(threading.Thread):
-    def __init__(self, gpio_pin=16):
+    # pigpio ticks are microseconds in an unsigned 32-bit counter that wraps
+    # about every 72 minutes
+    TICK_MASK = 0xFFFFFFFF
+
+    # A pigpio notification report: sequence, flags, tick and the levels of GPIO 0-31
+    NOTIFY_REPORT = struct.Struct('HHII')
+    NOTIFY_READ_SIZE = 12 * 256
+
+    def __init__(self, gpio_pin=16, mode="period", publish_rate=20.0, window=0.5, timeout=2.0, backend="callback"):
+        """
+        Args:
+            gpio_pin: GPIO pin the tacho is connected to
+            mode: "period" computes the frequency from the ticks of recent edges,
+                  "count" counts edges over 1 second windows
+            publish_rate: How often the frequency is published in period mode, in Hz
+            window: Seconds of edges averaged in period mode; at least one
+                    interval is always used
+            timeout: Seconds without an edge after which the drum counts as stopped
+            backend: "notify" reads edges in bulk from a pigpio notification
+                     pipe, "callback" gets a Python callback per edge. The pipe
+                     only exists on the host running pigpiod; elsewhere the
+                     callback backend is used. "callback" stays the default
+                     until tacho_benchmark.py shows notify saves CPU on the Pi.
+        """
         super().__init__()
         self.gpio_pin = gpio_pin
+        self.mode = mode
+        self.publish_rate = publish_rate
+        self.window_us = int(window * 1_000_000)
+        self.timeout_us = int(timeout * 1_000_000)
+        self.backend = backend
         self.running = False
+        # Edges seen since start. Only the backend adds to it; readers take
+        # the difference between two reads, so no edge is lost to a reset.
         self.pulse_count = 0
+        self.ticks = collections.deque(maxlen=1024)  # Ticks of the latest edges
+        self.filter = tacho_filter()
         self.pi = None
+        self.callback = None
+        self.notify_handle = None
+        self.notify_fd = None
+        self.notify_thread = None
         self.last_time = time.time()
         
     def count_pulse(self, gpio, level, tick):
-        """Callback function to count pulses"""
+        """Callback function to count pulses and record their ticks"""
         self.pulse_count += 1
+        self.ticks.append(tick)
         
+    def period_frequency(self, now):
+        """
+        Compute the pulse frequency from the intervals between recent edges.
+
+        Args:
+            now: Current pigpio tick
+
+        Returns:
+            Frequency in Hz, 0.0 if no edge arrived within the timeout
+        """
+        ticks = list(self.ticks)
+        if not ticks:
+            return 0.0
+        age = (now - ticks[-1]) & self.TICK_MASK
+        if age > self.timeout_us or len(ticks) < 2:
+            return 0.0
+
+        # Walk back from the newest edge until the intervals cover the window
+        total = 0
+        intervals = 0
+        for index in range(len(ticks) - 1, 0, -1):
+            total += (ticks[index] - ticks[index - 1]) & self.TICK_MASK
+            intervals += 1
+            if total >= self.window_us:
+                break
+
+        # If the drum slows down, the time since the last edge already exceeds
+        # the measured period; use it so the reading decays without waiting
+        # for the next edge
+        return 1_000_000 / max(total / intervals, age)
+
     def setup_gpio(self):
         """Initialize GPIO and set up callback"""
         self.pi = pigpio.pi()
@@ -23,44 +96,135 @@ class TachoSensorThread(threading.Thread):
             raise RuntimeError("Failed to connect to pigpio daemon")
             
         self.pi.set_mode(self.gpio_pin, pigpio.INPUT)
-        self.callback = self.pi.callback(
-            self.gpio_pin, 
-            pigpio.RISING_EDGE, 
-            self.count_pulse
-        )
+        if self.backend == "notify" and not self.open_notify_pipe():
+            print("pigpio notification pipe unavailable, using callbacks for the tacho")
+            self.backend = "callback"
+        if self.backend == "callback":
+            self.callback = self.pi.callback(
+                self.gpio_pin, 
+                pigpio.RISING_EDGE, 
+                self.count_pulse
+            )
+
+    def open_notify_pipe(self):
+        """
+        Open a pigpio notification pipe for the tacho pin and start reading it.
+
+        Returns:
+            True if the pipe is open, False if it is unavailable
+        """
+        try:
+            self.notify_handle = self.pi.notify_open()
+            self.notify_fd = os.open(f"/dev/pigpio{self.notify_handle}", os.O_RDONLY | os.O_NONBLOCK)
+        except Exception as e:
+            print(f"Error opening pigpio notification pipe: {e}")
+            if self.notify_handle is not None and self.notify_handle >= 0:
+                self.pi.notify_close(self.notify_handle)
+            self.notify_handle = None
+            return False
+
+        level = self.pi.read(self.gpio_pin)
+        self.pi.notify_begin(self.notify_handle, 1 << self.gpio_pin)
+        self.notify_thread = threading.Thread(target=self.read_notifications, args=(level,), daemon=True)
+        self.notify_thread.start()
+        return True
+
+    def read_notifications(self, level):
+        """
+        Read notification reports in bulk and record the ticks of rising edges.
+
+        Args:
+            level: Level of the tacho pin when notifications began
+        """
+        bit = 1 << self.gpio_pin
+        pending = b""
+        while self.running:
+            ready, _, _ = select.select([self.notify_fd], [], [], 0.1)
+            if not ready:
+                continue
+            data = os.read(self.notify_fd, self.NOTIFY_READ_SIZE)
+            if not data:
+                break
+            pending += data
+            usable = len(pending) - len(pending) % self.NOTIFY_REPORT.size
+
+            edges = []
+            for _, flags, tick, levels in self.NOTIFY_REPORT.iter_unpack(pending[:usable]):
+                if flags:
+                    continue  # Watchdog, keep-alive and event reports carry no level change
+                high = levels & bit
+                if high and not level:
+                    edges.append(tick)
+                level = high
+            pending = pending[usable:]
+
+            if edges:
+                self.ticks.extend(edges)
+                self.pulse_count += len(edges)
         
     def cleanup(self):
         """Clean up GPIO resources"""
+        self.running = False
+        if self.notify_thread:
+            self.notify_thread.join()
+        if self.notify_fd is not None:
+            os.close(self.notify_fd)
         if self.pi:
-            self.callback.cancel()
+            if self.callback:
+                self.callback.cancel()
+            if self.notify_handle is not None:
+                self.pi.notify_close(self.notify_handle)
             self.pi.stop()
             
     def stop(self):
         """Stop the sensor thread"""
         self.running = False
+
+    def publish(self, frequency):
+        """Write a raw and filtered frequency to shared memory and the raw one to the sensor history"""
+        timestamp = time.monotonic()
+        write_many({
+            "taccosensor": frequency,
+            "taccosensor_filtered": self.filter.update(frequency, timestamp),
+        })
+        self.history.append(frequency, timestamp)
+
+    def run_period_mode(self):
+        """Publish the period-based frequency at publish_rate"""
+        interval = 1.0 / self.publish_rate
+        next_time = time.monotonic()
+        while self.running:
+            next_time += interval
+            time.sleep(max(0.0, next_time - time.monotonic()))
+            self.publish(self.period_frequency(self.pi.get_current_tick()))
+
+    def run_count_mode(self):
+        """Publish the number of edges seen in each 1 second window"""
+        last_count = self.pulse_count
+        while self.running:
+            time.sleep(1)  # Measurement interval
+            
+            current_time = time.time()
+            elapsed_time = current_time - self.last_time
+            self.last_time = current_time
+            
+            # Calculate frequency from the edges counted since the last window
+            count = self.pulse_count
+            frequency = (count - last_count) / elapsed_time
+            last_count = count
+            self.publish(frequency)
         
     def run(self):
         """Main thread loop"""
         try:
+            self.running = True  # Before setup, which starts the notification reader
             self.setup_gpio()
-            self.running = True
+            self.history = open_sensor_history("taccosensor")
             
-            while self.running:
-                time.sleep(1)  # Measurement interval
-                
-                current_time = time.time()
-                elapsed_time = current_time - self.last_time
-                self.last_time = current_time
-                
-                # Calculate frequency and RPM
-                frequency = self.pulse_count / elapsed_time
-                rpm = frequency * 60.0
-                
-                # Write to shared memory
-                write_data_to_shared_memory("taccosensor", frequency)
-                
-                # Reset pulse count for next interval
-                self.pulse_count = 0
+            if self.mode == "period":
+                self.run_period_mode()
+            else:
+                self.run_count_mode()
                 
         except Exception as e:
             print(f"Error in TachoSensor thread: {e}")
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+
+# Run on segments of our own, never on the live machine's
+os.environ.setdefault("SHM_PREFIX", "test_shared_memory_")
+
+import posix_ipc
+import shared_memory_util
+from shared_memory_util import (
+    REGISTER_WRITE_LOCK_NAME, SHM_PREFIX, STATE_SLOT_SIZE,
+    checkpoint_durable_state, cleanup_shared_memory, initialize_registers, read_many, restore_durable_state, state_slot_header, write_many,
+)
+
+DURABLE_PAIR = ("command_from_server", "command_mode_from_server")
+
+if not SHM_PREFIX:
+    raise unittest.SkipTest("SHM_PREFIX is empty; the tests would overwrite the live shared memory")
+
+
+def restart():
+    """Forget the state file mapping and checkpoint bookkeeping, as a restarted process would."""
+    cleanup_shared_memory()
+    shared_memory_util._state_sequence = 0
+    shared_memory_util._state_values = None
+    shared_memory_util._state_checkpointed_at = 0.0
+    initialize_registers()
+
+def checkpoint(command, mode):
+    """Write a durable command and mode and checkpoint them at once."""
+    write_many({DURABLE_PAIR[0]: command, DURABLE_PAIR[1]: mode})
+    return checkpoint_durable_state(force=True)
+
+
+class DurableStateTest(unittest.TestCase):
+    """The newest intact checkpoint survives a restart, even after a torn write."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_file = shared_memory_util.STATE_FILE
+        shared_memory_util.STATE_FILE = os.path.join(self.directory.name, "machine_state.bin")
+        restart()
+
+    def tearDown(self):
+        restart()
+        cleanup_shared_memory()
+        shared_memory_util.STATE_FILE = self.state_file
+        self.directory.cleanup()
+
+    def tear_slot(self, index):
+        """Flip a byte in one slot's values, like a power cut in the middle of its write."""
+        mem = shared_memory_util.open_state_file()
+        offset = index * STATE_SLOT_SIZE + state_slot_header.size
+        mem[offset] ^= 0xFF
+        mem.flush()
+
+    def test_newest_checkpoint_is_restored(self):
+        for command in (5.0, 10.0, 15.0):
+            self.assertTrue(checkpoint(command, 1))
+        restart()
+        self.assertEqual(read_many(DURABLE_PAIR), (1000.0, 1000))
+        self.assertEqual(restore_durable_state(), {DURABLE_PAIR[0]: 15.0, DURABLE_PAIR[1]: 1})
+        self.assertEqual(read_many(DURABLE_PAIR), (15.0, 1))
+
+    def test_torn_newest_slot_falls_back_to_the_older_one(self):
+        checkpoint(5.0, 0)
+        checkpoint(10.0, 0)  # Sequence 2 goes to slot 0
+        self.tear_slot(0)
+        restart()
+        self.assertEqual(restore_durable_state(), {DURABLE_PAIR[0]: 5.0, DURABLE_PAIR[1]: 0})
+
+    def test_next_checkpoint_after_a_fallback_keeps_the_intact_slot(self):
+        checkpoint(5.0, 0)
+        checkpoint(10.0, 0)
+        self.tear_slot(0)
+        restart()
+        restore_durable_state()
+        self.assertTrue(checkpoint(20.0, 0))
+        # A second power cut tearing that checkpoint still leaves 5.0
+        self.tear_slot(0)
+        restart()
+        self.assertEqual(restore_durable_state(), {DURABLE_PAIR[0]: 5.0, DURABLE_PAIR[1]: 0})
+
+    def test_no_intact_slot_restores_nothing(self):
+        checkpoint(5.0, 0)
+        checkpoint(10.0, 0)
+        self.tear_slot(0)
+        self.tear_slot(1)
+        restart()
+        self.assertIsNone(restore_durable_state())
+        self.assertEqual(read_many(DURABLE_PAIR), (1000.0, 1000))
+
+    def test_unchanged_values_are_not_checkpointed_again(self):
+        self.assertTrue(checkpoint(5.0, 0))
+        self.assertFalse(checkpoint_durable_state(force=True))
+
+
+def tearDownModule():
+    # The write lock outlives cleanup_shared_memory() by design
+    if shared_memory_util._register_write_lock is not None:
+        try:
+            posix_ipc.unlink_semaphore(REGISTER_WRITE_LOCK_NAME)
+        except posix_ipc.ExistentialError:
+            pass
+
+if __name__ == "__main__":
+    unittest.main()
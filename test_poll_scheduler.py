@@ -0,0 +1,56 @@
+import unittest
+from poll_scheduler import PollScheduler
+
+
+class PollSchedulerBackoffTest(unittest.TestCase):
+    """Failed polls double the wait up to the cap; a good poll goes back to the base interval."""
+
+    def scheduler(self, jitter=0.0):
+        return PollScheduler(idle_interval=5.0, busy_interval=30.0, max_interval=300.0, jitter=jitter)
+
+    def test_base_interval_follows_the_cycle(self):
+        scheduler = self.scheduler()
+        self.assertEqual(scheduler.next_interval(True), 5.0)
+        self.assertEqual(scheduler.next_interval(True, busy=True), 30.0)
+
+    def test_errors_double_the_interval_up_to_the_cap(self):
+        scheduler = self.scheduler()
+        intervals = [scheduler.next_interval(False) for _ in range(8)]
+        self.assertEqual(intervals, [10.0, 20.0, 40.0, 80.0, 160.0, 300.0, 300.0, 300.0])
+        self.assertEqual(scheduler.errors, 8)
+
+    def test_busy_backoff_starts_from_the_busy_interval(self):
+        scheduler = self.scheduler()
+        self.assertEqual([scheduler.next_interval(False, busy=True) for _ in range(4)], [60.0, 120.0, 240.0, 300.0])
+
+    def test_success_resets_the_backoff_but_not_the_total(self):
+        scheduler = self.scheduler()
+        for _ in range(3):
+            scheduler.next_interval(False)
+        self.assertEqual(scheduler.next_interval(True), 5.0)
+        self.assertEqual(scheduler.errors, 0)
+        self.assertEqual(scheduler.total_errors, 3)
+        self.assertEqual(scheduler.next_interval(False), 10.0)
+
+    def test_long_outage_does_not_overflow(self):
+        scheduler = self.scheduler()
+        for _ in range(2000):
+            interval = scheduler.next_interval(False)
+        self.assertEqual(interval, 300.0)
+
+    def test_jitter_stays_within_its_fraction(self):
+        scheduler = self.scheduler(jitter=0.2)
+        for ok, base in [(False, 10.0), (False, 20.0), (False, 40.0), (True, 5.0)] * 25:
+            interval = scheduler.next_interval(ok)
+            self.assertGreaterEqual(interval, 0.8 * base)
+            self.assertLessEqual(interval, 1.2 * base)
+
+    def test_jitter_spreads_the_waits(self):
+        scheduler = self.scheduler(jitter=0.2)
+        self.assertGreater(len({scheduler.next_interval(True) for _ in range(20)}), 1)
+        delays = [scheduler.first_delay() for _ in range(100)]
+        self.assertTrue(all(0.0 <= delay <= 5.0 for delay in delays))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from progress_reporter import ProgressReporter
+
+
+class StubResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+class StubClient:
+    """Stands in for HttpClient: records posts, each taking delay seconds."""
+
+    def __init__(self, delay=0.0, status_code=200):
+        self.delay = delay
+        self.status_code = status_code
+        self.posts = []
+        self.posted = threading.Condition()
+
+    def post(self, path, json=None):
+        time.sleep(self.delay)
+        with self.posted:
+            self.posts.append((path, json))
+            self.posted.notify_all()
+        return StubResponse(self.status_code)
+
+    def wait_for_posts(self, count, timeout=5.0):
+        with self.posted:
+            return self.posted.wait_for(lambda: len(self.posts) >= count, timeout)
+
+
+class ProgressReporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.outbox_path = os.path.join(self.directory.name, "outbox.jsonl")
+        self.reporters = []
+
+    def tearDown(self):
+        for reporter in self.reporters:
+            reporter.stop()
+            reporter.join(5)
+        self.directory.cleanup()
+
+    def start_reporter(self, client):
+        reporter = ProgressReporter("http://127.0.0.1:9/api", self.outbox_path)
+        reporter.http = client
+        reporter.start()
+        self.reporters.append(reporter)
+        return reporter
+
+    def test_report_queued_during_a_post_is_delivered(self):
+        client = StubClient(delay=0.5)
+        reporter = self.start_reporter(client)
+        reporter.send("progress", "/users/updateProgress", {"progress": "97"})
+        time.sleep(0.1)  # The progress report is being posted
+        reporter.send("ready", "/users/updateReady", {})
+        self.assertTrue(client.wait_for_posts(2))
+        self.assertEqual([path for path, _ in client.posts], ["/users/updateProgress", "/users/updateReady"])
+
+    def test_newer_report_replaces_an_undelivered_one(self):
+        client = StubClient(delay=0.3)
+        reporter = self.start_reporter(client)
+        reporter.send("ready", "/users/updateReady", {})
+        time.sleep(0.1)
+        for progress in ("05", "10", "15"):
+            reporter.send("progress", "/users/updateProgress", {"progress": progress})
+        self.assertTrue(client.wait_for_posts(2))
+        time.sleep(0.5)
+        self.assertEqual(client.posts[1:], [("/users/updateProgress", {"progress": "15"})])
+
+    def test_undelivered_reports_are_replayed_after_restart(self):
+        offline = StubClient(status_code=503)
+        reporter = self.start_reporter(offline)
+        reporter.send("ready", "/users/updateReady", {"deviceid": 1})
+        self.assertTrue(offline.wait_for_posts(1))
+        reporter.stop()
+        reporter.join(5)
+
+        online = StubClient()
+        self.start_reporter(online)
+        self.assertTrue(online.wait_for_posts(1))
+        self.assertEqual(online.posts, [("/users/updateReady", {"deviceid": 1})])
+
+
+if __name__ == "__main__":
+    unittest.main()
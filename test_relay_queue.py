@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import time
+import unittest
+
+# Run on segments of our own, never on the live machine's
+os.environ.setdefault("SHM_PREFIX", "test_shared_memory_")
+
+from shared_memory_util import (
+    RELAY_QUEUE_CAPACITY, SHM_PREFIX, ack_relay_command, cleanup_shared_memory, clear_relay_queue,
+    pop_relay_command, push_relay_command, wait_for_relay_ack,
+)
+
+if not SHM_PREFIX:
+    raise unittest.SkipTest("SHM_PREFIX is empty; the tests would overwrite the live shared memory")
+
+
+def run_producer(commands, results):
+    """Push commands in order and report their sequence numbers."""
+    results.put([(push_relay_command(command, timeout=10), command) for command in commands])
+
+def drain(count, timeout=10):
+    """Pop and acknowledge count commands, returning (sequence, command) pairs."""
+    entries = []
+    for _ in range(count):
+        entry = pop_relay_command(timeout)
+        if entry is None:
+            break
+        entries.append(entry)
+        ack_relay_command(entry[0])
+    return entries
+
+
+class RelayQueueTest(unittest.TestCase):
+    """Commands from several producers reach the consumer exactly once."""
+
+    def setUp(self):
+        clear_relay_queue()
+
+    def tearDown(self):
+        cleanup_shared_memory()
+
+    def test_producers_blocked_on_a_full_queue_lose_nothing(self):
+        for _ in range(RELAY_QUEUE_CAPACITY):
+            push_relay_command(1.0)
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        producers = [
+            context.Process(target=run_producer, args=([command], results))
+            for command in (100.0, 200.0)
+        ]
+        for process in producers:
+            process.start()
+        # Longer than the lock timeout, after which a producer holding the
+        # lock while waiting would be taken for dead
+        time.sleep(1.5)
+        entries = drain(RELAY_QUEUE_CAPACITY + 2)
+        pushed = results.get(timeout=10) + results.get(timeout=10)
+        for process in producers:
+            process.join()
+
+        self.assertEqual(len({sequence for sequence, _ in pushed}), 2)
+        self.assertEqual(sorted(command for _, command in entries[RELAY_QUEUE_CAPACITY:]), [100.0, 200.0])
+        self.assertEqual(sorted(pushed), sorted(entries[RELAY_QUEUE_CAPACITY:]))
+
+    def test_concurrent_producers_keep_their_order(self):
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        commands = {
+            producer: [producer * 1000.0 + index for index in range(200)]
+            for producer in (1, 2, 3)
+        }
+        producers = [
+            context.Process(target=run_producer, args=(values, results))
+            for values in commands.values()
+        ]
+        for process in producers:
+            process.start()
+        entries = drain(sum(len(values) for values in commands.values()))
+        for process in producers:
+            process.join()
+
+        sequences = [sequence for sequence, _ in entries]
+        self.assertEqual(len(set(sequences)), len(sequences))
+        for producer, values in commands.items():
+            received = [command for _, command in entries if int(command // 1000) == producer]
+            self.assertEqual(received, values)
+
+    def test_full_queue_times_out(self):
+        for _ in range(RELAY_QUEUE_CAPACITY):
+            push_relay_command(1.0)
+        start = time.monotonic()
+        with self.assertRaises(RuntimeError):
+            push_relay_command(2.0, timeout=0.2)
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_clear_drops_unexecuted_commands(self):
+        push_relay_command(6.0)
+        sequence = push_relay_command(8.0)
+        clear_relay_queue()
+        self.assertIsNone(pop_relay_command(0.05))
+        self.assertFalse(wait_for_relay_ack(sequence, 0.05))
+        sequence = push_relay_command(14.0)
+        self.assertEqual(pop_relay_command(0.05), (sequence, 14.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
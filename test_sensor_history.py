@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+import unittest
+
+# Run on segments of our own, never on the live machine's
+os.environ.setdefault("SHM_PREFIX", "test_shared_memory_")
+
+import posix_ipc
+import shared_memory_util
+from shared_memory_util import SHM_PREFIX, SensorHistory
+
+CAPACITY = 8
+
+if not SHM_PREFIX:
+    raise unittest.SkipTest("SHM_PREFIX is empty; the tests would overwrite the live shared memory")
+
+
+def rows(view):
+    """Copy a history window into a list of (timestamp, value) tuples."""
+    return [(view[i, 0], view[i, 1]) for i in range(len(view))]
+
+def run_appender(count):
+    """Append count samples from another process, as SensorReader does."""
+    history = SensorHistory("test", CAPACITY)
+    for index in range(count):
+        history.append(index * 10.0, float(index))
+    history.close()
+
+
+class SensorHistoryTest(unittest.TestCase):
+    """Windows hold the newest samples in time order, also after the ring wraps."""
+
+    def setUp(self):
+        self.history = SensorHistory("test", CAPACITY)
+
+    def tearDown(self):
+        self.history.close()
+        posix_ipc.unlink_shared_memory(self.history.segment_name)
+        shared_memory_util.shared_memory_objects.pop(self.history.segment_name, None)
+
+    def append_range(self, start, stop):
+        """Append the value index * 10 at timestamp index for each index in the range."""
+        for index in range(start, stop):
+            self.history.append(index * 10.0, float(index))
+
+    def test_capacity_must_be_a_power_of_two(self):
+        with self.assertRaises(ValueError):
+            SensorHistory("test", 12)
+
+    def test_reopening_with_another_capacity_fails(self):
+        with self.assertRaises(RuntimeError):
+            SensorHistory("test", 2 * CAPACITY)
+
+    def test_empty_history(self):
+        self.assertEqual(self.history.count(), 0)
+        self.assertEqual(len(self.history.last(5)), 0)
+        self.assertEqual(len(self.history.since(0.0)), 0)
+
+    def test_last_returns_the_newest_samples_oldest_first(self):
+        self.append_range(0, 3)
+        self.assertEqual(self.history.count(), 3)
+        self.assertEqual(rows(self.history.last(2)), [(1.0, 10.0), (2.0, 20.0)])
+        self.assertEqual(rows(self.history.last(10)), [(0.0, 0.0), (1.0, 10.0), (2.0, 20.0)])
+
+    def test_windows_stay_contiguous_after_the_ring_wraps(self):
+        self.append_range(0, 3 * CAPACITY + 3)
+        # One slot is kept back for the sample being overwritten
+        self.assertEqual(self.history.count(), CAPACITY - 1)
+        expected = [(float(index), index * 10.0) for index in range(2 * CAPACITY + 4, 3 * CAPACITY + 3)]
+        self.assertEqual(rows(self.history.last(CAPACITY)), expected)
+
+    def test_since_returns_samples_at_or_after_the_timestamp(self):
+        self.append_range(0, CAPACITY + 2)
+        self.assertEqual(rows(self.history.since(7.0)), [(7.0, 70.0), (8.0, 80.0), (9.0, 90.0)])
+        self.assertEqual(rows(self.history.since(7.5)), [(8.0, 80.0), (9.0, 90.0)])
+        self.assertEqual(len(self.history.since(0.0)), CAPACITY - 1)
+        self.assertEqual(len(self.history.since(10.0)), 0)
+
+    def test_samples_appended_in_another_process_are_visible(self):
+        context = multiprocessing.get_context("fork")
+        appender = context.Process(target=run_appender, args=(5,))
+        appender.start()
+        appender.join(10)
+        self.assertEqual(rows(self.history.last(2)), [(3.0, 30.0), (4.0, 40.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
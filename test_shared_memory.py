@@ -0,0 +1,198 @@
+import multiprocessing
+import os
+import time
+import unittest
+
+# Run on segments of our own, never on the live machine's
+os.environ.setdefault("SHM_PREFIX", "test_shared_memory_")
+
+import posix_ipc
+import shared_memory_util
+from shared_memory_schema import SCHEMA_MAGIC, SCHEMA_VERSION
+from shared_memory_util import (
+    REGISTER_SEQUENCE_OFFSET, REGISTER_WRITE_LOCK_NAME, SHM_PREFIX,
+    cleanup_shared_memory, initialize_registers, open_register_file, read_data_from_shared_memory,
+    read_generation, read_many, read_snapshot, register_schema, register_sequence,
+    write_data_to_shared_memory, write_many,
+)
+
+# Pairs of registers that writers always set to the same value in one write,
+# so a reader that sees them differ has read a torn snapshot
+COMMAND_PAIR = ("command_from_server", "command_mode_from_server")
+TACHO_PAIR = ("taccosensor", "taccosensor_filtered")
+
+RUN_SECONDS = 2.0
+
+# Value a restarted owner publishes once it has initialised the register file
+RESTART_MARKER = -1.0
+
+if not SHM_PREFIX:
+    raise unittest.SkipTest("SHM_PREFIX is empty; the tests would overwrite the live shared memory")
+
+
+def run_pair_writer(pair, start_event, stop_event):
+    """Write the same counting value to both registers of pair until stopped."""
+    start_event.wait()
+    value = 0
+    while not stop_event.is_set():
+        value += 1
+        write_many({pair[0]: value, pair[1]: value})
+
+def run_single_writer(name, start_event, stop_event):
+    """Write one register as fast as possible until stopped, to contend for the lock."""
+    start_event.wait()
+    value = 0.0
+    while not stop_event.is_set():
+        value += 1.0
+        write_data_to_shared_memory(name, value)
+
+def run_snapshot_reader(start_event, stop_event, results):
+    """Read both pairs until stopped and report (reads, torn reads, an example)."""
+    start_event.wait()
+    reads = 0
+    torn = 0
+    example = None
+    while not stop_event.is_set():
+        command, mode, speed, filtered = read_snapshot(COMMAND_PAIR + TACHO_PAIR)
+        pair = read_many(COMMAND_PAIR)
+        reads += 2
+        if command != mode or speed != filtered or pair[0] != pair[1]:
+            torn += 1
+            example = (command, mode, speed, filtered, pair)
+    results.put((reads, torn, example))
+
+def start_owner():
+    """Open and initialise the register file the way SharedMemoryManager does."""
+    open_register_file(replace_incompatible=True)
+    initialize_registers()
+
+def run_crashing_owner(started):
+    """Start as the owner, then write at full rate until killed."""
+    start_owner()
+    started.set()
+    value = 0.0
+    while True:
+        value += 1.0
+        write_many({"taccosensor": value, "taccosensor_filtered": value})
+
+def run_restarted_owner(done):
+    """Start as the owner after a crash and publish RESTART_MARKER."""
+    start_owner()
+    write_data_to_shared_memory("taccosensor", RESTART_MARKER)
+    done.set()
+
+
+class SnapshotConsistencyTest(unittest.TestCase):
+    """Readers in several processes never see a mix of two writes."""
+
+    def setUp(self):
+        initialize_registers()
+
+    def tearDown(self):
+        cleanup_shared_memory()
+
+    def test_no_torn_snapshot_with_writers_in_several_processes(self):
+        context = multiprocessing.get_context("fork")
+        start_event = context.Event()
+        stop_event = context.Event()
+        results = context.Queue()
+        writers = [
+            context.Process(target=run_pair_writer, args=(COMMAND_PAIR, start_event, stop_event)),
+            context.Process(target=run_pair_writer, args=(COMMAND_PAIR, start_event, stop_event)),
+            context.Process(target=run_pair_writer, args=(TACHO_PAIR, start_event, stop_event)),
+            context.Process(target=run_single_writer, args=("Pressure", start_event, stop_event)),
+        ]
+        readers = [
+            context.Process(target=run_snapshot_reader, args=(start_event, stop_event, results))
+            for _ in range(3)
+        ]
+        for process in writers + readers:
+            process.start()
+        start_event.set()
+        time.sleep(RUN_SECONDS)
+        stop_event.set()
+        outcomes = [results.get(timeout=10) for _ in readers]
+        for process in writers + readers:
+            process.join(timeout=10)
+
+        self.assertTrue(all(reads > 0 for reads, _, _ in outcomes))
+        for reads, torn, example in outcomes:
+            self.assertEqual(torn, 0, f"{torn} of {reads} reads were torn, e.g. {example}")
+        # The two command writers must not have lost each other's sequence bumps
+        self.assertEqual(register_sequence.unpack_from(open_register_file(), REGISTER_SEQUENCE_OFFSET)[0] % 2, 0)
+
+    def test_read_after_writer_died_mid_write(self):
+        write_many({COMMAND_PAIR[0]: 7, COMMAND_PAIR[1]: 7})
+        mem = open_register_file()
+        # A writer killed between its two sequence bumps leaves the counter odd
+        sequence = register_sequence.unpack_from(mem, REGISTER_SEQUENCE_OFFSET)[0]
+        register_sequence.pack_into(mem, REGISTER_SEQUENCE_OFFSET, sequence + 1)
+        self.assertEqual(read_many(COMMAND_PAIR), (7.0, 7))
+        # The next writer recovers the counter
+        write_data_to_shared_memory("Pressure", 1.0)
+        self.assertEqual(register_sequence.unpack_from(mem, REGISTER_SEQUENCE_OFFSET)[0] % 2, 0)
+        self.assertEqual(read_data_from_shared_memory("Pressure"), 1.0)
+
+
+class ReattachTest(unittest.TestCase):
+    """Readers follow a restarted owner on their next access."""
+
+    def setUp(self):
+        initialize_registers()
+        # Only the register file itself may tell readers about the restart,
+        # not the periodic inode check
+        self.check_interval = shared_memory_util.REATTACH_CHECK_INTERVAL
+        shared_memory_util.REATTACH_CHECK_INTERVAL = float("inf")
+        # Owners start in fresh processes, like services restarted by systemd
+        self.context = multiprocessing.get_context("spawn")
+
+    def tearDown(self):
+        shared_memory_util.REATTACH_CHECK_INTERVAL = self.check_interval
+        cleanup_shared_memory()
+
+    def kill_owner_under_load(self):
+        """Start an owner that writes at full rate and kill it mid-stream."""
+        started = self.context.Event()
+        owner = self.context.Process(target=run_crashing_owner, args=(started,))
+        owner.start()
+        self.assertTrue(started.wait(10))
+        time.sleep(0.2)
+        owner.kill()
+        owner.join()
+
+    def restart_owner(self):
+        """Run a restarted owner to completion."""
+        done = self.context.Event()
+        owner = self.context.Process(target=run_restarted_owner, args=(done,))
+        owner.start()
+        self.assertTrue(done.wait(10))
+        owner.join()
+
+    def test_reader_sees_restarted_owner_after_kill(self):
+        self.kill_owner_under_load()
+        generation = read_generation()
+        self.restart_owner()
+        self.assertEqual(read_data_from_shared_memory("taccosensor"), RESTART_MARKER)
+        self.assertNotEqual(read_generation(), generation)
+
+    def test_reader_reattaches_when_owner_replaces_the_file(self):
+        self.kill_owner_under_load()
+        # Make the file look like one from another schema version, which the
+        # restarted owner unlinks and creates anew
+        register_schema.pack_into(open_register_file(), 0, SCHEMA_MAGIC, SCHEMA_VERSION + 1)
+        mem = open_register_file()
+        self.restart_owner()
+        self.assertEqual(read_data_from_shared_memory("taccosensor"), RESTART_MARKER)
+        self.assertIsNot(open_register_file(), mem)
+
+
+def tearDownModule():
+    # The write lock outlives cleanup_shared_memory() by design
+    if shared_memory_util._register_write_lock is not None:
+        try:
+            posix_ipc.unlink_semaphore(REGISTER_WRITE_LOCK_NAME)
+        except posix_ipc.ExistentialError:
+            pass
+
+if __name__ == "__main__":
+    unittest.main()
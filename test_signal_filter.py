@@ -0,0 +1,65 @@
+import unittest
+from signal_filter import EMAFilter, FilterPipeline, MedianFilter, OutlierRejector, pressure_filter
+
+
+def run(stage, values, interval=0.05):
+    """Feed values to a filter at a fixed interval and return its outputs."""
+    return [stage.update(value, index * interval) for index, value in enumerate(values)]
+
+
+class MedianFilterTest(unittest.TestCase):
+
+    def test_size_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            MedianFilter(0)
+
+    def test_median_of_a_filling_window(self):
+        # Averages the middle pair while the window holds an even count
+        self.assertEqual(run(MedianFilter(3), [5.0, 1.0, 3.0]), [5.0, 3.0, 3.0])
+
+    def test_window_slides_over_the_oldest_sample(self):
+        self.assertEqual(run(MedianFilter(3), [1.0, 2.0, 3.0, 10.0, 10.0, 0.0]), [1.0, 1.5, 2.0, 3.0, 10.0, 10.0])
+
+    def test_single_spike_and_dropout_are_removed(self):
+        outputs = run(MedianFilter(5), [30.0, 30.0, 30.0, 500.0, 30.0, 0.0, 30.0, 30.0])
+        self.assertEqual(outputs[3:], [30.0] * 5)
+
+    def test_reset_forgets_the_window(self):
+        median = MedianFilter(3)
+        run(median, [100.0, 100.0, 100.0])
+        median.reset()
+        self.assertEqual(run(median, [1.0, 2.0]), [1.0, 1.5])
+
+
+class OutlierRejectorTest(unittest.TestCase):
+
+    def test_fast_change_is_held_until_it_persists(self):
+        rejector = OutlierRejector(max_rate=100.0, max_rejects=2)
+        # 100 per second allows 5 per 0.05 s sample
+        self.assertEqual(run(rejector, [10.0, 12.0, 90.0, 90.0, 90.0, 91.0]), [10.0, 12.0, 12.0, 12.0, 90.0, 91.0])
+
+
+class FilterPipelineTest(unittest.TestCase):
+
+    def test_stages_run_in_order(self):
+        pipeline = FilterPipeline(MedianFilter(3), EMAFilter(0.5))
+        # The median drops the spike before the average sees it
+        self.assertEqual(run(pipeline, [10.0, 10.0, 1000.0, 10.0]), [10.0, 10.0, 10.0, 10.0])
+
+    def test_reset_reaches_every_stage(self):
+        pipeline = FilterPipeline(MedianFilter(3), EMAFilter(0.5))
+        run(pipeline, [10.0, 10.0, 10.0])
+        pipeline.reset()
+        self.assertEqual(pipeline.update(50.0, 0.0), 50.0)
+
+    def test_timestamp_defaults_to_now(self):
+        self.assertEqual(FilterPipeline(OutlierRejector(max_rate=1.0)).update(3.0), 3.0)
+
+    def test_pressure_filter_ignores_a_failed_reading(self):
+        pipeline = pressure_filter()
+        outputs = run(pipeline, [25.0, 25.0, 25.0, 0.0, 25.0])
+        self.assertEqual(outputs, [25.0] * 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from speed_control import PIDController, SpeedController, linear_feed_forward
+
+
+class PIDAntiWindupTest(unittest.TestCase):
+    """The integral does not grow while the output is held at a clamp."""
+
+    def test_integral_holds_while_clamped_high(self):
+        pid = PIDController(kp=0.0, ki=1.0, kd=0.0, output_min=0.0, output_max=10.0)
+        for _ in range(50):
+            self.assertEqual(pid.update(100.0, 0.0, 1.0), 10.0)
+        self.assertEqual(pid.integral, 0.0)
+        # Nothing wound up, so the output leaves the clamp as soon as the target is reached
+        self.assertEqual(pid.update(100.0, 100.0, 1.0), 0.0)
+
+    def test_integral_unwinds_while_clamped(self):
+        pid = PIDController(kp=0.0, ki=1.0, kd=0.0, output_min=0.0, output_max=10.0)
+        pid.integral = 50.0
+        # Still clamped, but the error pulls the output back out of the clamp
+        self.assertEqual(pid.update(0.0, 20.0, 1.0), 10.0)
+        self.assertEqual(pid.integral, 30.0)
+        self.assertEqual(pid.update(0.0, 20.0, 1.0), 10.0)
+        self.assertEqual(pid.update(0.0, 20.0, 1.0), 0.0)  # 50 - 3 * 20 < 0, so the low clamp
+
+    def test_integral_holds_while_clamped_low_with_reversed_direction(self):
+        # A longer TRIAC delay slows the drum, so too slow a drum drives the output down
+        pid = PIDController(kp=0.0, ki=10.0, kd=0.0, output_min=4000.0, output_max=8000.0,
+                            feed_forward=lambda target: 5000.0, direction=-1.0)
+        for _ in range(20):
+            self.assertEqual(pid.update(1000.0, 0.0, 1.0), 4000.0)
+        self.assertEqual(pid.integral, 0.0)
+        self.assertEqual(pid.update(1000.0, 1000.0, 1.0), 5000.0)
+
+    def test_integral_only_changes_within_the_band(self):
+        pid = PIDController(kp=0.0, ki=1.0, kd=0.0, output_min=-100.0, output_max=100.0)
+        pid.update(100.0, 0.0, 1.0, integral_band=10.0)
+        self.assertEqual(pid.integral, 0.0)
+        pid.update(100.0, 95.0, 1.0, integral_band=10.0)
+        self.assertEqual(pid.integral, 5.0)
+
+    def test_new_target_does_not_kick_the_derivative(self):
+        pid = PIDController(kp=0.0, ki=0.0, kd=1.0, output_min=-100.0, output_max=100.0)
+        pid.update(10.0, 10.0, 1.0)
+        self.assertEqual(pid.update(50.0, 10.0, 1.0), 0.0)
+        self.assertEqual(pid.update(50.0, 15.0, 1.0), -5.0)
+
+    def test_reset_forgets_the_integral(self):
+        pid = PIDController(kp=0.0, ki=1.0, kd=0.0, output_min=-100.0, output_max=100.0)
+        pid.update(10.0, 0.0, 1.0)
+        pid.reset()
+        self.assertEqual(pid.integral, 0.0)
+        self.assertIsNone(pid.last_measurement)
+
+
+class SpeedControllerComputeTest(unittest.TestCase):
+
+    def test_zero_target_turns_control_off_and_resets_the_pid(self):
+        controller = SpeedController(feed_forward=linear_feed_forward(), acceleration=100.0)
+        self.assertIsNotNone(controller.compute(300.0, 0.0, 0.05))
+        self.assertIsNone(controller.compute(0.0, 0.0, 0.05))
+        self.assertIsNone(controller.setpoint)
+        self.assertEqual(controller.pid.integral, 0.0)
+
+    def test_delay_stays_within_its_limits_during_a_long_ramp(self):
+        controller = SpeedController(feed_forward=linear_feed_forward(), acceleration=100.0)
+        for _ in range(200):
+            delay = controller.compute(1500.0, 0.0, 0.05)  # The drum never turns
+            self.assertGreaterEqual(delay, 4000)
+            self.assertLessEqual(delay, 8000)
+        # Once the drum catches up the delay recovers from the clamp at once
+        self.assertGreater(controller.compute(1500.0, 1500.0, 0.05), 4000)
+
+
+if __name__ == "__main__":
+    unittest.main()
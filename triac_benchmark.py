@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import time
+import pigpio
+from shared_memory_util import write_data_to_shared_memory
+from triac_control import TriacController
+
+
+def percentile(sorted_values, fraction):
+    """Return the value at the given fraction (0.0 - 1.0) of a sorted list."""
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+def pigpiod_cpu_time():
+    """Return the CPU seconds used by pigpiod so far, or 0.0 if it is not found."""
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/stat") as file:
+                fields = file.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        with open(f"/proc/{pid}/comm") as file:
+            if file.read().strip() == "pigpiod":
+                # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+                return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return 0.0
+
+def benchmark_engine(engine, delay=5000, duration=10.0):
+    """
+    Run the TRIAC controller on the real zero-cross input and measure how far
+    each gate edge lands from zero cross + delay, using pigpio ticks.
+
+    Args:
+        engine: "wave", "edge" or "loop"
+        delay: Firing delay in microseconds
+        duration: Seconds to measure
+
+    Returns:
+        Dictionary with the firing error percentiles in microseconds and the CPU used
+    """
+    # The controller follows triac_delay in shared memory, so set it there too
+    write_data_to_shared_memory("triac_delay", float(delay))
+    controller = TriacController(engine=engine)
+    controller.triac_delay = delay
+    pi = pigpio.pi()
+    if not pi.connected:
+        raise RuntimeError("Failed to connect to pigpio daemon")
+
+    zero_crosses = []
+    firings = []
+    zero_cross_callback = pi.callback(controller.input_pin, pigpio.RISING_EDGE, lambda g, l, tick: zero_crosses.append(tick))
+    firing_callback = pi.callback(controller.triac_pin, pigpio.RISING_EDGE, lambda g, l, tick: firings.append(tick))
+    controller.start()
+    try:
+        time.sleep(1.0)  # Let the engine settle
+        zero_crosses.clear()
+        firings.clear()
+        start_cpu = time.process_time()
+        start_daemon_cpu = pigpiod_cpu_time()
+        time.sleep(duration)
+        cpu = time.process_time() - start_cpu
+        daemon_cpu = pigpiod_cpu_time() - start_daemon_cpu
+    finally:
+        controller.stop()
+        controller.join()
+        zero_crosses_seen = list(zero_crosses)
+        firings_seen = list(firings)
+        zero_cross_callback.cancel()
+        firing_callback.cancel()
+        pi.stop()
+
+    # Pair each firing with the latest zero cross before it
+    errors = []
+    index = 0
+    for fire in firings_seen:
+        while index + 1 < len(zero_crosses_seen) and pigpio.tickDiff(zero_crosses_seen[index + 1], fire) >= 0:
+            index += 1
+        if zero_crosses_seen and pigpio.tickDiff(zero_crosses_seen[index], fire) >= 0:
+            errors.append(abs(pigpio.tickDiff(zero_crosses_seen[index], fire) - delay))
+    if not errors:
+        return {"engine": engine, "firings": 0}
+    errors.sort()
+    return {
+        "engine": engine,
+        "firings": len(errors),
+        "error_p50_us": percentile(errors, 0.50),
+        "error_p99_us": percentile(errors, 0.99),
+        "error_max_us": errors[-1],
+        "process_cpu_percent": cpu / duration * 100,
+        "pigpiod_cpu_percent": daemon_cpu / duration * 100,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare TRIAC firing jitter of the firing engines and print JSON.")
+    parser.add_argument("--delay", type=int, default=5000, help="firing delay in microseconds")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per engine")
+    args = parser.parse_args()
+
+    results = {
+        engine: benchmark_engine(engine, args.delay, args.duration)
+        for engine in ("loop", "edge", "wave")
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,59 @@
 import RPi.GPIO as GPIO
+import pigpio
 import time
 import threading
-from shared_memory_util import read_data_from_shared_memory
+from shared_memory_util import read_change_count, read_data_from_shared_memory, wait_for_change, write_data_to_shared_memory
 
 class TriacController(threading.Thread):
-    def __init__(self, triac_pin=24, input_pin=25):
+    # pigpio script run by the daemon for the wave engine. On each rising edge
+    # of the zero-cross input (p1: input pin bit, p2: input pin) it transmits
+    # wave p0, which holds the gate low for the delay and then raises it, so
+    # the firing angle is timed by DMA instead of by Python. WAIT takes its
+    # timeout in ms from the accumulator, which must be loaded every time:
+    # with A at 0 it returns at once and the script spins. A timeout (A = 0,
+    # no edge) starts the wait over without firing.
+    FIRING_SCRIPT = (
+        "tag 100 "
+        "lda 100 "
+        "wait p1 "
+        "jz 100 "
+        "r p2 "
+        "jz 100 "
+        "wvtx p0 "
+        "jmp 100"
+    )
+    MAINS_CYCLE = 0.02  # seconds, longer than any firing wave
+
+    def __init__(self, triac_pin=24, input_pin=25, engine="loop", sync_timeout=0.05):
+        """
+        Args:
+            triac_pin: GPIO driving the TRIAC gate
+            input_pin: GPIO of the zero-cross detector
+            engine: "wave" fires from a pigpio script and DMA-timed wave,
+                    "edge" fires from Python on each zero-cross interrupt,
+                    "loop" polls the input and times the delay in Python.
+                    "loop" stays the default until triac_benchmark.py has
+                    compared the engines on a Pi.
+            sync_timeout: Seconds without a zero cross before mains sync
+                          counts as lost ("wave" and "edge" engines)
+        """
         super().__init__()
         self.triac_pin = triac_pin
         self.input_pin = input_pin
+        self.engine = engine
         self.running = False
+
+        # pigpio connection, firing script and current wave of the wave engine
+        self.pi = None
+        self.script_id = None
+        self.wave_id = None
+        self.sync_callback = None
+        self.firing = False  # The firing script is running
+
+        # Zero-cross edges of the edge engine and the last published mains sync state
+        self.sync_timeout = sync_timeout
+        self.zero_cross = threading.Event()
+        self.mains_sync = None
         
         # Thread synchronization
         self.triac_delay = 8000  # Default delay in microseconds
@@ -20,12 +65,100 @@ class TriacController(threading.Thread):
         
     def setup_gpio(self):
         """Initialize GPIO pins"""
+        if self.engine == "wave":
+            self.setup_firing_script()
+            return
         GPIO.setmode(GPIO.BCM)
         GPIO.setup(self.triac_pin, GPIO.OUT)
         GPIO.setup(self.input_pin, GPIO.IN)
+        if self.engine == "edge":
+            GPIO.add_event_detect(self.input_pin, GPIO.RISING, callback=self.on_zero_cross)
+
+    def on_zero_cross(self, channel):
+        """RPi.GPIO callback on the zero-cross rising edge"""
+        self.zero_cross.set()
+
+    def on_zero_cross_level(self, gpio, level, tick):
+        """pigpio callback; a watchdog timeout means the zero-cross edges stopped"""
+        in_sync = level != pigpio.TIMEOUT
+        if not in_sync and self.firing:
+            self.stop_firing()
+        elif in_sync and not self.firing:
+            # Mains is back: fire again from the next zero cross
+            self.pi.run_script(self.script_id, self.script_params())
+            self.firing = True
+        self.set_mains_sync(in_sync)
+
+    def stop_firing(self):
+        """Halt the firing script and the wave in flight and hold the gate off"""
+        self.pi.stop_script(self.script_id)
+        self.pi.wave_tx_stop()
+        self.pi.write(self.triac_pin, 0)
+        self.firing = False
+
+    def set_mains_sync(self, in_sync):
+        """Publish whether zero-cross edges are arriving, only when it changes"""
+        if in_sync != self.mains_sync:
+            self.mains_sync = in_sync
+            write_data_to_shared_memory("mains_sync", in_sync)
+            if not in_sync:
+                print(f"Lost mains sync: no zero cross for {self.sync_timeout * 1000:.0f} ms")
+
+    def setup_firing_script(self):
+        """Load the firing script into pigpiod and start it with the current delay"""
+        self.pi = pigpio.pi()
+        if not self.pi.connected:
+            raise RuntimeError("Failed to connect to pigpio daemon")
+        self.pi.set_mode(self.triac_pin, pigpio.OUTPUT)
+        self.pi.set_mode(self.input_pin, pigpio.INPUT)
+
+        self.script_id = self.pi.store_script(self.FIRING_SCRIPT.encode())
+        while self.pi.script_status(self.script_id)[0] == pigpio.PI_SCRIPT_INITING:
+            time.sleep(0.01)
+        self.arm_wave(self.triac_delay)
+        self.pi.run_script(self.script_id, self.script_params())
+        self.firing = True
+
+        # pigpiod reports a timeout level when the input stops changing
+        self.pi.set_watchdog(self.input_pin, int(self.sync_timeout * 1000))
+        self.sync_callback = self.pi.callback(self.input_pin, pigpio.EITHER_EDGE, self.on_zero_cross_level)
+
+    def script_params(self):
+        """Parameters p0-p2 of the firing script"""
+        return [self.wave_id, 1 << self.input_pin, self.input_pin]
+
+    def arm_wave(self, delay):
+        """
+        Build the firing wave for delay and hand it to the firing script.
+
+        Args:
+            delay: Microseconds from the zero cross to raising the gate
+        """
+        bit = 1 << self.triac_pin
+        self.pi.wave_add_generic([pigpio.pulse(0, bit, int(delay)), pigpio.pulse(bit, 0, 0)])
+        old_wave_id = self.wave_id
+        self.wave_id = self.pi.wave_create()
+        if old_wave_id is not None:
+            self.pi.update_script(self.script_id, self.script_params())
+            time.sleep(self.MAINS_CYCLE)  # Let a transmission of the old wave finish
+            self.pi.wave_delete(old_wave_id)
         
     def cleanup(self):
         """Clean up GPIO resources"""
+        if self.engine == "wave":
+            if self.pi:
+                if self.sync_callback:
+                    self.sync_callback.cancel()
+                    self.pi.set_watchdog(self.input_pin, 0)
+                if self.script_id is not None:
+                    self.pi.stop_script(self.script_id)
+                    self.pi.delete_script(self.script_id)
+                self.pi.wave_tx_stop()
+                if self.wave_id is not None:
+                    self.pi.wave_delete(self.wave_id)
+                self.pi.write(self.triac_pin, 0)
+                self.pi.stop()
+            return
         GPIO.cleanup()
         
     def get_delay(self):
@@ -37,10 +170,13 @@ class TriacController(threading.Thread):
         """Set TRIAC delay with thread safety"""
         with self.delay_lock:
             self.triac_delay = new_delay
+            if self.engine == "wave":
+                self.arm_wave(new_delay)
             self.delay_updated.set()
             
     def monitor_delay(self):
         """Monitor thread to watch for delay changes in shared memory"""
+        since = read_change_count("triac_delay")
         while self.running:
             new_delay = read_data_from_shared_memory("triac_delay")
             current_delay = self.get_delay()
@@ -48,21 +184,46 @@ class TriacController(threading.Thread):
             if current_delay != new_delay:
                 self.set_delay(new_delay)
                 
-            time.sleep(0.1)
+            # Sleep until triac_delay is written; the timeout keeps stop() responsive
+            since = wait_for_change("triac_delay", timeout=0.5, since=since)
             
     def stop(self):
         """Stop all threads"""
         self.running = False
+
+    def run_edge_engine(self):
+        """Fire after each zero-cross interrupt and sleep in between"""
+        while self.running:
+            if not self.zero_cross.wait(self.sync_timeout):
+                # No mains: keep the gate off until the edges come back
+                GPIO.output(self.triac_pin, GPIO.LOW)
+                self.set_mains_sync(False)
+                continue
+            self.zero_cross.clear()
+            self.set_mains_sync(True)
+
+            GPIO.output(self.triac_pin, GPIO.LOW)
+            time.sleep(self.get_delay() / 1_000_000)  # Convert microseconds to seconds
+            GPIO.output(self.triac_pin, GPIO.HIGH)
         
     def run(self):
         """Main thread loop for TRIAC control"""
         try:
             self.setup_gpio()
             self.running = True
+
+            if self.engine == "wave":
+                # pigpiod fires the TRIAC; only delay updates are left to Python
+                self.monitor_delay()
+                return
             
             # Start the monitor thread
             self.monitor_thread = threading.Thread(target=self.monitor_delay)
             self.monitor_thread.start()
+
+            if self.engine == "edge":
+                self.run_edge_engine()
+                return
             
             # Main TRIAC control loop
             while self.running: